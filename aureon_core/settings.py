@@ -182,4 +182,78 @@ SHAREPOINT_SITE_URL = "rcostaadvcombr.sharepoint.com"
 SHAREPOINT_DRIVE_ID = os.environ.get('SHAREPOINT_DRIVE_ID')
 SHAREPOINT_DOC_LIBRARY = "Documentos" # Ou o nome que você usa, ex: "Documentos Compartilhados"
 
-CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
\ No newline at end of file
+CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+# Cache compartilhado entre os workers do gunicorn e o Celery (ex: token do Microsoft Graph).
+# Em produção usa o mesmo Redis do broker; em desenvolvimento cai para o cache em memória.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+GRAPH_TOKEN_MARGEM_RENOVACAO = 300  # segundos antes do vencimento para renovar o token do Graph
+
+# Pool de conexões HTTP para o Microsoft Graph (uma sessão keep-alive por processo)
+GRAPH_POOL_SIZE = int(os.environ.get('GRAPH_POOL_SIZE', 10))
+GRAPH_TIMEOUT = int(os.environ.get('GRAPH_TIMEOUT', 15))  # segundos
+GRAPH_MAX_RETRIES = int(os.environ.get('GRAPH_MAX_RETRIES', 3))
+
+# Uploads grandes para o SharePoint vão em blocos (sessão de upload do Graph).
+# O bloco precisa ser múltiplo de 320 KiB; é o máximo de cada arquivo mantido em memória.
+GRAPH_UPLOAD_BLOCO = 16 * 320 * 1024  # 5 MiB
+GRAPH_UPLOAD_SESSAO_MIN = 4 * 1024 * 1024
+
+# Anexos enviados pela tela do caso ficam no banco (casos/area_uploads.py) até o Celery enviá-los
+# ao SharePoint: a web e o worker são serviços separados, sem disco em comum.
+UPLOAD_ANEXOS_CONCORRENCIA = int(os.environ.get('UPLOAD_ANEXOS_CONCORRENCIA', 3))
+# Segundos até um envio parado em 'enviando' (worker reiniciado) poder ser retomado
+UPLOAD_ANEXOS_TEMPO_LIMITE = int(os.environ.get('UPLOAD_ANEXOS_TEMPO_LIMITE', 2 * 60 * 60))
+
+# Tempo (segundos) que a listagem de uma pasta do SharePoint fica em cache
+GRAPH_LISTAGEM_TTL = int(os.environ.get('GRAPH_LISTAGEM_TTL', 120))
+
+# Tempo (segundos) que o total de uma listagem filtrada fica em cache (casos/contagens.py)
+CONTAGEM_CACHE_TTL = int(os.environ.get('CONTAGEM_CACHE_TTL', 60))
+
+# UF do escritório: os feriados estaduais/municipais dela contam nos prazos em dias úteis (casos/calendario.py)
+CALENDARIO_UF = os.environ.get('CALENDARIO_UF', '')
+
+# Tarefas periódicas (agendadas pelo serviço celery-beat, com uma instância só)
+CELERY_BEAT_SCHEDULE = {
+    # Mantém o índice local de arquivos do SharePoint (ArquivoSharePoint) em dia
+    'sincronizar-arquivos-sharepoint': {
+        'task': 'casos.tasks.sincronizar_arquivos_sharepoint',
+        'schedule': int(os.environ.get('SHAREPOINT_SYNC_INTERVALO', 300)),  # segundos
+    },
+    # Refaz o provisionamento de pastas que falhou (casos ainda sem pasta no SharePoint)
+    'provisionar-pastas-sharepoint': {
+        'task': 'casos.tasks.provisionar_pastas_sharepoint',
+        'schedule': 10 * 60,
+    },
+    # Eventos do workflow que ficaram para trás (falha ou worker reiniciado)
+    'processar-eventos-workflow': {
+        'task': 'casos.tasks.processar_eventos_workflow',
+        'schedule': 60,
+    },
+    # Lembretes de "aguardar dias" que venceram (casos/agendador.py)
+    'ativar-acoes-agendadas': {
+        'task': 'casos.tasks.abrir_lembretes_vencidos',
+        'schedule': 60,
+    },
+    # Uploads de anexos órfãos (worker reiniciado no meio do envio) e conteúdo guardado que sobrou
+    'retomar-uploads-anexos': {
+        'task': 'casos.tasks.retomar_uploads_anexos',
+        'schedule': 5 * 60,
+    },
+}
+
+# Quantos casos vão em cada lote de criação de pastas no SharePoint
+SHAREPOINT_PROVISIONAMENTO_LOTE = int(os.environ.get('SHAREPOINT_PROVISIONAMENTO_LOTE', 50))
\ No newline at end of file
@@ -5,4 +5,6 @@ set -o errexit
 pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py reconstruir_busca_casos --faltantes
+python manage.py reconstruir_valores_json --faltantes
\ No newline at end of file
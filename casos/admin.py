@@ -8,7 +8,7 @@ from .models import (
     AndamentoCaso, ValorCampoCaso, Advogado, Status, FluxoInterno,
     Timesheet, EmailTemplate, UserSignature, EmailCaso, GraphWebhookSubscription,
     FluxoTrabalho, EtapaFluxo, AcaoEtapa, OpcaoDecisao, InstanciaAcao, HistoricoEtapa,
-    DespesaCaso, AcordoCaso, ParcelaAcordo, Cliente # Importe o Cliente também
+    DespesaCaso, AcordoCaso, ParcelaAcordo, UploadAnexo, ArquivoSharePoint, SincronizacaoDrive, Feriado, EventoWorkflow, AcaoAgendada, Cliente # Importe o Cliente também
 )
 
 # ==============================================================================
@@ -122,12 +122,51 @@ class ParcelaAcordoAdmin(admin.ModelAdmin):
     list_editable = ('situacao',)
     autocomplete_fields = ['acordo'] # Agora vai funcionar
 
+@admin.register(UploadAnexo)
+class UploadAnexoAdmin(admin.ModelAdmin):
+    list_display = ('nome_arquivo', 'caso', 'usuario', 'status', 'tamanho', 'data_criacao', 'ultima_tentativa', 'data_conclusao')
+    list_filter = ('status',)
+    search_fields = ('nome_arquivo', 'caso__titulo_caso')
+    raw_id_fields = ('caso',)
+
+@admin.register(ArquivoSharePoint)
+class ArquivoSharePointAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'pasta', 'caso', 'tamanho', 'data_modificacao', 'data_sincronizacao')
+    list_filter = ('pasta',)
+    search_fields = ('nome', 'item_id', 'caso__titulo_caso')
+    raw_id_fields = ('caso',)
+
+@admin.register(SincronizacaoDrive)
+class SincronizacaoDriveAdmin(admin.ModelAdmin):
+    list_display = ('drive_id', 'ultima_sincronizacao')
+
 @admin.register(Campo)
 class CampoAdmin(admin.ModelAdmin):
-    list_display = ('nome_label', 'nome_tecnico', 'tipo_campo')
+    list_display = ('nome_label', 'nome_tecnico', 'tipo_campo', 'pesquisavel')
+    list_filter = ('pesquisavel',)
     search_fields = ('nome_label', 'nome_tecnico') # Necessário para o autocomplete
     prepopulated_fields = {'nome_tecnico': ('nome_label',)}
 
+@admin.register(Feriado)
+class FeriadoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'tipo', 'data', 'data_fim', 'uf', 'cidade')
+    list_filter = ('tipo', 'uf')
+    date_hierarchy = 'data'
+
+@admin.register(EventoWorkflow)
+class EventoWorkflowAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'caso', 'criado_em', 'processado_em', 'tentativas', 'reservado_ate')
+    list_filter = ('tipo', 'processado_em')
+    raw_id_fields = ('caso', 'usuario')
+    readonly_fields = ('criado_em',)
+
+@admin.register(AcaoAgendada)
+class AcaoAgendadaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'caso', 'acao_modelo', 'executar_em', 'ativada_em')
+    list_filter = ('ativada_em',)
+    date_hierarchy = 'executar_em'
+    raw_id_fields = ('caso', 'responsavel', 'acao_origem', 'acao_criada')
+
 # ==============================================================================
 # REGISTRO DOS OUTROS MODELOS
 # ==============================================================================
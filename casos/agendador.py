@@ -0,0 +1,93 @@
+# casos/agendador.py
+
+"""
+Lembretes de OpcaoDecisao.aguardar_dias.
+
+A decisão grava uma AcaoAgendada com o vencimento (executar_em); nada mais
+acontece até lá. A tarefa abrir_lembretes_vencidos (beat, a cada minuto) lê só
+as pendentes já vencidas, numa consulta por faixa no índice parcial
+casos_agendada_pendente_idx, e abre as ações em lotes com bulk_create. Os
+casos que ainda estão esperando não são lidos.
+
+É idempotente: a mesma decisão não agenda dois lembretes (restrição única em
+acao_origem/opcao), e cada lembrete é marcado como ativado na mesma transação
+em que sua ação é criada, com as linhas travadas (skip_locked) para dois
+workers não ativarem o mesmo lote.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .calendario import campos_do_prazo
+from .contagens import invalidar_contagens
+from .grafo_workflow import grafo_workflow
+from .models import AcaoAgendada, FluxoInterno, InstanciaAcao
+
+TAMANHO_LOTE = 500
+# Lotes por execução da tarefa; o que sobrar fica para o próximo minuto
+MAXIMO_LOTES = 40
+
+
+def agendar_lembrete(caso, opcao, acao_origem, usuario=None):
+    """
+    Agenda a ação de lembrete da opção escolhida (aguardar_dias a partir de
+    agora). Retorna a AcaoAgendada (a existente, se a decisão já foi agendada).
+    """
+    agendada, _ = AcaoAgendada.objects.get_or_create(
+        acao_origem=acao_origem,
+        opcao=opcao,
+        defaults={
+            'caso': caso,
+            'acao_modelo_id': opcao.acao_etapa_id,
+            'responsavel': usuario,
+            'executar_em': timezone.now() + timedelta(days=opcao.aguardar_dias),
+        },
+    )
+    return agendada
+
+def _ativar_lote(agora):
+    grafo = grafo_workflow()
+    with transaction.atomic():
+        agendadas = list(
+            AcaoAgendada.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('caso__cliente')
+            .filter(ativada_em__isnull=True, executar_em__lte=agora)
+            .order_by('executar_em', 'id')[:TAMANHO_LOTE]
+        )
+        if not agendadas:
+            return 0
+        acoes, registros = [], []
+        for agendada in agendadas:
+            acao_modelo = grafo.acao(agendada.acao_modelo_id)
+            acoes.append(InstanciaAcao(
+                caso_id=agendada.caso_id,
+                acao_modelo_id=agendada.acao_modelo_id,
+                responsavel_id=agendada.responsavel_id,
+                **(campos_do_prazo(acao_modelo, agora, agendada.caso) if acao_modelo else {}),
+            ))
+            registros.append(FluxoInterno(
+                caso_id=agendada.caso_id, data_fluxo=agora.date(), usuario_criacao_id=agendada.responsavel_id,
+                descricao=f"[WORKFLOW] Lembrete: ação '{acao_modelo.titulo if acao_modelo else agendada.acao_modelo_id}' aberta após o prazo de espera.",
+            ))
+        InstanciaAcao.objects.bulk_create(acoes)
+        FluxoInterno.objects.bulk_create(registros)
+        for agendada, acao in zip(agendadas, acoes):
+            agendada.ativada_em, agendada.acao_criada = agora, acao
+        AcaoAgendada.objects.bulk_update(agendadas, ['ativada_em', 'acao_criada'])
+    return len(agendadas)
+
+def ativar_acoes_agendadas():
+    """Abre as ações dos lembretes vencidos, em lotes. Retorna quantas abriu."""
+    agora = timezone.now()
+    total = 0
+    for _ in range(MAXIMO_LOTES):
+        ativadas = _ativar_lote(agora)
+        total += ativadas
+        if ativadas < TAMANHO_LOTE:
+            break
+    if total:
+        # bulk_create não dispara os sinais das ações
+        invalidar_contagens('acoes')
+    return total
@@ -0,0 +1,111 @@
+# casos/area_uploads.py
+
+"""
+Área temporária dos anexos enviados pela tela do caso, até o Celery enviá-los
+ao SharePoint.
+
+A web e o worker rodam em serviços separados, sem disco em comum, então o
+conteúdo fica no banco (BlocoUploadAnexo), em blocos de GRAPH_UPLOAD_BLOCO. A
+gravação e a leitura vão bloco a bloco: só um fica em memória por vez, e
+ArquivoDoUpload permite ao upload em partes retomar de qualquer byte (seek).
+Os blocos são apagados quando o upload termina; os que sobrarem de uploads
+abandonados são limpos por descartar_orfaos().
+"""
+
+import io
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import BlocoUploadAnexo, UploadAnexo
+
+TAMANHO_BLOCO = getattr(settings, 'GRAPH_UPLOAD_BLOCO', 5 * 1024 * 1024)
+
+
+class AreaUploadsIncompleta(Exception):
+    """O conteúdo guardado do upload não bate com o tamanho esperado (blocos apagados ou perdidos)."""
+
+
+def guardar(upload, arquivo):
+    """Grava o conteúdo do UploadedFile em blocos. Retorna o total de bytes."""
+    total, buffer, ordem = 0, bytearray(), 0
+    for pedaco in arquivo.chunks():
+        buffer += pedaco
+        while len(buffer) >= TAMANHO_BLOCO:
+            BlocoUploadAnexo.objects.create(upload=upload, ordem=ordem, dados=bytes(buffer[:TAMANHO_BLOCO]))
+            del buffer[:TAMANHO_BLOCO]
+            ordem += 1
+        total += len(pedaco)
+    if buffer or ordem == 0:
+        BlocoUploadAnexo.objects.create(upload=upload, ordem=ordem, dados=bytes(buffer))
+    return total
+
+def ler(upload):
+    """Conteúdo inteiro (para os arquivos pequenos, enviados em lote)."""
+    conteudo = b''.join(
+        bytes(dados) for dados in
+        BlocoUploadAnexo.objects.filter(upload_id=upload.pk).order_by('ordem').values_list('dados', flat=True)
+    )
+    if len(conteudo) != upload.tamanho:
+        raise AreaUploadsIncompleta(f"Upload #{upload.pk}: {len(conteudo)} de {upload.tamanho} bytes guardados.")
+    return conteudo
+
+def descartar(upload_ids):
+    BlocoUploadAnexo.objects.filter(upload_id__in=upload_ids).delete()
+
+def descartar_orfaos(antes_de):
+    """
+    Apaga os blocos que sobraram de uploads concluídos, ou que falharam e não
+    são tentados desde `antes_de`. Retorna de quantos uploads.
+    """
+    orfaos = list(
+        UploadAnexo.objects.filter(Q(status='concluido') | Q(status='erro', ultima_tentativa__lt=antes_de))
+        .filter(blocos__isnull=False).values_list('id', flat=True).distinct()
+    )
+    if orfaos:
+        descartar(orfaos)
+    return len(orfaos)
+
+
+class ArquivoDoUpload(io.RawIOBase):
+    """Leitura (read/seek) do conteúdo guardado de um upload, um bloco por vez."""
+
+    def __init__(self, upload):
+        self.upload_id = upload.pk
+        self.size = upload.tamanho
+        self._posicao = 0
+        self._bloco = (None, b'')  # (ordem, dados) do último bloco lido
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._posicao
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicao, io.SEEK_END: self.size}[whence]
+        self._posicao = max(0, base + offset)
+        return self._posicao
+
+    def _dados_do_bloco(self, ordem):
+        if self._bloco[0] != ordem:
+            dados = BlocoUploadAnexo.objects.filter(upload_id=self.upload_id, ordem=ordem).values_list('dados', flat=True).first()
+            if dados is None:
+                raise AreaUploadsIncompleta(f"Upload #{self.upload_id}: bloco {ordem} não encontrado.")
+            self._bloco = (ordem, bytes(dados))
+        return self._bloco[1]
+
+    def read(self, tamanho=-1):
+        fim = self.size if tamanho is None or tamanho < 0 else min(self.size, self._posicao + tamanho)
+        partes = []
+        while self._posicao < fim:
+            ordem, inicio = divmod(self._posicao, TAMANHO_BLOCO)
+            parte = self._dados_do_bloco(ordem)[inicio:inicio + fim - self._posicao]
+            if not parte:
+                raise AreaUploadsIncompleta(f"Upload #{self.upload_id}: bloco {ordem} menor que o esperado.")
+            partes.append(parte)
+            self._posicao += len(parte)
+        return b''.join(partes)
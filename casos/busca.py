@@ -0,0 +1,150 @@
+# casos/busca.py
+
+"""
+Pesquisa de casos e de ações por texto.
+
+São duas estruturas, ambas normalizadas (minúsculas, sem acentos):
+
+- DocumentoBuscaCaso: o título de cada caso, com o índice de texto do banco
+  (tsvector/GIN + trigram no Postgres, FTS5 trigram no SQLite);
+- ValorPesquisavelCaso: uma linha por (caso, campo) só dos campos marcados como
+  `pesquisavel`, com índice trigram no valor e na coluna só de dígitos (para
+  achar números de aviso/apólice digitados com ou sem pontuação).
+
+Os sinais em casos/signals.py mantêm as duas em dia; o comando
+`reconstruir_busca_casos` refaz tudo.
+"""
+
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Caso, DocumentoBuscaCaso, ValorCampoCaso, ValorPesquisavelCaso
+
+TAMANHO_LOTE = 1000
+# Mínimo de dígitos para pesquisar também pela coluna valor_digitos (trigram precisa de 3)
+MINIMO_DIGITOS = 3
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos, para indexar e pesquisar do mesmo jeito."""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+def somente_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+# --- MANUTENÇÃO ---
+
+def atualizar_documentos_busca(caso_ids):
+    """Recria (upsert em lote) os documentos de busca dos casos informados."""
+    caso_ids = list(caso_ids)
+    for i in range(0, len(caso_ids), TAMANHO_LOTE):
+        titulos = Caso.objects.filter(id__in=caso_ids[i:i + TAMANHO_LOTE]).values_list('id', 'titulo_caso')
+        DocumentoBuscaCaso.objects.bulk_create(
+            [DocumentoBuscaCaso(caso_id=caso_id, conteudo=normalizar_texto(titulo)) for caso_id, titulo in titulos],
+            update_conflicts=True,
+            unique_fields=['caso'],
+            update_fields=['conteudo', 'atualizado_em'],
+        )
+
+def gravar_valores_pesquisaveis(valores):
+    """
+    Atualiza a projeção a partir de tuplas (caso_id, campo_id, valor) de campos
+    pesquisáveis. Valores vazios removem a linha correspondente.
+    """
+    preenchidos, vazios = [], Q()
+    for caso_id, campo_id, valor in valores:
+        if valor:
+            preenchidos.append(ValorPesquisavelCaso(
+                caso_id=caso_id,
+                campo_id=campo_id,
+                valor_normalizado=normalizar_texto(valor),
+                valor_digitos=somente_digitos(valor)[:255],
+            ))
+        else:
+            vazios |= Q(caso_id=caso_id, campo_id=campo_id)
+    if vazios:
+        ValorPesquisavelCaso.objects.filter(vazios).delete()
+    ValorPesquisavelCaso.objects.bulk_create(
+        preenchidos,
+        batch_size=TAMANHO_LOTE,
+        update_conflicts=True,
+        unique_fields=['caso', 'campo'],
+        update_fields=['valor_normalizado', 'valor_digitos'],
+    )
+
+def remover_valor_pesquisavel(caso_id, campo_id):
+    ValorPesquisavelCaso.objects.filter(caso_id=caso_id, campo_id=campo_id).delete()
+
+def reindexar_campo(campo):
+    """Refaz a projeção de um campo (ex: depois de ele ser marcado ou desmarcado como pesquisável)."""
+    ValorPesquisavelCaso.objects.filter(campo=campo).delete()
+    if not campo.pesquisavel:
+        return
+    valores = (
+        ValorCampoCaso.objects.filter(campo=campo).exclude(valor__isnull=True).exclude(valor='')
+        .order_by().values_list('caso_id', 'valor')
+    )
+    lote = []
+    for caso_id, valor in valores.iterator(chunk_size=TAMANHO_LOTE):
+        lote.append((caso_id, campo.id, valor))
+        if len(lote) >= TAMANHO_LOTE:
+            gravar_valores_pesquisaveis(lote)
+            lote = []
+    if lote:
+        gravar_valores_pesquisaveis(lote)
+
+
+# --- PESQUISA ---
+
+def _escapar_like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _sql_titulos(termo):
+    """SQL (e parâmetros) que seleciona os caso_id cujo título casa com o termo."""
+    like = f"%{_escapar_like(termo)}%"
+    if connection.vendor == 'postgresql':
+        # Palavras inteiras ou prefixos pelo tsvector; trechos no meio da palavra pelo trigram
+        palavras = re.findall(r'\w+', termo)
+        if palavras:
+            tsquery = ' & '.join(f"{p}:*" for p in palavras)
+            return (
+                "SELECT caso_id FROM casos_documentobuscacaso "
+                "WHERE busca @@ to_tsquery('simple', %s) OR conteudo LIKE %s",
+                [tsquery, like],
+            )
+        return "SELECT caso_id FROM casos_documentobuscacaso WHERE conteudo LIKE %s", [like]
+    if connection.vendor == 'sqlite' and len(termo) >= 3:
+        # O tokenizer trigram do FTS5 acha qualquer trecho com 3 caracteres ou mais
+        frase = '"' + termo.replace('"', '""') + '"'
+        return "SELECT rowid FROM casos_documentobuscacaso_fts WHERE casos_documentobuscacaso_fts MATCH %s", [frase]
+    return "SELECT caso_id FROM casos_documentobuscacaso WHERE conteudo LIKE %s ESCAPE '\\'", [like]
+
+def filtro_busca_casos(termo, prefixo=''):
+    """
+    Q que filtra pelo texto pesquisado: título, valores pesquisáveis (texto ou só
+    dígitos) e número do caso. Use `prefixo='caso__'` para filtrar modelos ligados
+    ao caso (ex: InstanciaAcao).
+    """
+    termo = termo.strip()
+    termo_normalizado = normalizar_texto(termo)
+    if not termo_normalizado:
+        return Q()
+    sql, params = _sql_titulos(termo_normalizado)
+    filtro = Q(**{f'{prefixo}pk__in': RawSQL(sql, params)})
+
+    valores = Q(valor_normalizado__contains=termo_normalizado)
+    digitos = somente_digitos(termo)
+    if len(digitos) >= MINIMO_DIGITOS:
+        # A condição valor_digitos <> '' é a mesma do índice parcial, para o banco poder usá-lo
+        valores |= ~Q(valor_digitos='') & Q(valor_digitos__contains=digitos)
+    filtro |= Q(**{f'{prefixo}pk__in': ValorPesquisavelCaso.objects.filter(valores).values('caso_id')})
+
+    if termo.isdigit():
+        filtro |= Q(**{f'{prefixo}id': termo})
+    return filtro
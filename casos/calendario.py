@@ -0,0 +1,222 @@
+# casos/calendario.py
+
+"""
+Calendário de dias úteis para os prazos das ações (tipo_prazo == 'uteis').
+
+Dia útil é o que não cai em fim de semana, em feriado nacional, em recesso
+forense, em feriado estadual da UF do escritório (settings.CALENDARIO_UF) nem
+em feriado municipal da cidade do caso (a do cliente). O calendário de cada
+processo guarda, para um intervalo de anos, a lista ordenada dos dias úteis e,
+para cada data, quantos dias úteis há até ela; "somar N dias úteis" vira um
+acesso a lista. Cidades com feriado municipal ganham um calendário próprio,
+montado na primeira vez que são usadas.
+
+Como os outros registros em memória (casos/registro_versionado.py), ele tem uma
+versão no cache compartilhado que os sinais de Feriado trocam. recalcular_prazos()
+refaz em lote o prazo das ações pendentes quando a lista de feriados muda, sem
+mexer nos prazos alterados à mão.
+"""
+
+import unicodedata
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Feriado, InstanciaAcao
+from .registro_versionado import RegistroVersionado
+
+CALENDARIO_VERSAO_KEY = "casos:calendario:versao"
+# Anos cobertos em volta do ano atual; datas fora disso ampliam o calendário
+ANOS_ANTES, ANOS_DEPOIS = 2, 5
+TAMANHO_LOTE = 1000
+
+
+def _normalizar_cidade(cidade):
+    """'São  Paulo' e 'sao paulo' são a mesma cidade."""
+    sem_acento = unicodedata.normalize('NFKD', cidade or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.split()).casefold()
+
+def _local_do_caso(caso):
+    """(UF, cidade) usados para os feriados municipais do caso: os do cliente."""
+    if caso is None:
+        return '', ''
+    cliente = caso.cliente
+    return (cliente.uf or '').upper(), cliente.cidade or ''
+
+
+class CalendarioUteis:
+    def __init__(self, inicio, fim, sem_expediente):
+        self.inicio, self.fim = inicio, fim
+        total_dias = (fim - inicio).days + 1
+        # uteis_ate[i]: quantos dias úteis há de `inicio` até inicio + i (inclusive)
+        self.uteis_ate = [0] * total_dias
+        self.dias_uteis = []
+        for i in range(total_dias):
+            dia = inicio + timedelta(days=i)
+            if dia.weekday() < 5 and dia not in sem_expediente:
+                self.dias_uteis.append(dia)
+            self.uteis_ate[i] = len(self.dias_uteis)
+
+    def cobre(self, dia, dias_uteis=0):
+        if not (self.inicio <= dia <= self.fim):
+            return False
+        return self.uteis_ate[(dia - self.inicio).days] + dias_uteis <= len(self.dias_uteis)
+
+    def eh_dia_util(self, dia):
+        i = (dia - self.inicio).days
+        return self.uteis_ate[i] > (self.uteis_ate[i - 1] if i else 0)
+
+    def somar_dias_uteis(self, dia, quantidade):
+        """O N-ésimo dia útil depois de `dia` (o próprio dia não conta)."""
+        return self.dias_uteis[self.uteis_ate[(dia - self.inicio).days] + quantidade - 1]
+
+
+class Calendarios:
+    """Os calendários de um intervalo: o geral e, sob demanda, o de cada cidade com feriado municipal."""
+
+    def __init__(self, inicio, fim):
+        self.inicio, self.fim = inicio, fim
+        self._sem_expediente, self._municipais = self._feriados(inicio, fim)
+        self.geral = CalendarioUteis(inicio, fim, self._sem_expediente)
+        self._por_cidade = {}
+
+    @staticmethod
+    def _feriados(inicio, fim):
+        uf = getattr(settings, 'CALENDARIO_UF', '')
+        abrangencia = Q(tipo__in=['nacional', 'recesso']) | Q(tipo='municipal', cidade__gt='')
+        if uf:
+            abrangencia |= Q(tipo='estadual', uf__iexact=uf)
+        feriados = Feriado.objects.filter(abrangencia, Q(data__gte=inicio) | Q(data_fim__gte=inicio), data__lte=fim)
+        gerais = set()
+        # {cidade normalizada: {uf ('' = qualquer): dias}}
+        municipais = {}
+        for tipo, uf_feriado, cidade, data, data_fim in feriados.values_list('tipo', 'uf', 'cidade', 'data', 'data_fim'):
+            if tipo == 'municipal':
+                dias = municipais.setdefault(_normalizar_cidade(cidade), {}).setdefault(uf_feriado.upper(), set())
+            else:
+                dias = gerais
+            for i in range(((data_fim or data) - data).days + 1):
+                dias.add(data + timedelta(days=i))
+        return gerais, municipais
+
+    def cobre(self, dia):
+        return self.inicio <= dia <= self.fim
+
+    def da_cidade(self, uf='', cidade=''):
+        """Calendário de uma cidade; o geral se ela não tem feriado municipal."""
+        chave = (uf.upper(), _normalizar_cidade(cidade))
+        por_uf = self._municipais.get(chave[1])
+        if not chave[1] or not por_uf:
+            return self.geral
+        cal = self._por_cidade.get(chave)
+        if cal is None:
+            if chave[0]:
+                dias = por_uf.get('', set()) | por_uf.get(chave[0], set())
+            else:
+                # Cliente sem UF: vale o feriado de qualquer cidade com esse nome
+                dias = set().union(*por_uf.values())
+            cal = CalendarioUteis(self.inicio, self.fim, self._sem_expediente | dias) if dias else self.geral
+            self._por_cidade[chave] = cal
+        return cal
+
+
+def _montar(datas, anterior):
+    hoje = timezone.localdate()
+    anos = [d.year for d in datas] + [hoje.year]
+    inicio = date(min(anos) - ANOS_ANTES, 1, 1)
+    fim = date(max(anos) + ANOS_DEPOIS, 12, 31)
+    if anterior is not None:
+        # Mesma versão: só amplia o intervalo
+        inicio, fim = min(inicio, anterior.inicio), max(fim, anterior.fim)
+    return Calendarios(inicio, fim)
+
+_registro = RegistroVersionado(CALENDARIO_VERSAO_KEY, lambda anterior: _montar((), anterior))
+
+def calendario(*datas):
+    """Calendários atuais, ampliados se necessário para cobrir as datas informadas."""
+    return _registro.obter(
+        valido=lambda cal: all(cal.cobre(d) for d in datas),
+        construir=lambda anterior: _montar(datas, anterior),
+    )
+
+def invalidar_calendario():
+    """Troca a versão do calendário para todos os processos."""
+    _registro.invalidar()
+
+
+# --- PRAZOS ---
+
+def somar_dias_uteis(inicio, quantidade, uf='', cidade=''):
+    """
+    `inicio` + N dias úteis, contando os feriados municipais da cidade
+    informada. Aceita date ou datetime; no datetime o horário (local) é mantido
+    e só a data avança.
+    """
+    dia = timezone.localtime(inicio).date() if isinstance(inicio, datetime) else inicio
+    calendarios = calendario(dia)
+    cal = calendarios.da_cidade(uf, cidade)
+    while not cal.cobre(dia, quantidade):
+        # Prazo além do fim do calendário: amplia para a frente
+        calendarios = calendario(dia, calendarios.fim + timedelta(days=366 * (1 + quantidade // 250)))
+        cal = calendarios.da_cidade(uf, cidade)
+    resultado = cal.somar_dias_uteis(dia, quantidade)
+    if isinstance(inicio, datetime):
+        local = timezone.localtime(inicio)
+        return local.replace(year=resultado.year, month=resultado.month, day=resultado.day)
+    return resultado
+
+def prazo_da_acao(acao_modelo, inicio, caso=None):
+    """Prazo final da ação do caso criada em `inicio` (None se a ação não tem prazo)."""
+    if acao_modelo.prazo_dias <= 0:
+        return None
+    if acao_modelo.tipo_prazo == 'uteis':
+        return somar_dias_uteis(inicio, acao_modelo.prazo_dias, *_local_do_caso(caso))
+    return inicio + timedelta(days=acao_modelo.prazo_dias)
+
+def campos_do_prazo(acao_modelo, inicio, caso=None):
+    """prazo_final e prazo_calculado de uma InstanciaAcao nova: InstanciaAcao(..., **campos_do_prazo(...))."""
+    prazo = prazo_da_acao(acao_modelo, inicio, caso)
+    return {'prazo_final': prazo, 'prazo_calculado': prazo}
+
+def recalcular_prazos(queryset=None):
+    """
+    Refaz o prazo das ações pendentes em dias úteis (todas, ou as do queryset),
+    a partir da data de criação. Só entram as ações cujo prazo ainda é o
+    calculado (prazo_final == prazo_calculado): um prazo alterado à mão não é
+    tocado. Os que mudaram são gravados com bulk_update em lotes. Retorna
+    quantos mudaram.
+    """
+    if queryset is None:
+        queryset = InstanciaAcao.objects.all()
+    acoes = (
+        queryset.filter(
+            status='P', acao_modelo__tipo_prazo='uteis', acao_modelo__prazo_dias__gt=0,
+            prazo_final=F('prazo_calculado'),
+        )
+        .select_related('acao_modelo', 'caso__cliente')
+        .only(
+            'id', 'data_criacao', 'prazo_final', 'prazo_calculado', 'acao_modelo', 'acao_modelo__prazo_dias',
+            'caso', 'caso__cliente', 'caso__cliente__uf', 'caso__cliente__cidade',
+        )
+        .order_by('id')
+    )
+    alterados, lote = 0, []
+    for acao in acoes.iterator(chunk_size=TAMANHO_LOTE):
+        prazo = somar_dias_uteis(acao.data_criacao, acao.acao_modelo.prazo_dias, *_local_do_caso(acao.caso))
+        if prazo != acao.prazo_final:
+            acao.prazo_final = acao.prazo_calculado = prazo
+            lote.append(acao)
+        if len(lote) >= TAMANHO_LOTE:
+            alterados += _gravar_prazos(lote)
+            lote = []
+    if lote:
+        alterados += _gravar_prazos(lote)
+    return alterados
+
+def _gravar_prazos(acoes):
+    with transaction.atomic():
+        InstanciaAcao.objects.bulk_update(acoes, ['prazo_final', 'prazo_calculado'])
+    return len(acoes)
@@ -0,0 +1,106 @@
+# casos/contagens.py
+
+"""
+Totais das listagens filtradas (casos, ações) sem COUNT(*) a cada página.
+
+- Cada total fica no cache por CONTAGEM_CACHE_TTL segundos, pela assinatura
+  normalizada dos filtros da tela. Gravar um caso ou uma ação troca a versão
+  do escopo e descarta os totais dele.
+- Sem filtro, o tamanho vem de pg_class.reltuples; com filtro, da estimativa
+  do planejador (EXPLAIN). Só quando a estimativa é pequena (abaixo de
+  LIMITE_CONTAGEM_EXATA) o total é contado de verdade, porque aí é barato.
+"""
+
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+Contagem = namedtuple('Contagem', ['total', 'aproximado'])
+
+LIMITE_CONTAGEM_EXATA = 10000
+# Parâmetros da URL que não mudam o resultado (paginação)
+PARAMETROS_IGNORADOS = ('page', 'cursor')
+
+
+def _chave_versao(escopo):
+    return f"contagem:versao:{escopo}"
+
+def _versao(escopo):
+    try:
+        return cache.get_or_set(_chave_versao(escopo), 1, timeout=None)
+    except Exception:
+        return 1
+
+def invalidar_contagens(*escopos):
+    """Descarta os totais em cache dos escopos informados (ex: 'casos', 'acoes')."""
+    for escopo in escopos:
+        try:
+            cache.incr(_chave_versao(escopo))
+        except ValueError:
+            cache.set(_chave_versao(escopo), 2, timeout=None)
+        except Exception:
+            pass
+
+def normalizar_filtros(parametros):
+    """Assinatura estável dos filtros: sem paginação, sem vazios, chaves e valores ordenados."""
+    filtros = {}
+    for chave in sorted(parametros):
+        if chave in PARAMETROS_IGNORADOS:
+            continue
+        valores = parametros.getlist(chave) if hasattr(parametros, 'getlist') else [parametros[chave]]
+        valores = sorted(str(v).strip() for v in valores if str(v).strip())
+        if valores:
+            filtros[chave] = valores
+    return filtros
+
+def estimativa_tabela(modelo):
+    """Número de linhas da tabela segundo as estatísticas do Postgres (None se indisponível)."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [modelo._meta.db_table])
+        linha = cursor.fetchone()
+    # reltuples é -1 enquanto a tabela nunca foi analisada
+    return int(linha[0]) if linha and linha[0] >= 0 else None
+
+def estimativa_planejador(queryset):
+    """Número de linhas que o planejador do Postgres espera para a consulta (None se indisponível)."""
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plano = cursor.fetchone()[0]
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return int(plano[0]['Plan']['Plan Rows'])
+
+def contar(queryset, escopo, parametros):
+    """
+    Total de `queryset` (já filtrado a partir de `parametros`, ex: request.GET).
+    Retorna Contagem(total, aproximado).
+    """
+    filtros = normalizar_filtros(parametros)
+    assinatura = hashlib.sha1(json.dumps(filtros, sort_keys=True).encode()).hexdigest()
+    chave = f"contagem:{escopo}:{_versao(escopo)}:{assinatura}"
+    try:
+        em_cache = cache.get(chave)
+    except Exception:
+        em_cache = None
+    if em_cache is not None:
+        return Contagem(*em_cache)
+
+    estimativa = estimativa_tabela(queryset.model) if not filtros else estimativa_planejador(queryset)
+    if estimativa is not None and estimativa >= LIMITE_CONTAGEM_EXATA:
+        contagem = Contagem(estimativa, True)
+    else:
+        contagem = Contagem(queryset.count(), False)
+    try:
+        cache.set(chave, tuple(contagem), timeout=getattr(settings, 'CONTAGEM_CACHE_TTL', 60))
+    except Exception:
+        pass
+    return contagem
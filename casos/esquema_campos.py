@@ -0,0 +1,98 @@
+# casos/esquema_campos.py
+
+"""
+Registro, em memória, do esquema dos campos customizados: os Campos, as opções
+das listas (OpcaoCampo) e as regras (RegraCampo) de cada cliente/produto.
+
+O esquema muda pouco e é lido em todo formulário, chamada AJAX e pesquisa, então
+cada processo guarda uma cópia montada em quatro consultas e as leituras viram
+acessos a dicionário. A cópia é identificada por uma versão guardada no cache
+compartilhado (casos/registro_versionado.py); os sinais em casos/signals.py trocam a versão (depois do commit)
+e cada processo remonta a sua na próxima leitura.
+
+As definições de campo são dicionários compartilhados: não altere, copie.
+"""
+
+from collections import defaultdict, namedtuple
+
+from .models import Campo, OpcaoCampo, RegraCampo
+from .registro_versionado import RegistroVersionado
+
+ESQUEMA_VERSAO_KEY = "casos:esquema_campos:versao"
+
+Regra = namedtuple('Regra', ['pk', 'cliente_id', 'produto_id', 'formato_titulo', 'atualizado_em', 'campo_ids'])
+
+
+class EsquemaCampos:
+    def __init__(self):
+        opcoes = defaultdict(list)
+        for campo_id, valor in OpcaoCampo.objects.order_by('valor').values_list('campo_id', 'valor'):
+            opcoes[campo_id].append(valor)
+
+        # Campos na ordem de exibição (nome_label)
+        self.campos = {}
+        for campo_id, nome_label, nome_tecnico, tipo_campo, pesquisavel in (
+            Campo.objects.order_by('nome_label').values_list('id', 'nome_label', 'nome_tecnico', 'tipo_campo', 'pesquisavel')
+        ):
+            self.campos[campo_id] = {
+                'id': campo_id, 'nome_label': nome_label, 'nome_tecnico': nome_tecnico,
+                'tipo_campo': tipo_campo, 'pesquisavel': pesquisavel, 'opcoes': opcoes.get(campo_id, []),
+            }
+        self.por_nome = {campo['nome_tecnico']: campo for campo in self.campos.values()}
+
+        campos_da_regra = defaultdict(set)
+        for regra_id, campo_id in RegraCampo.campos.through.objects.values_list('regracampo_id', 'campo_id'):
+            campos_da_regra[regra_id].add(campo_id)
+        self.regras = {}
+        por_produto = defaultdict(set)
+        for pk, cliente_id, produto_id, formato_titulo, atualizado_em in (
+            RegraCampo.objects.values_list('id', 'cliente_id', 'produto_id', 'formato_titulo', 'atualizado_em')
+        ):
+            campo_ids = tuple(c for c in self.campos if c in campos_da_regra[pk])
+            self.regras[(cliente_id, produto_id)] = Regra(pk, cliente_id, produto_id, formato_titulo, atualizado_em, campo_ids)
+            por_produto[produto_id].update(campo_ids)
+        # Campos de um produto: os de todas as regras dele, sem repetir
+        self.por_produto = {
+            produto_id: [campo for campo_id, campo in self.campos.items() if campo_id in campo_ids]
+            for produto_id, campo_ids in por_produto.items()
+        }
+
+    def regra(self, cliente_id, produto_id):
+        return self.regras.get((cliente_id, produto_id))
+
+    def campos_da_regra(self, cliente_id, produto_id):
+        regra = self.regra(cliente_id, produto_id)
+        return [self.campos[campo_id] for campo_id in regra.campo_ids] if regra else []
+
+    def campos_do_produto(self, produto_id):
+        return self.por_produto.get(produto_id, [])
+
+    def campos_por_nomes(self, nomes):
+        """Campos com os nomes técnicos informados, na ordem de exibição."""
+        nomes = set(nomes)
+        return [campo for campo in self.campos.values() if campo['nome_tecnico'] in nomes]
+
+
+_registro = RegistroVersionado(ESQUEMA_VERSAO_KEY, lambda anterior: EsquemaCampos())
+
+def esquema():
+    """Esquema atual (remontado só quando a versão no cache compartilhado mudou)."""
+    return _registro.obter()
+
+def invalidar_esquema():
+    """Troca a versão do esquema para todos os processos."""
+    _registro.invalidar()
+
+def campos_dos_produtos(produto_ids):
+    """
+    Retorna {produto_id: [definições de campo]} na ordem de exibição. Cada
+    definição tem id, nome_label, nome_tecnico, tipo_campo e opcoes.
+    """
+    registro = esquema()
+    return {
+        produto_id: [
+            {chave: campo[chave] for chave in ('id', 'nome_label', 'nome_tecnico', 'tipo_campo', 'opcoes')}
+            for campo in registro.campos_do_produto(produto_id)
+        ]
+        for produto_id in dict.fromkeys(produto_ids)
+    }
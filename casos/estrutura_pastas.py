@@ -0,0 +1,42 @@
+# casos/estrutura_pastas.py
+
+"""
+Modelos de subpastas do SharePoint por Produto, já sanitizados e guardados no cache.
+
+O provisionamento de pastas lê daqui em vez de consultar `produto.estrutura_pastas`
+caso a caso. Os sinais em casos/signals.py descartam o cache (depois do commit)
+quando a estrutura de algum produto muda.
+"""
+
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .microsoft_graph_service import sanitizar_nome_pasta
+from .models import Produto
+
+ESTRUTURA_PASTAS_CACHE_KEY = "casos:estrutura_pastas"
+# Os sinais descartam o cache a cada mudança; o prazo é só uma garantia extra
+ESTRUTURA_PASTAS_CACHE_TTL = 60 * 60
+
+
+def _montar_modelos():
+    modelos = defaultdict(list)
+    relacoes = (
+        Produto.estrutura_pastas.through.objects
+        .order_by('id').values_list('produto_id', 'estruturapasta__nome_pasta')
+    )
+    for produto_id, nome_pasta in relacoes:
+        modelos[produto_id].append(sanitizar_nome_pasta(nome_pasta))
+    return dict(modelos)
+
+def modelos_de_pastas():
+    """Retorna {produto_id: [nomes de subpastas sanitizados]} de todos os produtos."""
+    modelos = cache.get(ESTRUTURA_PASTAS_CACHE_KEY)
+    if modelos is None:
+        modelos = _montar_modelos()
+        cache.set(ESTRUTURA_PASTAS_CACHE_KEY, modelos, timeout=ESTRUTURA_PASTAS_CACHE_TTL)
+    return modelos
+
+def invalidar_modelos_de_pastas():
+    cache.delete(ESTRUTURA_PASTAS_CACHE_KEY)
@@ -0,0 +1,174 @@
+# casos/eventos_workflow.py
+
+"""
+Fila (outbox) dos efeitos colaterais do workflow.
+
+As views só gravam um EventoWorkflow, na mesma transação da mudança; os
+e-mails são enviados depois pela tarefa processar_eventos_workflow, em lotes. Como o evento está no banco, um worker
+que cair no meio do caminho não perde nada: o que não foi marcado como
+processado é pego de novo na próxima execução (a tarefa também roda no beat).
+
+Cada lote é reservado numa transação curta (select_for_update com skip_locked,
+marcando reservado_ate) e os e-mails são enviados fora dela, sem travar linhas
+durante as chamadas ao Graph; o resultado de cada evento é gravado logo depois
+do seu envio. Enquanto a reserva vale, outros workers pulam o evento; se o
+worker cair, ela expira e o evento volta para a fila. O envio é "pelo menos uma
+vez": um e-mail pode repetir se o worker cair logo depois de enviá-lo.
+"""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from notificacoes.models import TemplateEmail
+from notificacoes.servicos import preparar_email_template, preparar_notificacao
+
+from .grafo_workflow import grafo_workflow
+from .microsoft_graph_service import enviar_email_graph
+from .models import EventoWorkflow, FluxoInterno
+
+TAMANHO_LOTE = 50
+MAXIMO_TENTATIVAS = 5
+# Lotes por execução da tarefa; o que sobrar fica para a próxima
+MAXIMO_LOTES = 20
+# Tempo que um worker tem para enviar o lote reservado antes de outro poder pegá-lo
+RESERVA_LOTE = timedelta(minutes=10)
+PROCESSAMENTO_AGENDADO_KEY = "casos:eventos_workflow:agendado"
+
+
+class FalhaEvento(Exception):
+    """O efeito do evento falhou e deve ser tentado de novo."""
+
+
+def registrar_evento(tipo, caso, usuario=None, **dados):
+    """
+    Grava o evento na transação atual e agenda o processamento para depois do
+    commit (se a transação for desfeita, o evento também é).
+    """
+    evento = EventoWorkflow.objects.create(tipo=tipo, caso=caso, usuario=usuario, dados=dados)
+    transaction.on_commit(agendar_processamento)
+    return evento
+
+def agendar_processamento():
+    # Import tardio: tasks.py importa este módulo
+    from .tasks import processar_eventos_workflow
+    # Vários eventos em sequência resultam em uma única tarefa
+    if cache.add(PROCESSAMENTO_AGENDADO_KEY, 1, timeout=2):
+        processar_eventos_workflow.apply_async(countdown=2)
+
+
+# --- EFEITOS ---
+
+def _enviar(evento, dados_email, descricao):
+    sucesso, mensagem = enviar_email_graph(
+        usuario_remetente=evento.usuario,
+        destinatarios=dados_email['destinatarios'],
+        assunto=dados_email['assunto'],
+        corpo_html=dados_email['corpo'],
+    )
+    if not sucesso:
+        raise FalhaEvento(mensagem)
+    FluxoInterno.objects.create(
+        caso=evento.caso,
+        data_fluxo=timezone.now().date(),
+        descricao=f"[SISTEMA] E-mail de '{descricao}' enviado para: {', '.join(dados_email['destinatarios'])}.",
+        usuario_criacao=evento.usuario,
+    )
+
+def _notificar(evento, slug_evento, descricao, contexto):
+    preparado, dados_email = preparar_notificacao(slug_evento=slug_evento, contexto=contexto)
+    if not preparado:
+        # Sem modelo ou sem destinatários configurados: não há o que enviar nem repetir
+        print(f"EVENTO WORKFLOW #{evento.pk}: notificação '{slug_evento}' não enviada: {dados_email}")
+        return
+    if evento.usuario is None:
+        raise FalhaEvento("Evento sem usuário remetente.")
+    _enviar(evento, dados_email, descricao)
+
+def _caso_criado(evento):
+    _notificar(evento, 'novo-caso-criado', 'Novo Caso Criado', {'caso': evento.caso, 'usuario_acao': evento.usuario})
+
+def _etapa_alterada(evento):
+    # A mudança de etapa não registra mais este evento; fica para os que já estavam na fila
+    grafo = grafo_workflow()
+    contexto = {
+        'caso': evento.caso,
+        'etapa_antiga': grafo.etapa(evento.dados.get('etapa_antiga_id')),
+        'nova_etapa': grafo.etapa(evento.dados.get('nova_etapa_id')),
+        'usuario_acao': evento.usuario,
+    }
+    _notificar(evento, 'avanco-etapa-workflow', 'Avanço de Etapa', contexto)
+
+def _decisao_tomada(evento):
+    opcao = grafo_workflow().opcao(evento.dados.get('opcao_id'))
+    if opcao is None:
+        return
+    if opcao.enviar_email and opcao.modelo_email_id:
+        template_email = TemplateEmail.objects.filter(pk=opcao.modelo_email_id, ativo=True).first()
+        if template_email is None:
+            return
+        contexto = {'caso': evento.caso, 'usuario_acao': evento.usuario, 'opcao': opcao}
+        preparado, dados_email = preparar_email_template(template_email, contexto)
+        if not preparado:
+            print(f"EVENTO WORKFLOW #{evento.pk}: e-mail da decisão '{opcao.label_do_botao}' não enviado: {dados_email}")
+            return
+        if evento.usuario is None:
+            raise FalhaEvento("Evento sem usuário remetente.")
+        _enviar(evento, dados_email, opcao.label_do_botao)
+
+EFEITOS = {
+    'caso_criado': _caso_criado,
+    'etapa_alterada': _etapa_alterada,
+    'decisao_tomada': _decisao_tomada,
+}
+
+
+# --- CONSUMO ---
+
+def _reservar_lote(depois_de):
+    agora = timezone.now()
+    with transaction.atomic():
+        # skip_locked: dois workers ao mesmo tempo reservam lotes diferentes
+        eventos = list(
+            EventoWorkflow.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(processado_em__isnull=True, tentativas__lt=MAXIMO_TENTATIVAS, id__gt=depois_de)
+            .filter(Q(reservado_ate__isnull=True) | Q(reservado_ate__lt=agora))
+            .select_related('caso', 'usuario').order_by('id')[:TAMANHO_LOTE]
+        )
+        if eventos:
+            EventoWorkflow.objects.filter(pk__in=[evento.pk for evento in eventos]).update(reservado_ate=agora + RESERVA_LOTE)
+    return eventos
+
+def _processar_lote(depois_de):
+    eventos = _reservar_lote(depois_de)
+    for evento in eventos:
+        try:
+            # Sem transação aberta: a chamada ao Graph não segura conexão nem linhas travadas
+            EFEITOS[evento.tipo](evento)
+            evento.processado_em, evento.erro = timezone.now(), ''
+        except Exception as e:
+            evento.tentativas += 1
+            evento.erro = repr(e)
+            print(f"EVENTO WORKFLOW #{evento.pk}: falha na tentativa {evento.tentativas}: {evento.erro}")
+        # Gravado evento a evento: se o worker cair no meio do lote, os já enviados não repetem
+        EventoWorkflow.objects.filter(pk=evento.pk).update(
+            processado_em=evento.processado_em, tentativas=evento.tentativas, erro=evento.erro, reservado_ate=None,
+        )
+    return eventos
+
+def processar_eventos():
+    """
+    Processa os eventos pendentes em lotes. Os que falharem só são tentados
+    de novo na próxima execução. Retorna quantos foram lidos.
+    """
+    total, ultimo_id = 0, 0
+    for _ in range(MAXIMO_LOTES):
+        eventos = _processar_lote(ultimo_id)
+        total += len(eventos)
+        if len(eventos) < TAMANHO_LOTE:
+            break
+        ultimo_id = eventos[-1].pk
+    return total
@@ -6,6 +6,34 @@ from .models import (
     Caso, Campo, ValorCampoCaso, FluxoInterno, Timesheet, 
     OpcaoCampo, AndamentoCaso, DespesaCaso, AcordoCaso
 )
+from .esquema_campos import esquema
+
+
+def campo_dinamico(definicao):
+    """Campo de formulário para uma definição do esquema de campos customizados."""
+    tipo, rotulo = definicao['tipo_campo'], definicao['nome_label']
+    if tipo == 'textarea':
+        return forms.CharField(label=rotulo, required=False, widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}))
+    if tipo == 'number':
+        return forms.DecimalField(label=rotulo, required=False, widget=forms.NumberInput(attrs={'class': 'form-control', 'step': 'any'}))
+    if tipo == 'integer':
+        return forms.IntegerField(label=rotulo, required=False, widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    if tipo == 'date':
+        return forms.DateField(label=rotulo, required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    if tipo == 'url':
+        return forms.URLField(label=rotulo, required=False, widget=forms.URLInput(attrs={'class': 'form-control'}))
+    if tipo == 'select':
+        opcoes = [('', '---------')] + [(opcao, opcao) for opcao in definicao['opcoes']]
+        return forms.ChoiceField(label=rotulo, required=False, choices=opcoes, widget=forms.Select(attrs={'class': 'form-select'}))
+    return forms.CharField(label=rotulo, required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+
+def valor_como_texto(valor):
+    """Valor já validado de um campo dinâmico no formato gravado em ValorCampoCaso.valor."""
+    if valor is None:
+        return ''
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return str(valor)
 
 class CasoCreateForm(forms.ModelForm):
     class Meta:
@@ -39,6 +67,20 @@ class CasoUpdateForm(forms.ModelForm):
                     field.widget.attrs.update({'class': 'form-control'})
         if 'titulo_caso' in self.fields:
             self.fields['titulo_caso'].widget.attrs.update({'readonly': True, 'style': 'background-color: #e9ecef;'})
+        # Campos customizados da regra do cliente/produto, lidos do esquema em memória
+        if self.instance and self.instance.pk:
+            valores = self.instance.valores_json or {}
+            for definicao in esquema().campos_da_regra(self.instance.cliente_id, self.instance.produto_id):
+                nome = f"dynamic_{definicao['nome_tecnico']}"
+                self.fields[nome] = campo_dinamico(definicao)
+                self.initial.setdefault(nome, valores.get(definicao['nome_tecnico'], ''))
+
+    def valores_dinamicos(self):
+        """Campos customizados validados, {nome_tecnico: valor em texto}."""
+        return {
+            nome[len('dynamic_'):]: valor_como_texto(valor)
+            for nome, valor in self.cleaned_data.items() if nome.startswith('dynamic_')
+        }
 
     class Meta:
         model = Caso
@@ -0,0 +1,87 @@
+# casos/grafo_workflow.py
+
+"""
+Grafo compilado, em memória, dos fluxos de trabalho: etapas em ordem, a próxima
+etapa de cada uma, as ações de cada etapa e as opções de decisão de cada ação.
+
+As transições (casos/workflow.py) e as decisões das ações consultam este grafo
+em vez de FluxoTrabalho/EtapaFluxo/AcaoEtapa/OpcaoDecisao a cada clique. Cada
+processo monta o grafo em quatro consultas e o guarda com a versão lida do cache
+compartilhado (casos/registro_versionado.py); os sinais em casos/signals.py
+trocam a versão (depois do commit) quando o admin altera o workflow, e cada
+processo remonta o seu na próxima leitura.
+
+Os objetos do grafo são compartilhados entre as requisições: só leitura.
+"""
+
+from collections import defaultdict
+
+from .models import AcaoEtapa, EtapaFluxo, FluxoTrabalho, OpcaoDecisao
+from .registro_versionado import RegistroVersionado
+
+GRAFO_WORKFLOW_VERSAO_KEY = "casos:grafo_workflow:versao"
+
+
+class GrafoWorkflow:
+    def __init__(self):
+        self.fluxos = {
+            (cliente_id, produto_id): fluxo_id
+            for fluxo_id, cliente_id, produto_id in FluxoTrabalho.objects.values_list('id', 'cliente_id', 'produto_id')
+        }
+
+        self.etapas = {}
+        self.etapas_por_fluxo = defaultdict(list)
+        for etapa in EtapaFluxo.objects.select_related('fluxo_trabalho').order_by('fluxo_trabalho_id', 'ordem'):
+            self.etapas[etapa.pk] = etapa
+            self.etapas_por_fluxo[etapa.fluxo_trabalho_id].append(etapa)
+        self.proxima = {}
+        for etapas in self.etapas_por_fluxo.values():
+            for atual, seguinte in zip(etapas, etapas[1:] + [None]):
+                self.proxima[atual.pk] = seguinte
+
+        self.acoes = {}
+        self.acoes_por_etapa = defaultdict(list)
+        for acao in AcaoEtapa.objects.select_related('responsavel_fixo').order_by('id'):
+            self.acoes[acao.pk] = acao
+            self.acoes_por_etapa[acao.etapa_fluxo_id].append(acao)
+
+        self.opcoes = {}
+        self.opcoes_por_acao = defaultdict(list)
+        for opcao in OpcaoDecisao.objects.order_by('id'):
+            self.opcoes[opcao.pk] = opcao
+            self.opcoes_por_acao[opcao.acao_etapa_id].append(opcao)
+
+    def fluxo(self, cliente_id, produto_id):
+        """ID do FluxoTrabalho do cliente/produto (None se não houver)."""
+        return self.fluxos.get((cliente_id, produto_id))
+
+    def primeira_etapa(self, fluxo_id):
+        etapas = self.etapas_por_fluxo.get(fluxo_id)
+        return etapas[0] if etapas else None
+
+    def proxima_etapa(self, etapa_id):
+        """Etapa seguinte do mesmo fluxo (None na última)."""
+        return self.proxima.get(etapa_id)
+
+    def acoes_da_etapa(self, etapa_id):
+        return self.acoes_por_etapa.get(etapa_id, [])
+
+    def etapa(self, etapa_id):
+        return self.etapas.get(etapa_id)
+
+    def acao(self, acao_id):
+        return self.acoes.get(acao_id)
+
+    def opcao(self, opcao_id):
+        return self.opcoes.get(opcao_id)
+
+
+_registro = RegistroVersionado(GRAFO_WORKFLOW_VERSAO_KEY, lambda anterior: GrafoWorkflow())
+
+def grafo_workflow():
+    """Grafo atual (remontado só quando a versão no cache compartilhado mudou)."""
+    return _registro.obter()
+
+def invalidar_grafo_workflow():
+    """Troca a versão do grafo para todos os processos."""
+    _registro.invalidar()
@@ -0,0 +1,313 @@
+# casos/indice_arquivos.py
+
+"""
+Índice local dos arquivos do SharePoint (tabela ArquivoSharePoint).
+
+A tarefa periódica `sincronizar_arquivos_sharepoint` chama sincronizar_drive(),
+que lê apenas o que mudou no drive pela consulta delta do Graph e atualiza o
+espelho. Com isso a navegação pelas pastas, a contagem de arquivos por caso e a
+busca por nome de arquivo viram consultas no banco.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import microsoft_graph_service
+from .microsoft_graph_service import graph_request
+from .models import ArquivoSharePoint, Caso, SincronizacaoDrive
+
+DELTA_CAMPOS = "id,name,parentReference,folder,file,size,webUrl,lastModifiedDateTime,deleted,sharepointIds,root"
+TAMANHO_LOTE = 500
+# Limite de níveis na subida pela árvore de pastas (proteção contra ciclos)
+PROFUNDIDADE_MAXIMA = 64
+
+
+class DeltaExpirado(Exception):
+    """O Graph não aceita mais o deltaLink salvo (HTTP 410); é preciso sincronizar do zero."""
+
+
+# --- SINCRONIZAÇÃO ---
+
+def _para_registro(item, agora):
+    return ArquivoSharePoint(
+        item_id=item['id'],
+        sharepoint_unique_id=(item.get('sharepointIds') or {}).get('listItemUniqueId', ''),
+        pai_id=(item.get('parentReference') or {}).get('id', ''),
+        nome=item.get('name', '')[:400],
+        pasta='folder' in item,
+        tamanho=item.get('size') or 0,
+        web_url=item.get('webUrl', '')[:1000],
+        data_modificacao=parse_datetime(item['lastModifiedDateTime']) if item.get('lastModifiedDateTime') else None,
+        data_sincronizacao=agora,
+    )
+
+def _aplicar_pagina(itens, agora):
+    """
+    Grava uma página do delta. Retorna (pastas criadas ou alteradas, pastas que
+    tiveram arquivos criados ou alterados).
+    """
+    registros, removidos = {}, set()
+    for item in itens:
+        if 'root' in item:
+            continue
+        if 'deleted' in item:
+            removidos.add(item['id'])
+            registros.pop(item['id'], None)
+        else:
+            # O mesmo item pode aparecer mais de uma vez; vale a última versão
+            registros[item['id']] = _para_registro(item, agora)
+            removidos.discard(item['id'])
+
+    if removidos:
+        pastas_removidas = list(ArquivoSharePoint.objects.filter(item_id__in=removidos, pasta=True).values_list('item_id', flat=True))
+        ArquivoSharePoint.objects.filter(item_id__in=removidos).delete()
+        # O delta nem sempre lista o conteúdo de uma pasta removida; remove os descendentes também
+        while pastas_removidas:
+            filhas = list(ArquivoSharePoint.objects.filter(pai_id__in=pastas_removidas, pasta=True).values_list('item_id', flat=True))
+            ArquivoSharePoint.objects.filter(pai_id__in=pastas_removidas).delete()
+            pastas_removidas = filhas
+
+    ArquivoSharePoint.objects.bulk_create(
+        list(registros.values()),
+        batch_size=TAMANHO_LOTE,
+        update_conflicts=True,
+        unique_fields=['item_id'],
+        update_fields=['sharepoint_unique_id', 'pai_id', 'nome', 'pasta', 'tamanho', 'web_url', 'data_modificacao', 'data_sincronizacao'],
+    )
+    pastas = {r.item_id for r in registros.values() if r.pasta}
+    pais_de_arquivos = {r.pai_id for r in registros.values() if not r.pasta}
+    return pastas, pais_de_arquivos
+
+def _em_lotes(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), TAMANHO_LOTE):
+        yield ids[i:i + TAMANHO_LOTE]
+
+def _casos_com_pasta(ids):
+    """{ID da pasta (item ou UniqueId): caso} só para os IDs informados que são pasta de um caso."""
+    mapa = {}
+    for lote in _em_lotes(ids):
+        mapa.update(Caso.objects.filter(sharepoint_folder_id__in=lote).values_list('sharepoint_folder_id', 'id'))
+    return mapa
+
+def _casos_das_pastas(pasta_ids, recalcular):
+    """
+    {item_id: caso_id} das pastas informadas, subindo pela árvore com uma
+    consulta por nível, só pelos ancestrais necessários. A subida para na pasta
+    de um caso ou num ancestral fora de `recalcular`, cujo caso gravado vale.
+    """
+    resultado, linhas, pastas_de_caso = {}, {}, {}
+    pendentes = {pasta_id: pasta_id for pasta_id in pasta_ids}  # pasta -> ancestral atual
+    for _ in range(PROFUNDIDADE_MAXIMA):
+        if not pendentes:
+            break
+        novas = set(pendentes.values()) - linhas.keys()
+        for lote in _em_lotes(novas):
+            for item_id, unique_id, pai_id, caso_id in ArquivoSharePoint.objects.filter(pasta=True, item_id__in=lote).values_list(
+                'item_id', 'sharepoint_unique_id', 'pai_id', 'caso_id'
+            ):
+                linhas[item_id] = (unique_id, pai_id, caso_id)
+        pastas_de_caso.update(_casos_com_pasta(novas | {linhas[i][0] for i in novas if i in linhas and linhas[i][0]}))
+        proximos = {}
+        for origem, atual in pendentes.items():
+            linha = linhas.get(atual)
+            if linha is None:
+                # Ancestral desconhecido (ex: raiz do drive): fora de qualquer caso
+                resultado[origem] = None
+                continue
+            unique_id, pai_id, caso_salvo = linha
+            caso_id = pastas_de_caso.get(atual) or pastas_de_caso.get(unique_id)
+            if caso_id:
+                resultado[origem] = caso_id
+            elif atual != origem and atual not in recalcular:
+                resultado[origem] = caso_salvo
+            else:
+                proximos[origem] = pai_id
+        pendentes = proximos
+    for origem in pendentes:
+        resultado[origem] = None
+    return resultado
+
+def _atualizar_caso(item_ids_por_caso, **filtros):
+    for caso_id, item_ids in item_ids_por_caso.items():
+        for lote in _em_lotes(item_ids):
+            ArquivoSharePoint.objects.filter(item_id__in=lote, **filtros).update(caso_id=caso_id)
+
+def _resolver_casos(pastas, pais_de_arquivos=()):
+    """
+    Liga ao caso certo (a pasta do caso que as contém, em qualquer nível) as
+    pastas informadas e os arquivos das pastas em `pais_de_arquivos`.
+
+    Só são lidos os ancestrais dessas pastas. Quando o caso de uma pasta muda
+    (pasta nova, movida ou que virou pasta de um caso), a mudança desce para
+    as subpastas e arquivos dela.
+    """
+    pastas = set(pastas)
+    casos = _casos_das_pastas(pastas, recalcular=pastas)
+    salvos = {}
+    for lote in _em_lotes(pastas):
+        salvos.update(ArquivoSharePoint.objects.filter(pasta=True, item_id__in=lote).values_list('item_id', 'caso_id'))
+
+    mudaram = {pasta_id: caso_id for pasta_id, caso_id in casos.items() if pasta_id in salvos and salvos[pasta_id] != caso_id}
+    pais_de_arquivos = set(pais_de_arquivos)
+    fronteira = mudaram
+    while fronteira:
+        pais_de_arquivos |= fronteira.keys()
+        por_caso = defaultdict(list)
+        for pasta_id, caso_id in fronteira.items():
+            por_caso[caso_id].append(pasta_id)
+        _atualizar_caso(por_caso, pasta=True)
+        # Subpastas herdam o caso, exceto as que são pasta de outro caso
+        filhas = []
+        for lote in _em_lotes(fronteira):
+            filhas += ArquivoSharePoint.objects.filter(pasta=True, pai_id__in=lote).values_list('item_id', 'sharepoint_unique_id', 'pai_id', 'caso_id')
+        de_caso = _casos_com_pasta({f[0] for f in filhas} | {f[1] for f in filhas if f[1]})
+        fronteira = {
+            item_id: fronteira[pai_id]
+            for item_id, unique_id, pai_id, caso_id in filhas
+            if item_id not in de_caso and unique_id not in de_caso and caso_id != fronteira[pai_id]
+        }
+
+    # Os arquivos herdam o caso da pasta onde estão (sem pasta conhecida, nenhum)
+    caso_da_pasta = ArquivoSharePoint.objects.filter(pasta=True, item_id=OuterRef('pai_id')).values('caso_id')[:1]
+    for lote in _em_lotes(pais_de_arquivos):
+        ArquivoSharePoint.objects.filter(pasta=False, pai_id__in=lote).update(caso_id=Subquery(caso_da_pasta))
+
+def _pastas_de_caso_sem_caso():
+    """Pastas que viraram pasta de um caso depois de sincronizadas (ainda sem caso no índice)."""
+    pastas_dos_casos = Caso.objects.exclude(sharepoint_folder_id__isnull=True).exclude(sharepoint_folder_id='').values('sharepoint_folder_id')
+    return set(
+        ArquivoSharePoint.objects.filter(pasta=True, caso__isnull=True)
+        .filter(Q(item_id__in=pastas_dos_casos) | Q(sharepoint_unique_id__in=pastas_dos_casos))
+        .values_list('item_id', flat=True)
+    )
+
+def _ler_delta(estado, agora):
+    url = estado.delta_link or f"/drives/{estado.drive_id}/root/delta?$select={DELTA_CAMPOS}"
+    total = 0
+    while True:
+        response = graph_request('GET', url)
+        if response.status_code == 410:
+            raise DeltaExpirado()
+        response.raise_for_status()
+        dados = response.json()
+        itens = dados.get('value', [])
+        total += len(itens)
+        with transaction.atomic():
+            # Cada página resolve os casos só das pastas e arquivos que trouxe
+            _resolver_casos(*_aplicar_pagina(itens, agora))
+        if '@odata.nextLink' in dados:
+            url = dados['@odata.nextLink']
+            continue
+        return dados.get('@odata.deltaLink', ''), total
+
+def sincronizar_drive():
+    """
+    Aplica no espelho local as mudanças do drive desde a última execução.
+
+    Na primeira execução (ou se o deltaLink expirar) o drive inteiro é lido e os
+    itens que não vieram na leitura são removidos do espelho. Retorna o número
+    de itens recebidos do Graph. Sem SHAREPOINT_DRIVE_ID configurado não há o
+    que sincronizar: retorna 0.
+    """
+    if not microsoft_graph_service.DRIVE_ID:
+        print("Sincronização do drive: SHAREPOINT_DRIVE_ID não configurado; nada a sincronizar.")
+        return 0
+    estado, _ = SincronizacaoDrive.objects.get_or_create(drive_id=microsoft_graph_service.DRIVE_ID)
+    agora = timezone.now()
+    completa = not estado.delta_link
+    try:
+        delta_link, total = _ler_delta(estado, agora)
+    except DeltaExpirado:
+        print("Sincronização do drive: deltaLink expirado, lendo o drive inteiro novamente.")
+        estado.delta_link, completa = '', True
+        delta_link, total = _ler_delta(estado, agora)
+
+    with transaction.atomic():
+        if completa:
+            ArquivoSharePoint.objects.filter(data_sincronizacao__lt=agora).delete()
+        # Roda sempre: um caso pode ter recebido a pasta depois que ela foi sincronizada
+        _resolver_casos(_pastas_de_caso_sem_caso())
+        estado.delta_link = delta_link
+        estado.ultima_sincronizacao = agora
+        estado.save(update_fields=['delta_link', 'ultima_sincronizacao'])
+
+    if total:
+        microsoft_graph_service.invalidar_todas_listagens()
+    return total
+
+
+# --- CONSULTAS ---
+
+def _como_item_graph(arquivo):
+    """Converte o registro local no formato de item que as telas já usam (o mesmo do Graph)."""
+    item = {
+        'id': arquivo.item_id,
+        'name': arquivo.nome,
+        'size': arquivo.tamanho,
+        'webUrl': arquivo.web_url,
+        'lastModifiedDateTime': arquivo.data_modificacao.isoformat() if arquivo.data_modificacao else None,
+    }
+    if arquivo.pasta:
+        item['folder'] = {'childCount': arquivo.filhos}
+    else:
+        item['file'] = {}
+        # O link de download do Graph expira; a view gera um novo na hora do clique
+        item['@microsoft.graph.downloadUrl'] = reverse('casos:download_arquivo', args=[arquivo.item_id])
+    return item
+
+def _com_filhos(queryset):
+    filhos = (
+        ArquivoSharePoint.objects.filter(pai_id=OuterRef('item_id'))
+        .order_by().values('pai_id').annotate(total=Count('pk')).values('total')
+    )
+    return queryset.annotate(filhos=Coalesce(Subquery(filhos), 0))
+
+def _pastas_indexadas(folder_ids):
+    """Mapeia os IDs recebidos (item do drive ou UniqueId do SharePoint) para o item_id da pasta."""
+    mapa = {}
+    for item_id, unique_id in ArquivoSharePoint.objects.filter(pasta=True).filter(
+        Q(item_id__in=folder_ids) | Q(sharepoint_unique_id__in=folder_ids)
+    ).values_list('item_id', 'sharepoint_unique_id'):
+        mapa[item_id if item_id in folder_ids else unique_id] = item_id
+    return mapa
+
+def listar_pastas(folder_ids):
+    """
+    Lista o conteúdo das pastas a partir do espelho local. Retorna {folder_id: [itens]}
+    apenas para as pastas que já estão indexadas; as demais ficam de fora.
+    """
+    folder_ids = list(dict.fromkeys(folder_ids))
+    mapa = _pastas_indexadas(folder_ids)
+    resultado = {folder_id: [] for folder_id in mapa}
+    por_item = defaultdict(list)
+    for folder_id, item_id in mapa.items():
+        por_item[item_id].append(folder_id)
+    for arquivo in _com_filhos(ArquivoSharePoint.objects.filter(pai_id__in=por_item)):
+        for folder_id in por_item[arquivo.pai_id]:
+            resultado[folder_id].append(_como_item_graph(arquivo))
+    return resultado
+
+def listar_pasta(folder_id):
+    """Conteúdo de uma pasta pelo espelho local, ou None se ela ainda não foi sincronizada."""
+    return listar_pastas([folder_id]).get(folder_id)
+
+def contar_arquivos_por_caso(caso_ids):
+    """Retorna {caso_id: quantidade de arquivos} (pastas não entram na conta)."""
+    return dict(
+        ArquivoSharePoint.objects.filter(caso_id__in=caso_ids, pasta=False)
+        .values('caso_id').annotate(total=Count('pk')).values_list('caso_id', 'total')
+    )
+
+def buscar_arquivos(termo, caso=None, limite=50):
+    """Busca arquivos pelo nome em todos os casos (ou só no caso informado)."""
+    queryset = ArquivoSharePoint.objects.filter(pasta=False, nome__icontains=termo).select_related('caso')
+    if caso is not None:
+        queryset = queryset.filter(caso=caso)
+    return list(queryset.order_by('nome')[:limite])
@@ -4,9 +4,8 @@ from django.conf import settings
 from django.urls import reverse
 from datetime import datetime, timedelta
 from django.utils import timezone  # <<< LINHA ADICIONADA AQUI
-import requests
-import json
 from casos.models import GraphWebhookSubscription
+from casos.microsoft_graph_service import DRIVE_ID, DRIVE_WEBHOOK_CLIENT_STATE, get_app_graph_token, graph_request
 
 User = get_user_model()
 
@@ -30,23 +29,13 @@ class Command(BaseCommand):
             except GraphWebhookSubscription.DoesNotExist:
                 self.create_subscription(user)
 
+        self.manage_drive_subscription()
+
         self.stdout.write(self.style.SUCCESS("Gerenciamento de webhooks concluído."))
 
     def get_app_token(self):
-        client_id = settings.AUTH_ADFS.get('CLIENT_ID')
-        client_secret = settings.AUTH_ADFS.get('CLIENT_SECRET')
-        tenant_id = settings.AUTH_ADFS.get('TENANT_ID')
-        
-        token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-        payload = {
-            'client_id': client_id,
-            'client_secret': client_secret,
-            'grant_type': 'client_credentials',
-            'scope': 'https://graph.microsoft.com/.default'
-        }
-        response = requests.post(token_url, data=payload)
-        response.raise_for_status()
-        return response.json().get('access_token')
+        # Reaproveita o token de aplicação em cache (compartilhado com a web e o Celery)
+        return get_app_graph_token()
 
     def create_subscription(self, user):
         token = self.get_app_token()
@@ -58,8 +47,7 @@ class Command(BaseCommand):
             self.stderr.write("ERRO: WEBHOOK_BASE_URL não está definido no seu .env. Não é possível criar webhooks.")
             return
         
-        url = "https://graph.microsoft.com/v1.0/subscriptions"
-        headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        url = "/subscriptions"
         
         notification_url = f"{settings.WEBHOOK_BASE_URL}{reverse('casos:microsoft_graph_webhook')}"
 
@@ -72,7 +60,7 @@ class Command(BaseCommand):
         }
 
         self.stdout.write(f"Criando nova assinatura para {user.username}...")
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        response = graph_request('POST', url, token=token, json=payload)
 
         if response.status_code == 201:
             data = response.json()
@@ -86,4 +74,42 @@ class Command(BaseCommand):
             self.stderr.write(f"Falha ao criar assinatura para {user.username}: {response.text}")
 
     def renew_subscription(self, subscription):
-        self.stdout.write(f"Lógica de renovação para {subscription.user.username} a ser implementada.")
\ No newline at end of file
+        self.stdout.write(f"Lógica de renovação para {subscription.user.username} a ser implementada.")
+
+    def manage_drive_subscription(self):
+        """Cria ou renova a assinatura de alterações do drive (invalida o cache das pastas)."""
+        if not settings.WEBHOOK_BASE_URL or not DRIVE_ID:
+            self.stderr.write("WEBHOOK_BASE_URL ou SHAREPOINT_DRIVE_ID não definidos. Assinatura do drive ignorada.")
+            return
+
+        resource = f"drives/{DRIVE_ID}/root"
+        # O Graph aceita no máximo ~29 dias para assinaturas de driveItem
+        expiration = (datetime.utcnow() + timedelta(days=25)).isoformat() + "Z"
+
+        response = graph_request('GET', "/subscriptions")
+        response.raise_for_status()
+        existente = next(
+            (a for a in response.json().get('value', []) if a.get('resource', '').strip('/').lower() == resource.lower()),
+            None
+        )
+
+        if existente:
+            response = graph_request('PATCH', f"/subscriptions/{existente['id']}", json={"expirationDateTime": expiration})
+            if response.status_code == 200:
+                self.stdout.write(self.style.SUCCESS(f"Assinatura do drive renovada (ID: {existente['id']})"))
+            else:
+                self.stderr.write(f"Falha ao renovar a assinatura do drive: {response.text}")
+            return
+
+        payload = {
+            "changeType": "updated",
+            "notificationUrl": f"{settings.WEBHOOK_BASE_URL}{reverse('casos:microsoft_graph_webhook')}",
+            "resource": resource,
+            "expirationDateTime": expiration,
+            "clientState": DRIVE_WEBHOOK_CLIENT_STATE,
+        }
+        response = graph_request('POST', "/subscriptions", json=payload)
+        if response.status_code == 201:
+            self.stdout.write(self.style.SUCCESS(f"Assinatura do drive criada (ID: {response.json()['id']})"))
+        else:
+            self.stderr.write(f"Falha ao criar a assinatura do drive: {response.text}")
@@ -0,0 +1,18 @@
+# casos/management/commands/recalcular_titulos_casos.py
+
+from django.core.management.base import BaseCommand
+
+from casos.titulos import recalcular_titulos
+
+
+class Command(BaseCommand):
+    help = 'Refaz o título dos casos pelo formato das regras de campos (RegraCampo.formato_titulo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cliente', type=int, help='ID do cliente (padrão: todos).')
+        parser.add_argument('--produto', type=int, help='ID do produto (padrão: todos).')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Recalculando os títulos dos casos...")
+        alterados = recalcular_titulos(cliente_id=options['cliente'], produto_id=options['produto'])
+        self.stdout.write(self.style.SUCCESS(f"{alterados} título(s) atualizado(s)!"))
@@ -0,0 +1,29 @@
+# casos/management/commands/reconstruir_busca_casos.py
+
+from django.core.management.base import BaseCommand
+
+from casos.busca import TAMANHO_LOTE, atualizar_documentos_busca, reindexar_campo
+from casos.models import Campo, Caso
+
+
+class Command(BaseCommand):
+    help = 'Gera (ou refaz) os dados da pesquisa de casos: o documento de busca de cada caso e a projeção dos campos pesquisáveis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faltantes', action='store_true', help='Processa apenas os casos que ainda não têm documento de busca.')
+
+    def handle(self, *args, **options):
+        casos = Caso.objects.order_by('id')
+        if options['faltantes']:
+            casos = casos.filter(documento_busca__isnull=True)
+        caso_ids = list(casos.values_list('id', flat=True))
+
+        self.stdout.write(f"Atualizando o documento de busca de {len(caso_ids)} caso(s)...")
+        for i in range(0, len(caso_ids), TAMANHO_LOTE):
+            atualizar_documentos_busca(caso_ids[i:i + TAMANHO_LOTE])
+            self.stdout.write(f"  -> {min(i + TAMANHO_LOTE, len(caso_ids))}/{len(caso_ids)}")
+        if not options['faltantes']:
+            for campo in Campo.objects.filter(pesquisavel=True):
+                self.stdout.write(f"Refazendo a projeção do campo '{campo.nome_tecnico}'...")
+                reindexar_campo(campo)
+        self.stdout.write(self.style.SUCCESS("Dados de pesquisa atualizados!"))
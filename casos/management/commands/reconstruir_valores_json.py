@@ -0,0 +1,25 @@
+# casos/management/commands/reconstruir_valores_json.py
+
+from django.core.management.base import BaseCommand
+
+from casos.models import Caso, ValorCampoCaso
+from casos.valores_campos import TAMANHO_LOTE, atualizar_valores_json
+
+
+class Command(BaseCommand):
+    help = 'Gera (ou refaz) a cópia dos campos customizados de cada caso (Caso.valores_json).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faltantes', action='store_true', help='Processa apenas os casos com campos preenchidos e JSON ainda vazio.')
+
+    def handle(self, *args, **options):
+        casos = Caso.objects.order_by('id')
+        if options['faltantes']:
+            casos = casos.filter(valores_json={}, pk__in=ValorCampoCaso.objects.values('caso_id'))
+        caso_ids = list(casos.values_list('id', flat=True))
+
+        self.stdout.write(f"Atualizando os campos customizados de {len(caso_ids)} caso(s)...")
+        for i in range(0, len(caso_ids), TAMANHO_LOTE):
+            atualizar_valores_json(caso_ids[i:i + TAMANHO_LOTE])
+            self.stdout.write(f"  -> {min(i + TAMANHO_LOTE, len(caso_ids))}/{len(caso_ids)}")
+        self.stdout.write(self.style.SUCCESS("Campos customizados atualizados!"))
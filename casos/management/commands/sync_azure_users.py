@@ -2,27 +2,13 @@
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from django.conf import settings
-import requests
+from casos.microsoft_graph_service import get_app_graph_token, graph_request
 
 User = get_user_model()
 
 def get_app_token():
-    # Esta função busca um token de aplicativo para o MS Graph
-    client_id = settings.AUTH_ADFS.get('CLIENT_ID')
-    client_secret = settings.AUTH_ADFS.get('CLIENT_SECRET')
-    tenant_id = settings.AUTH_ADFS.get('TENANT_ID')
-    
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-    payload = {
-        'client_id': client_id,
-        'client_secret': client_secret,
-        'grant_type': 'client_credentials',
-        'scope': 'https://graph.microsoft.com/.default'
-    }
-    response = requests.post(token_url, data=payload)
-    response.raise_for_status()
-    return response.json().get('access_token')
+    # Esta função busca um token de aplicativo para o MS Graph (reaproveitando o cache compartilhado)
+    return get_app_graph_token()
 
 class Command(BaseCommand):
     help = 'Sincroniza os usuários do Azure AD com a base de dados do Django.'
@@ -35,16 +21,15 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR("Falha ao obter token de acesso."))
             return
 
-        headers = {'Authorization': f'Bearer {token}'}
         # O $select garante que estamos pedindo apenas os campos que precisamos
         # O $filter=accountEnabled eq true garante que pegamos apenas usuários ativos
-        url = "https://graph.microsoft.com/v1.0/users?$select=id,userPrincipalName,givenName,surname,mail,accountEnabled&$filter=accountEnabled eq true"
+        url = "/users?$select=id,userPrincipalName,givenName,surname,mail,accountEnabled&$filter=accountEnabled eq true"
         
         created_count = 0
         updated_count = 0
 
         while url:
-            response = requests.get(url, headers=headers)
+            response = graph_request('GET', url, token=token, timeout=30)
             response.raise_for_status()
             data = response.json()
             
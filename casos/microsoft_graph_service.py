@@ -1,8 +1,20 @@
+import asyncio
+import base64
+import hashlib
 import os
+import threading
+import time
+import weakref
+from urllib.parse import quote
 import requests
+import httpx
 import msal
 import certifi
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth import get_user_model
@@ -23,16 +35,292 @@ SHAREPOINT_DOC_LIBRARY = "Documentos" # Nome da sua biblioteca de documentos pri
 
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 SCOPES = ["https://graph.microsoft.com/.default"]
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0"
 
-# --- FUNÇÕES DE TOKEN (Inalteradas) ---
+# --- CONFIGURAÇÕES DO POOL HTTP ---
+GRAPH_POOL_SIZE = getattr(settings, 'GRAPH_POOL_SIZE', 10)
+GRAPH_TIMEOUT = getattr(settings, 'GRAPH_TIMEOUT', 15)
+GRAPH_MAX_RETRIES = getattr(settings, 'GRAPH_MAX_RETRIES', 3)
+GRAPH_BATCH_LIMITE = 20  # Limite do Graph para sub-requisições em um único /$batch
+# Arquivos até este tamanho podem ser enviados dentro de um /$batch (corpo em base64)
+GRAPH_BATCH_UPLOAD_MAX = getattr(settings, 'GRAPH_BATCH_UPLOAD_MAX', 2 * 1024 * 1024)
 
-def get_app_graph_token():
-    """Obtém um token de acesso para a APLICAÇÃO (não para um usuário específico)."""
-    app = msal.ConfidentialClientApplication(CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET)
-    result = app.acquire_token_for_client(scopes=SCOPES)
-    if "access_token" in result:
-        return result['access_token']
-    raise Exception(f"Não foi possível obter o token de acesso da aplicação: {result.get('error_description')}")
+# --- UPLOAD EM PARTES (createUploadSession) ---
+# Acima deste tamanho o arquivo é enviado por sessão de upload, em blocos
+GRAPH_UPLOAD_SESSAO_MIN = getattr(settings, 'GRAPH_UPLOAD_SESSAO_MIN', 4 * 1024 * 1024)
+# Tamanho de cada bloco (o Graph exige múltiplos de 320 KiB). É o máximo mantido em memória por arquivo.
+GRAPH_UPLOAD_BLOCO = getattr(settings, 'GRAPH_UPLOAD_BLOCO', 16 * 320 * 1024)
+GRAPH_UPLOAD_TIMEOUT = getattr(settings, 'GRAPH_UPLOAD_TIMEOUT', 120)
+
+# --- CACHE DAS LISTAGENS DE PASTAS ---
+GRAPH_LISTAGEM_TTL = getattr(settings, 'GRAPH_LISTAGEM_TTL', 120)  # segundos
+GRAPH_LISTAGEM_VERSAO_KEY = "graph:pastas:versao"
+# clientState usado na assinatura de notificações do drive (ver manage_webhooks)
+DRIVE_WEBHOOK_CLIENT_STATE = "AureonDriveClientState"
+
+# --- CACHE DO TOKEN DA APLICAÇÃO ---
+# O token de aplicação (client credentials) vale ~1h. Ele fica guardado em dois
+# níveis: em memória (por processo) e no cache do Django (Redis em produção),
+# para ser compartilhado entre os workers do gunicorn e o Celery.
+GRAPH_TOKEN_CACHE_KEY = f"graph:app_token:{TENANT_ID}:{CLIENT_ID}"
+# Renova o token alguns minutos antes de expirar, evitando usar um token vencendo no meio da chamada.
+GRAPH_TOKEN_MARGEM_RENOVACAO = getattr(settings, 'GRAPH_TOKEN_MARGEM_RENOVACAO', 300)
+
+_msal_app = None
+# Locks separados: get_app_graph_token segura _token_lock e chama _get_msal_app
+_msal_lock = threading.Lock()
+_token_lock = threading.Lock()
+_token_local = {'access_token': None, 'expira_em': 0}
+
+
+def _get_msal_app():
+    """Retorna a instância única (por processo) do MSAL ConfidentialClientApplication."""
+    global _msal_app
+    if _msal_app is None:
+        with _msal_lock:
+            if _msal_app is None:
+                _msal_app = msal.ConfidentialClientApplication(CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET)
+    return _msal_app
+
+
+def _token_valido(dados_token):
+    return bool(
+        dados_token
+        and dados_token.get('access_token')
+        and dados_token.get('expira_em', 0) - GRAPH_TOKEN_MARGEM_RENOVACAO > time.time()
+    )
+
+
+def _ler_token_compartilhado():
+    try:
+        return cache.get(GRAPH_TOKEN_CACHE_KEY)
+    except Exception as e:
+        # Se o Redis estiver fora do ar, seguimos apenas com o cache em memória.
+        print(f"Aviso: cache indisponível ao ler o token do Graph: {e}")
+        return None
+
+
+def _gravar_token_compartilhado(dados_token):
+    timeout = int(dados_token['expira_em'] - time.time() - GRAPH_TOKEN_MARGEM_RENOVACAO)
+    if timeout <= 0:
+        return
+    try:
+        cache.set(GRAPH_TOKEN_CACHE_KEY, dados_token, timeout=timeout)
+    except Exception as e:
+        print(f"Aviso: cache indisponível ao gravar o token do Graph: {e}")
+
+
+def invalidar_app_graph_token():
+    """Descarta o token em cache (ex: após um 401 do Graph)."""
+    with _token_lock:
+        _token_local['access_token'] = None
+        _token_local['expira_em'] = 0
+    try:
+        cache.delete(GRAPH_TOKEN_CACHE_KEY)
+    except Exception:
+        pass
+
+
+# --- SESSÃO HTTP COMPARTILHADA ---
+# Todas as chamadas ao Graph passam por uma única requests.Session por processo,
+# com pool de conexões keep-alive. Assim o handshake TLS com graph.microsoft.com
+# é feito uma vez por conexão do pool, e não a cada requisição.
+_sessao_graph = None
+_sessao_pid = None
+_sessao_lock = threading.Lock()
+_metricas_lock = threading.Lock()
+_metricas_graph = {'requisicoes': 0, 'erros': 0, 'tempo_total': 0.0}
+
+
+def get_graph_session():
+    """Retorna a sessão HTTP do Graph deste processo (recriada após um fork)."""
+    global _sessao_graph, _sessao_pid
+    if _sessao_graph is None or _sessao_pid != os.getpid():
+        with _sessao_lock:
+            if _sessao_graph is None or _sessao_pid != os.getpid():
+                retry = Retry(
+                    total=GRAPH_MAX_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 502, 503, 504),
+                    allowed_methods=frozenset(['GET', 'PUT', 'DELETE']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=GRAPH_POOL_SIZE, max_retries=retry)
+                sessao = requests.Session()
+                sessao.mount('https://', adapter)
+                sessao.verify = certifi.where()
+                _sessao_graph = sessao
+                _sessao_pid = os.getpid()
+    return _sessao_graph
+
+
+def _registrar_metrica(duracao, erro):
+    with _metricas_lock:
+        _metricas_graph['requisicoes'] += 1
+        _metricas_graph['tempo_total'] += duracao
+        if erro:
+            _metricas_graph['erros'] += 1
+
+
+def obter_metricas_graph():
+    """Retorna as métricas de uso do pool HTTP do Graph neste processo."""
+    with _metricas_lock:
+        metricas = dict(_metricas_graph)
+    conexoes_abertas = 0
+    sessao = _sessao_graph
+    if sessao is not None:
+        adapter = sessao.get_adapter('https://')
+        for chave in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(chave)
+            if pool is not None:
+                conexoes_abertas += pool.num_connections
+    metricas['conexoes_abertas'] = conexoes_abertas
+    metricas['tempo_medio'] = metricas['tempo_total'] / metricas['requisicoes'] if metricas['requisicoes'] else 0.0
+    # Quanto maior, mais requisições reaproveitaram uma conexão TLS já aberta
+    metricas['reuso_conexoes'] = (1 - conexoes_abertas / metricas['requisicoes']) if metricas['requisicoes'] else 0.0
+    return metricas
+
+
+def graph_request(method, url, token=None, autenticar=True, **kwargs):
+    """
+    Executa uma requisição ao Microsoft Graph pela sessão compartilhada.
+
+    Aceita URLs relativas (ex: "/drives/...") ou absolutas (ex: @odata.nextLink).
+    Sem `token`, usa o token da aplicação e, se o Graph responder 401, renova o
+    token uma única vez e repete a chamada. Com `autenticar=False` nenhum
+    cabeçalho Authorization é enviado (ex: URLs pré-assinadas de upload).
+    """
+    if not url.startswith('http'):
+        url = f"{GRAPH_BASE_URL}{url}"
+    kwargs.setdefault('timeout', GRAPH_TIMEOUT)
+    headers = dict(kwargs.pop('headers', None) or {})
+    usa_token_app = autenticar and token is None
+
+    tentativas = 2 if usa_token_app else 1
+    for tentativa in range(tentativas):
+        if autenticar:
+            headers['Authorization'] = f"Bearer {token if not usa_token_app else get_app_graph_token()}"
+        inicio = time.monotonic()
+        try:
+            response = get_graph_session().request(method, url, headers=headers, **kwargs)
+        except requests.exceptions.RequestException:
+            _registrar_metrica(time.monotonic() - inicio, erro=True)
+            raise
+        _registrar_metrica(time.monotonic() - inicio, erro=response.status_code >= 400)
+        if response.status_code == 401 and usa_token_app and tentativa == 0:
+            invalidar_app_graph_token()
+            continue
+        return response
+    return response
+
+
+# --- LOTES (JSON $batch) ---
+_STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+
+def _montar_subrequisicao(indice, requisicao):
+    sub = {'id': str(indice), 'method': requisicao['method'], 'url': requisicao['url']}
+    if 'body' in requisicao:
+        sub['body'] = requisicao['body']
+        sub['headers'] = requisicao.get('headers') or {'Content-Type': 'application/json'}
+    elif requisicao.get('headers'):
+        sub['headers'] = requisicao['headers']
+    return sub
+
+
+def _segundos_retry_after(headers):
+    for chave, valor in (headers or {}).items():
+        if chave.lower() == 'retry-after':
+            try:
+                return int(valor)
+            except (TypeError, ValueError):
+                return 0
+    return 0
+
+
+def executar_lote_graph(requisicoes, max_tentativas=3):
+    """
+    Executa várias chamadas ao Graph pelo endpoint JSON /$batch.
+
+    `requisicoes` é uma lista de dicts com 'method', 'url' (relativa à versão da
+    API, ex: "/drives/..."), e opcionalmente 'body' e 'headers'. As chamadas são
+    agrupadas de 20 em 20 e apenas as que falharem com erro transitório (429/5xx)
+    são reenviadas, respeitando o Retry-After.
+
+    Retorna uma lista na mesma ordem da entrada, com dicts {'status', 'body', 'headers'}.
+    Sub-requisições que não puderam ser executadas voltam com status None.
+    """
+    respostas = [None] * len(requisicoes)
+    pendentes = list(range(len(requisicoes)))
+
+    for tentativa in range(max_tentativas):
+        if not pendentes:
+            break
+        repetir, espera = [], 0
+        for inicio in range(0, len(pendentes), GRAPH_BATCH_LIMITE):
+            grupo = pendentes[inicio:inicio + GRAPH_BATCH_LIMITE]
+            payload = {'requests': [_montar_subrequisicao(i, requisicoes[i]) for i in grupo]}
+            try:
+                response = graph_request('POST', '/$batch', json=payload, timeout=GRAPH_TIMEOUT * 4)
+            except requests.exceptions.RequestException as e:
+                print(f"Erro de rede ao executar lote no Graph: {e}")
+                repetir.extend(grupo)
+                continue
+            if response.status_code != 200:
+                print(f"Lote rejeitado pelo Graph ({response.status_code}): {response.text[:200]}")
+                repetir.extend(grupo)
+                espera = max(espera, _segundos_retry_after(response.headers))
+                continue
+            for sub in response.json().get('responses', []):
+                indice = int(sub['id'])
+                resposta = {'status': sub.get('status'), 'body': sub.get('body'), 'headers': sub.get('headers') or {}}
+                respostas[indice] = resposta
+                if resposta['status'] in _STATUS_REPETIVEIS:
+                    repetir.append(indice)
+                    espera = max(espera, _segundos_retry_after(resposta['headers']))
+        pendentes = sorted(repetir)
+        if pendentes and tentativa < max_tentativas - 1:
+            time.sleep(min(espera or 2 ** tentativa, 30))
+
+    return [r if r is not None else {'status': None, 'body': None, 'headers': {}} for r in respostas]
+
+
+# --- FUNÇÕES DE TOKEN ---
+
+def get_app_graph_token(forcar_renovacao=False):
+    """
+    Obtém um token de acesso para a APLICAÇÃO (não para um usuário específico).
+
+    O token é reaproveitado enquanto for válido: primeiro do cache em memória do
+    processo, depois do cache compartilhado do Django. Só quando ambos estão
+    vencidos (ou perto de vencer) é feita a chamada ao Azure AD.
+    """
+    if not forcar_renovacao and _token_valido(_token_local):
+        return _token_local['access_token']
+
+    app = _get_msal_app()
+    with _token_lock:
+        # Outra thread pode ter renovado o token enquanto esperávamos o lock.
+        if not forcar_renovacao:
+            if _token_valido(_token_local):
+                return _token_local['access_token']
+            dados_compartilhados = _ler_token_compartilhado()
+            if _token_valido(dados_compartilhados):
+                _token_local.update(dados_compartilhados)
+                return _token_local['access_token']
+
+        result = app.acquire_token_for_client(scopes=SCOPES)
+        if "access_token" not in result:
+            raise Exception(f"Não foi possível obter o token de acesso da aplicação: {result.get('error_description')}")
+
+        dados_token = {
+            'access_token': result['access_token'],
+            'expira_em': time.time() + int(result.get('expires_in', 3599)),
+        }
+        _token_local.update(dados_token)
+        _gravar_token_compartilhado(dados_token)
+        return dados_token['access_token']
 
 def get_user_graph_token(user):
     """Busca o token de acesso do Microsoft Graph para um usuário específico."""
@@ -41,9 +329,9 @@ def get_user_graph_token(user):
         
         if social_token.expires_at <= timezone.now():
             print(f"Token para {user.username} expirado. Renovando...")
-            app = msal.ConfidentialClientApplication(
-                CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET
-            )
+            # Instância própria: o cache de tokens da instância da aplicação não
+            # deve receber tokens de usuários
+            app = msal.ConfidentialClientApplication(CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET)
             result = app.acquire_token_by_refresh_token(
                 social_token.token_secret, 
                 scopes=settings.SOCIALACCOUNT_PROVIDERS['microsoft']['SCOPE']
@@ -70,14 +358,80 @@ def get_user_graph_token(user):
 # FUNÇÕES DO SHAREPOINT (REESCRITAS COM A NOVA BIBLIOTECA)
 # ==============================================================================
 
-def get_sharepoint_context():
-    """Cria e retorna um contexto autenticado para interagir com o SharePoint."""
-    site_url = f"https://{SHAREPOINT_SITE_URL}"
-    auth_context = AuthenticationContext(url=site_url)
-    auth_context.acquire_token_for_app(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-    ctx = ClientContext(site_url, auth_context)
+_TABELA_NOME_PASTA = str.maketrans({c: '-' for c in '<>:"/\\|?*'})
+
+def sanitizar_nome_pasta(nome):
+    """Troca por '-' os caracteres que o SharePoint não aceita em nomes de pasta."""
+    return nome.translate(_TABELA_NOME_PASTA)
+
+# O contexto autenticado é reaproveitado por thread (o ClientContext guarda a fila
+# de consultas pendentes, então não pode ser dividido entre threads) e recriado
+# antes de o token do SharePoint vencer.
+SHAREPOINT_CONTEXTO_TTL = 45 * 60  # segundos
+_sharepoint_local = threading.local()
+
+def get_sharepoint_context(novo=False):
+    """Retorna um contexto autenticado para interagir com o SharePoint."""
+    ctx, criado_em = getattr(_sharepoint_local, 'contexto', (None, 0))
+    if ctx is None or novo or time.monotonic() - criado_em > SHAREPOINT_CONTEXTO_TTL:
+        site_url = f"https://{SHAREPOINT_SITE_URL}"
+        auth_context = AuthenticationContext(url=site_url)
+        auth_context.acquire_token_for_app(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
+        ctx = ClientContext(site_url, auth_context)
+        _sharepoint_local.contexto = (ctx, time.monotonic())
+        _sharepoint_local.raiz_biblioteca = None
     return ctx
 
+def _url_raiz_biblioteca(ctx):
+    """URL relativa ao servidor da pasta raiz da biblioteca (ex: /sites/x/Documentos Compartilhados)."""
+    raiz = getattr(_sharepoint_local, 'raiz_biblioteca', None)
+    if not raiz:
+        pasta = ctx.web.lists.get_by_title(SHAREPOINT_DOC_LIBRARY).root_folder.get().execute_query()
+        raiz = pasta.properties.get('ServerRelativeUrl', '').rstrip('/')
+        _sharepoint_local.raiz_biblioteca = raiz
+    return raiz
+
+def _provisionar_em_lote(estruturas, tentativas=2):
+    """Um único $batch para todas as estruturas. Retorna a lista de pastas ou None se o lote falhar."""
+    for tentativa in range(tentativas):
+        try:
+            ctx = get_sharepoint_context(novo=tentativa > 0)
+            raiz = _url_raiz_biblioteca(ctx)
+            pastas = []
+            for nome_pasta, subpastas in estruturas:
+                # As operações do lote rodam em ordem: a pasta do caso existe antes das subpastas
+                pastas.append(ctx.web.folders.add(f"{raiz}/{nome_pasta}"))
+                for nome_sub in subpastas:
+                    ctx.web.folders.add(f"{raiz}/{nome_pasta}/{nome_sub}")
+            ctx.execute_batch()
+            return [{"id": pasta.unique_id, "webUrl": pasta.properties.get('ServerRelativeUrl')} for pasta in pastas]
+        except Exception as e:
+            print(f"ERRO [Office365 Lib] ao provisionar {len(estruturas)} pasta(s) em lote (tentativa {tentativa + 1}): {e}")
+            # Descarta o contexto (e a fila pendente); a próxima tentativa autentica de novo
+            _sharepoint_local.contexto = (None, 0)
+    return None
+
+def provisionar_pastas_casos(estruturas):
+    """
+    Cria, em um único $batch do SharePoint, a pasta de cada caso e as suas subpastas.
+
+    `estruturas` é uma lista de tuplas (nome_pasta, [nomes_subpastas]).
+    Retorna uma lista, na mesma ordem, com {"id", "webUrl"} da pasta principal
+    ou None para os casos que falharam. Se o lote falhar, cada caso é refeito
+    sozinho: um caso com problema não impede os outros do lote. Pastas que já
+    existem são reaproveitadas, então repetir o provisionamento é seguro.
+    """
+    if not estruturas:
+        return []
+    pastas = _provisionar_em_lote(estruturas)
+    if pastas is not None:
+        print(f"Estrutura de {len(estruturas)} pasta(s) de caso criada no SharePoint em lote.")
+        return pastas
+    if len(estruturas) == 1:
+        return [None]
+    print(f"Lote de {len(estruturas)} pasta(s) falhou; criando uma a uma.")
+    return [(_provisionar_em_lote([estrutura], tentativas=1) or [None])[0] for estrutura in estruturas]
+
 def criar_pasta_caso(nome_pasta):
     """Cria a pasta principal para um caso na raiz da biblioteca de documentos."""
     try:
@@ -91,10 +445,16 @@ def criar_pasta_caso(nome_pasta):
         }
     except Exception as e:
         print(f"ERRO [Office365 Lib] ao criar pasta principal: {e}")
+        _sharepoint_local.contexto = (None, 0)
         return None
 
 def criar_subpastas(id_pasta_pai, nomes_subpastas):
-    """Cria subpastas dentro de uma pasta pai, usando o ID único da pasta."""
+    """
+    Cria subpastas dentro de uma pasta pai, usando o ID único da pasta.
+
+    O ID vem da API REST do SharePoint (criar_pasta_caso), por isso esta função
+    usa o $batch do próprio SharePoint: todas as subpastas vão em uma única chamada.
+    """
     try:
         ctx = get_sharepoint_context()
         pasta_pai = ctx.web.get_folder_by_id(id_pasta_pai)
@@ -102,74 +462,388 @@ def criar_subpastas(id_pasta_pai, nomes_subpastas):
         for nome in nomes_subpastas:
             pasta_pai.folders.add(nome)
         
-        ctx.execute_query()
+        ctx.execute_batch()
         print(f"Subpastas {nomes_subpastas} criadas com sucesso dentro da pasta ID {id_pasta_pai}.")
         return True
     except Exception as e:
         print(f"ERRO [Office365 Lib] ao criar subpastas: {e}")
+        _sharepoint_local.contexto = (None, 0)
         return False
 
+# --- CACHE DAS LISTAGENS ---
+# O conteúdo de cada pasta fica no cache por GRAPH_LISTAGEM_TTL segundos, pela
+# chave do drive item. Uploads, novas pastas e exclusões feitos pelo sistema
+# invalidam a pasta afetada; alterações feitas direto no SharePoint chegam pelo
+# webhook do drive, que invalida todas as listagens de uma vez (troca de versão).
+
+def _versao_listagens():
+    try:
+        return cache.get_or_set(GRAPH_LISTAGEM_VERSAO_KEY, 1, timeout=None)
+    except Exception:
+        return 1
+
+def _chave_listagem(folder_id):
+    return f"graph:pasta:{_versao_listagens()}:{folder_id}"
+
+def _chave_pasta_pai(item_id):
+    return f"graph:pai:{item_id}"
+
+def _ler_listagens_em_cache(folder_ids):
+    chaves = {_chave_listagem(folder_id): folder_id for folder_id in folder_ids}
+    try:
+        encontrados = cache.get_many(list(chaves))
+    except Exception:
+        return {}
+    return {chaves[chave]: itens for chave, itens in encontrados.items()}
+
+def _gravar_listagem_em_cache(folder_id, itens):
+    try:
+        cache.set(_chave_listagem(folder_id), itens, timeout=GRAPH_LISTAGEM_TTL)
+        # Guarda a pasta de cada item, para saber o que invalidar quando ele for deletado
+        cache.set_many({_chave_pasta_pai(item['id']): folder_id for item in itens if item.get('id')}, timeout=60 * 60 * 24)
+    except Exception as e:
+        print(f"Aviso: cache indisponível ao gravar a listagem da pasta {folder_id}: {e}")
+
+def invalidar_listagem(*folder_ids):
+    """Descarta do cache a listagem das pastas informadas."""
+    try:
+        cache.delete_many([_chave_listagem(folder_id) for folder_id in folder_ids if folder_id])
+    except Exception:
+        pass
+
+def invalidar_listagem_do_item(item_id):
+    """Descarta a listagem da pasta onde o item estava (e a do próprio item, se for pasta)."""
+    try:
+        pasta_pai = cache.get(_chave_pasta_pai(item_id))
+    except Exception:
+        pasta_pai = None
+    invalidar_listagem(pasta_pai, item_id)
+
+def invalidar_todas_listagens():
+    """Invalida todas as listagens em cache (ex: notificação de mudança no drive)."""
+    try:
+        cache.incr(GRAPH_LISTAGEM_VERSAO_KEY)
+    except ValueError:
+        cache.set(GRAPH_LISTAGEM_VERSAO_KEY, 2, timeout=None)
+    except Exception:
+        pass
+
+# --- LISTAGEM ASSÍNCRONA (views async servidas pelo ASGI) ---
+# Um httpx.AsyncClient com pool keep-alive por event loop.
+_clientes_async = weakref.WeakKeyDictionary()
+
+def _get_cliente_async():
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        cliente = httpx.AsyncClient(
+            base_url=GRAPH_BASE_URL,
+            timeout=GRAPH_TIMEOUT,
+            verify=certifi.where(),
+            limits=httpx.Limits(max_connections=GRAPH_POOL_SIZE, max_keepalive_connections=GRAPH_POOL_SIZE),
+        )
+        _clientes_async[loop] = cliente
+    return cliente
+
+async def listar_arquivos_e_pastas_async(folder_id):
+    """Versão async de listar_arquivos_e_pastas (mesmo cache, sem bloquear o event loop)."""
+    em_cache = await sync_to_async(_ler_listagens_em_cache, thread_sensitive=False)([folder_id])
+    if folder_id in em_cache:
+        return em_cache[folder_id]
+
+    url = f"/drives/{DRIVE_ID}/items/{folder_id}/children"
+    for tentativa in range(2):
+        token = await sync_to_async(get_app_graph_token, thread_sensitive=False)()
+        inicio = time.monotonic()
+        try:
+            response = await _get_cliente_async().get(url, headers={'Authorization': f"Bearer {token}"})
+        except httpx.HTTPError as e:
+            _registrar_metrica(time.monotonic() - inicio, erro=True)
+            print(f"Erro ao listar a pasta {folder_id} no Graph: {e}")
+            return []
+        _registrar_metrica(time.monotonic() - inicio, erro=response.status_code >= 400)
+        if response.status_code == 401 and tentativa == 0:
+            await sync_to_async(invalidar_app_graph_token, thread_sensitive=False)()
+            continue
+        break
+
+    if response.status_code != 200:
+        return []
+    itens = response.json().get('value', [])
+    await sync_to_async(_gravar_listagem_em_cache, thread_sensitive=False)(folder_id, itens)
+    return itens
+
 # --- FUNÇÕES ANTIGAS (Mantidas por enquanto para não quebrar o resto do código) ---
 # --- Idealmente, estas também seriam migradas para a nova biblioteca ---
 
-def listar_arquivos_e_pastas(folder_id):
-    access_token = get_app_graph_token()
-    headers = {'Authorization': 'Bearer ' + access_token}
-    url = f"https://graph.microsoft.com/v1.0/drives/{DRIVE_ID}/items/{folder_id}/children"
+def listar_arquivos_e_pastas(folder_id, usar_cache=True):
+    if usar_cache:
+        em_cache = _ler_listagens_em_cache([folder_id])
+        if folder_id in em_cache:
+            return em_cache[folder_id]
+    url = f"/drives/{DRIVE_ID}/items/{folder_id}/children"
     try:
-        response = requests.get(url, headers=headers, verify=certifi.where(), timeout=15)
+        response = graph_request('GET', url)
         if response.status_code == 200:
-            return response.json().get('value', [])
+            itens = response.json().get('value', [])
+            _gravar_listagem_em_cache(folder_id, itens)
+            return itens
         return []
     except requests.exceptions.RequestException:
         return []
 
-def upload_arquivo(parent_folder_id, nome_arquivo, conteudo_arquivo):
-    access_token = get_app_graph_token()
-    headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/octet-stream'}
-    url = f"https://graph.microsoft.com/v1.0/drives/{DRIVE_ID}/items/{parent_folder_id}:/{nome_arquivo}:/content"
+def upload_arquivo(parent_folder_id, nome_arquivo, conteudo_arquivo, identificador=None):
+    """
+    Envia um arquivo para a pasta. `conteudo_arquivo` pode ser bytes ou um
+    arquivo (ex: UploadedFile); arquivos grandes seguem por sessão de upload.
+    `identificador` (ex: o pk do UploadAnexo) identifica o envio para retomá-lo.
+    """
+    tamanho = getattr(conteudo_arquivo, 'size', None)
+    if hasattr(conteudo_arquivo, 'read'):
+        if tamanho is not None and tamanho > GRAPH_UPLOAD_SESSAO_MIN:
+            return upload_arquivo_em_partes(parent_folder_id, nome_arquivo, conteudo_arquivo, tamanho, identificador=identificador)
+        conteudo_arquivo = conteudo_arquivo.read()
+    headers = {'Content-Type': 'application/octet-stream'}
+    url = f"/drives/{DRIVE_ID}/items/{parent_folder_id}:/{nome_arquivo}:/content"
     try:
-        response = requests.put(url, headers=headers, data=conteudo_arquivo, verify=certifi.where(), timeout=120)
-        return response.status_code == 201
+        response = graph_request('PUT', url, headers=headers, data=conteudo_arquivo, timeout=GRAPH_UPLOAD_TIMEOUT)
+        if response.status_code in (200, 201):
+            invalidar_listagem(parent_folder_id)
+            return True
+        return False
     except requests.exceptions.RequestException as e:
         print(f"Erro ao fazer upload do arquivo: {e}")
         return False
 
+def _hash_conteudo(arquivo):
+    """SHA-256 do conteúdo, lido em blocos (o arquivo volta para o início)."""
+    sha = hashlib.sha256()
+    arquivo.seek(0)
+    while True:
+        bloco = arquivo.read(GRAPH_UPLOAD_BLOCO)
+        if not bloco:
+            break
+        sha.update(bloco)
+    arquivo.seek(0)
+    return sha.hexdigest()
+
+def _chave_sessao_upload(parent_folder_id, nome_arquivo, tamanho, identificador):
+    # Nome e tamanho não bastam: outro arquivo com o mesmo nome e tamanho
+    # retomaria a sessão do anterior. Sem identificador, vale o hash do conteúdo.
+    return f"graph:upload_sessao:{parent_folder_id}:{quote(nome_arquivo)}:{tamanho}:{identificador}"
+
+def _ler_sessao_upload(chave_sessao):
+    try:
+        return cache.get(chave_sessao)
+    except Exception as e:
+        print(f"Aviso: cache indisponível ao ler a sessão de upload: {e}")
+        return None
+
+def _gravar_sessao_upload(chave_sessao, upload_url):
+    try:
+        # As sessões de upload do Graph expiram sozinhas; guardamos só por um dia
+        cache.set(chave_sessao, upload_url, timeout=60 * 60 * 24)
+    except Exception as e:
+        print(f"Aviso: cache indisponível ao gravar a sessão de upload: {e}")
+
+def _descartar_sessao_upload(chave_sessao):
+    try:
+        cache.delete(chave_sessao)
+    except Exception:
+        pass
+
+def criar_sessao_upload(parent_folder_id, nome_arquivo):
+    """Cria uma sessão de upload no Graph e retorna a uploadUrl (ou None)."""
+    url = f"/drives/{DRIVE_ID}/items/{parent_folder_id}:/{quote(nome_arquivo)}:/createUploadSession"
+    payload = {"item": {"@microsoft.graph.conflictBehavior": "replace"}}
+    try:
+        response = graph_request('POST', url, json=payload)
+        if response.status_code == 200:
+            return response.json().get('uploadUrl')
+        print(f"Falha ao criar sessão de upload ({response.status_code}): {response.text[:200]}")
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao criar sessão de upload: {e}")
+    return None
+
+def consultar_sessao_upload(upload_url):
+    """Retorna o próximo byte esperado pela sessão de upload, ou None se ela não existe mais."""
+    try:
+        response = graph_request('GET', upload_url, autenticar=False)
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    faixas = response.json().get('nextExpectedRanges') or ['0-']
+    return int(faixas[0].split('-')[0])
+
+def _ler_blocos(arquivo, offset):
+    """Lê o arquivo em blocos de GRAPH_UPLOAD_BLOCO a partir de `offset`."""
+    if offset == 0 and hasattr(arquivo, 'chunks'):
+        yield from arquivo.chunks(chunk_size=GRAPH_UPLOAD_BLOCO)
+        return
+    arquivo.seek(offset)
+    while True:
+        bloco = arquivo.read(GRAPH_UPLOAD_BLOCO)
+        if not bloco:
+            return
+        yield bloco
+
+def upload_arquivo_em_partes(parent_folder_id, nome_arquivo, arquivo, tamanho=None, max_tentativas=3, identificador=None):
+    """
+    Envia um arquivo grande por sessão de upload (createUploadSession), em blocos.
+
+    Só um bloco fica em memória por vez. A uploadUrl fica guardada no cache: se o
+    envio falhar (aqui ou numa nova tentativa, ex: pelo Celery), ele é retomado
+    a partir do último byte confirmado pelo Graph, sem reenviar o que já subiu.
+    A sessão só é retomada pelo mesmo envio (`identificador`) ou pelo mesmo
+    conteúdo (hash, quando não há identificador).
+    """
+    tamanho = tamanho if tamanho is not None else arquivo.size
+    chave_sessao = _chave_sessao_upload(
+        parent_folder_id, nome_arquivo, tamanho,
+        identificador if identificador is not None else _hash_conteudo(arquivo),
+    )
+
+    upload_url, offset = _ler_sessao_upload(chave_sessao), 0
+    if upload_url:
+        offset = consultar_sessao_upload(upload_url)
+        if offset is None:
+            upload_url, offset = None, 0
+        else:
+            print(f"Retomando upload de '{nome_arquivo}' a partir do byte {offset}.")
+    if not upload_url:
+        upload_url = criar_sessao_upload(parent_folder_id, nome_arquivo)
+        if not upload_url:
+            return False
+        _gravar_sessao_upload(chave_sessao, upload_url)
+
+    falhas = 0
+    while True:
+        for bloco in _ler_blocos(arquivo, offset):
+            fim = offset + len(bloco) - 1
+            headers = {'Content-Range': f"bytes {offset}-{fim}/{tamanho}"}
+            try:
+                response = graph_request('PUT', upload_url, autenticar=False, headers=headers, data=bloco, timeout=GRAPH_UPLOAD_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                print(f"Erro de rede no upload de '{nome_arquivo}' (bytes {offset}-{fim}): {e}")
+                break
+            if response.status_code in (200, 201):
+                _descartar_sessao_upload(chave_sessao)
+                invalidar_listagem(parent_folder_id)
+                return True
+            if response.status_code != 202:
+                print(f"Falha no upload de '{nome_arquivo}' (bytes {offset}-{fim}): {response.status_code} {response.text[:200]}")
+                break
+            offset = fim + 1
+            falhas = 0
+
+        falhas += 1
+        if falhas > max_tentativas:
+            return False
+        offset = consultar_sessao_upload(upload_url)
+        if offset is None:
+            # A sessão expirou ou foi cancelada; não há como retomar
+            _descartar_sessao_upload(chave_sessao)
+            return False
+        time.sleep(2 ** falhas)
+
 def deletar_item(item_id):
-    access_token = get_app_graph_token()
-    headers = {'Authorization': 'Bearer ' + access_token}
-    url = f"https://graph.microsoft.com/v1.0/drives/{DRIVE_ID}/items/{item_id}"
+    url = f"/drives/{DRIVE_ID}/items/{item_id}"
     try:
-        response = requests.delete(url, headers=headers, verify=certifi.where(), timeout=15)
-        return response.status_code == 204
+        response = graph_request('DELETE', url)
+        if response.status_code == 204:
+            invalidar_listagem_do_item(item_id)
+            return True
+        return False
     except requests.exceptions.RequestException as e:
         print(f"Erro ao deletar item: {e}")
         return False
 
 def criar_nova_pasta(parent_folder_id, nome_nova_pasta):
-    access_token = get_app_graph_token()
-    headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
-    url = f"https://graph.microsoft.com/v1.0/drives/{DRIVE_ID}/items/{parent_folder_id}/children"
+    url = f"/drives/{DRIVE_ID}/items/{parent_folder_id}/children"
     payload = {"name": nome_nova_pasta, "folder": {}}
     try:
-        response = requests.post(url, headers=headers, json=payload, verify=certifi.where(), timeout=15)
-        return response.status_code == 201
+        response = graph_request('POST', url, json=payload)
+        if response.status_code == 201:
+            invalidar_listagem(parent_folder_id)
+            return True
+        return False
     except requests.exceptions.RequestException as e:
         print(f"Erro ao criar nova pasta: {e}")
         return False
 
 def obter_url_preview(item_id):
-    access_token = get_app_graph_token()
-    headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
-    url = f"https://graph.microsoft.com/v1.0/drives/{DRIVE_ID}/items/{item_id}/preview"
+    url = f"/drives/{DRIVE_ID}/items/{item_id}/preview"
     try:
-        response = requests.post(url, headers=headers, json={}, verify=certifi.where(), timeout=15)
+        response = graph_request('POST', url, json={})
         if response.status_code == 200:
             return response.json().get('getUrl')
         return None
     except requests.exceptions.RequestException:
         return None
 
+def obter_url_download(item_id):
+    """Link de download pré-assinado (de curta duração) de um arquivo."""
+    url = f"/drives/{DRIVE_ID}/items/{item_id}?$select=id,@microsoft.graph.downloadUrl"
+    try:
+        response = graph_request('GET', url)
+        if response.status_code == 200:
+            return response.json().get('@microsoft.graph.downloadUrl')
+        return None
+    except requests.exceptions.RequestException:
+        return None
+
+# --- OPERAÇÕES EM LOTE (uma chamada ao Graph para vários itens) ---
+
+def listar_varias_pastas(folder_ids):
+    """
+    Lista o conteúdo de várias pastas de uma vez. Retorna {folder_id: [itens]}.
+    As pastas que já estão no cache não são consultadas no Graph.
+    """
+    folder_ids = list(dict.fromkeys(folder_ids))
+    resultado = _ler_listagens_em_cache(folder_ids)
+    faltantes = [folder_id for folder_id in folder_ids if folder_id not in resultado]
+    requisicoes = [{'method': 'GET', 'url': f"/drives/{DRIVE_ID}/items/{folder_id}/children"} for folder_id in faltantes]
+    for folder_id, resposta in zip(faltantes, executar_lote_graph(requisicoes)):
+        if resposta['status'] == 200:
+            resultado[folder_id] = (resposta['body'] or {}).get('value', [])
+            _gravar_listagem_em_cache(folder_id, resultado[folder_id])
+        else:
+            resultado[folder_id] = []
+    return resultado
+
+def deletar_itens(item_ids):
+    """Deleta vários itens de uma vez. Retorna {item_id: True/False}."""
+    item_ids = list(dict.fromkeys(item_ids))
+    requisicoes = [{'method': 'DELETE', 'url': f"/drives/{DRIVE_ID}/items/{item_id}"} for item_id in item_ids]
+    # 404 significa que o item já não existe, o que para quem pediu a exclusão é sucesso
+    resultado = {item_id: resposta['status'] in (204, 404) for item_id, resposta in zip(item_ids, executar_lote_graph(requisicoes))}
+    for item_id, deletado in resultado.items():
+        if deletado:
+            invalidar_listagem_do_item(item_id)
+    return resultado
+
+def upload_arquivos_lote(parent_folder_id, arquivos):
+    """
+    Envia vários arquivos pequenos (até GRAPH_BATCH_UPLOAD_MAX) em lote.
+
+    `arquivos` é uma lista de tuplas (nome_arquivo, conteudo_bytes).
+    Retorna uma lista de booleanos na mesma ordem.
+    """
+    requisicoes = [
+        {
+            'method': 'PUT',
+            'url': f"/drives/{DRIVE_ID}/items/{parent_folder_id}:/{quote(nome_arquivo)}:/content",
+            'body': base64.b64encode(conteudo).decode('ascii'),
+            'headers': {'Content-Type': 'application/octet-stream'},
+        }
+        for nome_arquivo, conteudo in arquivos
+    ]
+    resultado = [resposta['status'] in (200, 201) for resposta in executar_lote_graph(requisicoes)]
+    if any(resultado):
+        invalidar_listagem(parent_folder_id)
+    return resultado
+
 # ==============================================================================
 # FUNÇÃO DE ENVIO DE E-MAIL (Inalterada)
 # ==============================================================================
@@ -179,12 +853,10 @@ def enviar_email_graph(usuario_remetente, destinatarios, assunto, corpo_html):
     if not access_token:
         print(f"Falha no envio de e-mail: não foi possível obter o token para {usuario_remetente.username}")
         return False, "Não foi possível obter o token de autenticação do usuário. Faça login com a Microsoft novamente."
-    headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
     to_recipients = [{'emailAddress': {'address': email.strip()}} for email in destinatarios]
     email_data = {'message': {'subject': assunto, 'body': {'contentType': 'HTML', 'content': corpo_html}, 'toRecipients': to_recipients}, 'saveToSentItems': 'true'}
-    url = "https://graph.microsoft.com/v1.0/me/sendMail"
     try:
-        response = requests.post(url, headers=headers, json=email_data, verify=certifi.where(), timeout=20)
+        response = graph_request('POST', "/me/sendMail", token=access_token, json=email_data, timeout=20)
         response.raise_for_status()
         print(f"E-mail enviado com sucesso de {usuario_remetente.email} para {destinatarios}")
         return True, "E-mail enviado com sucesso."
@@ -201,32 +873,15 @@ def enviar_email_graph(usuario_remetente, destinatarios, assunto, corpo_html):
 def sincronizar_usuarios_azure():
     User = get_user_model()
     
-    tenant_id = os.environ.get('SHAREPOINT_TENANT_ID')
-    client_id = os.environ.get('SHAREPOINT_CLIENT_ID')
-    client_secret = os.environ.get('SHAREPOINT_CLIENT_SECRET')
-    
-    if not all([tenant_id, client_id, client_secret]):
+    if not all([TENANT_ID, CLIENT_ID, CLIENT_SECRET]):
         raise ValueError("Variáveis de ambiente (TENANT_ID, CLIENT_ID, CLIENT_SECRET) não configuradas.")
-            
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    
+
     try:
-        app = msal.ConfidentialClientApplication(
-            client_id, authority=authority, client_credential=client_secret,
-            # MSAL pode aceitar um caminho de certificado, mas vamos deixar padrão por enquanto
-        )
-        result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+        access_token = get_app_graph_token()
     except Exception as e:
-        raise ConnectionError(f"Erro ao conectar com a Microsoft para obter token: {e}")
-    
-    if "access_token" not in result:
-        error_details = result.get('error_description', 'Nenhum detalhe adicional.')
-        raise ConnectionError(f"Não foi possível obter o token de acesso da Microsoft. Detalhes: {error_details}")
+        raise ConnectionError(f"Não foi possível obter o token de acesso da Microsoft. Detalhes: {e}")
 
-    access_token = result['access_token']
-    headers = {'Authorization': 'Bearer ' + access_token}
-    
-    url = "https://graph.microsoft.com/v1.0/users?$filter=accountEnabled eq true&$select=id,displayName,givenName,surname,mail,userPrincipalName"
+    url = "/users?$filter=accountEnabled eq true&$select=id,displayName,givenName,surname,mail,userPrincipalName"
     
     usuarios_criados = 0
     usuarios_atualizados = 0
@@ -234,8 +889,7 @@ def sincronizar_usuarios_azure():
     
     while url:
         try:
-            # Adicionado verify=certifi.where() e timeout
-            response = requests.get(url, headers=headers, verify=certifi.where(), timeout=30)
+            response = graph_request('GET', url, timeout=30)
             response.raise_for_status()
             data = response.json()
             
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0003_parcelaacordo_data_quitacao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadAnexo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome_arquivo', models.CharField(max_length=255, verbose_name='Nome do Arquivo')),
+                ('pasta_destino_id', models.CharField(max_length=255, verbose_name='ID da Pasta de Destino')),
+                ('caminho_temporario', models.CharField(help_text='Cópia local do arquivo até o envio ao SharePoint.', max_length=500)),
+                ('tamanho', models.PositiveBigIntegerField(default=0, verbose_name='Tamanho (bytes)')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviando', 'Enviando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=10)),
+                ('erro', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads_anexos', to='casos.caso')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Upload de Anexo',
+                'verbose_name_plural': 'Uploads de Anexos',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
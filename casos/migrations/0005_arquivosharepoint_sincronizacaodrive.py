@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0004_uploadanexo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacaoDrive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('drive_id', models.CharField(max_length=255, unique=True)),
+                ('delta_link', models.TextField(blank=True)),
+                ('ultima_sincronizacao', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Sincronização do Drive',
+                'verbose_name_plural': 'Sincronizações do Drive',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArquivoSharePoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.CharField(max_length=255, unique=True, verbose_name='ID do Item no Drive')),
+                ('sharepoint_unique_id', models.CharField(blank=True, db_index=True, help_text='UniqueId do SharePoint (o ID salvo em Caso.sharepoint_folder_id).', max_length=255)),
+                ('pai_id', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='ID da Pasta Pai')),
+                ('nome', models.CharField(max_length=400, verbose_name='Nome')),
+                ('pasta', models.BooleanField(default=False, verbose_name='É Pasta?')),
+                ('tamanho', models.PositiveBigIntegerField(default=0, verbose_name='Tamanho (bytes)')),
+                ('web_url', models.URLField(blank=True, max_length=1000)),
+                ('data_modificacao', models.DateTimeField(blank=True, null=True)),
+                ('data_sincronizacao', models.DateTimeField(auto_now=True)),
+                ('caso', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arquivos_sharepoint', to='casos.caso')),
+            ],
+            options={
+                'verbose_name': 'Arquivo do SharePoint',
+                'verbose_name_plural': 'Arquivos do SharePoint',
+                'ordering': ['-pasta', 'nome'],
+                'indexes': [models.Index(fields=['caso', 'pasta'], name='casos_arqsp_caso_pasta_idx'), models.Index(fields=['nome'], name='casos_arqsp_nome_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def criar_indice_texto(apps, schema_editor):
+    """O índice de texto depende do banco; o Django não gerencia essas estruturas."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "ALTER TABLE casos_documentobuscacaso ADD COLUMN busca tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', conteudo)) STORED"
+        )
+        schema_editor.execute("CREATE INDEX casos_docbusca_tsv_idx ON casos_documentobuscacaso USING GIN (busca)")
+        schema_editor.execute("CREATE INDEX casos_docbusca_trgm_idx ON casos_documentobuscacaso USING GIN (conteudo gin_trgm_ops)")
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE casos_documentobuscacaso_fts USING fts5("
+            "conteudo, content='casos_documentobuscacaso', content_rowid='caso_id', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER casos_docbusca_ai AFTER INSERT ON casos_documentobuscacaso BEGIN "
+            "INSERT INTO casos_documentobuscacaso_fts(rowid, conteudo) VALUES (new.caso_id, new.conteudo); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER casos_docbusca_ad AFTER DELETE ON casos_documentobuscacaso BEGIN "
+            "INSERT INTO casos_documentobuscacaso_fts(casos_documentobuscacaso_fts, rowid, conteudo) VALUES ('delete', old.caso_id, old.conteudo); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER casos_docbusca_au AFTER UPDATE ON casos_documentobuscacaso BEGIN "
+            "INSERT INTO casos_documentobuscacaso_fts(casos_documentobuscacaso_fts, rowid, conteudo) VALUES ('delete', old.caso_id, old.conteudo); "
+            "INSERT INTO casos_documentobuscacaso_fts(rowid, conteudo) VALUES (new.caso_id, new.conteudo); END"
+        )
+
+
+def remover_indice_texto(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS casos_docbusca_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS casos_docbusca_tsv_idx")
+        schema_editor.execute("ALTER TABLE casos_documentobuscacaso DROP COLUMN IF EXISTS busca")
+    elif vendor == 'sqlite':
+        for trigger in ('casos_docbusca_ai', 'casos_docbusca_ad', 'casos_docbusca_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS casos_documentobuscacaso_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0005_arquivosharepoint_sincronizacaodrive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBuscaCaso',
+            fields=[
+                ('caso', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='documento_busca', serialize=False, to='casos.caso')),
+                ('conteudo', models.TextField(blank=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Documento de Busca do Caso',
+                'verbose_name_plural': 'Documentos de Busca dos Casos',
+            },
+        ),
+        migrations.RunPython(criar_indice_texto, remover_indice_texto),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:00
+#
+# Junta a antiga 0007 (coluna valor_digitos em ValorCampoCaso) e a 0008, que a
+# substituiu pela projeção ValorPesquisavelCaso: a projeção é criada direto.
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Campos que a pesquisa usava até aqui; passam a ser os pesquisáveis iniciais
+CAMPOS_PESQUISAVEIS_INICIAIS = ('aviso', 'segurado')
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def preencher_projecao(apps, schema_editor):
+    Campo = apps.get_model('casos', 'Campo')
+    ValorCampoCaso = apps.get_model('casos', 'ValorCampoCaso')
+    ValorPesquisavelCaso = apps.get_model('casos', 'ValorPesquisavelCaso')
+
+    Campo.objects.filter(nome_tecnico__in=CAMPOS_PESQUISAVEIS_INICIAIS).update(pesquisavel=True)
+    valores = (
+        ValorCampoCaso.objects.filter(campo__pesquisavel=True).exclude(valor__isnull=True).exclude(valor='')
+        .order_by().values_list('caso_id', 'campo_id', 'valor')
+    )
+    lote = []
+    for caso_id, campo_id, valor in valores.iterator(chunk_size=2000):
+        lote.append(ValorPesquisavelCaso(
+            caso_id=caso_id, campo_id=campo_id,
+            valor_normalizado=_normalizar(valor), valor_digitos=re.sub(r'\D', '', valor)[:255],
+        ))
+        if len(lote) >= 2000:
+            ValorPesquisavelCaso.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        ValorPesquisavelCaso.objects.bulk_create(lote)
+
+
+def criar_indices_trigram(apps, schema_editor):
+    # No SQLite ficam só os índices comuns; a pesquisa por trecho varre a projeção, que é pequena
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX casos_valpesq_valor_trgm_idx ON casos_valorpesquisavelcaso "
+            "USING GIN (valor_normalizado gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX casos_valpesq_digitos_trgm_idx ON casos_valorpesquisavelcaso "
+            "USING GIN (valor_digitos gin_trgm_ops) WHERE NOT (valor_digitos = '')"
+        )
+
+
+def remover_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS casos_valpesq_digitos_trgm_idx")
+        schema_editor.execute("DROP INDEX IF EXISTS casos_valpesq_valor_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('casos', '0007_valorcampocaso_valor_digitos'),
+        ('casos', '0008_campo_pesquisavel_valorpesquisavelcaso'),
+    ]
+
+    dependencies = [
+        ('casos', '0006_documentobuscacaso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campo',
+            name='pesquisavel',
+            field=models.BooleanField(default=False, help_text='Os valores deste campo entram na pesquisa de casos e de ações.', verbose_name='Pesquisável?'),
+        ),
+        migrations.CreateModel(
+            name='ValorPesquisavelCaso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valor_normalizado', models.TextField()),
+                ('valor_digitos', models.CharField(blank=True, default='', max_length=255)),
+                ('campo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valores_pesquisaveis', to='casos.campo')),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valores_pesquisaveis', to='casos.caso')),
+            ],
+            options={
+                'verbose_name': 'Valor Pesquisável do Caso',
+                'verbose_name_plural': 'Valores Pesquisáveis dos Casos',
+                'indexes': [models.Index(condition=models.Q(('valor_digitos', ''), _negated=True), fields=['valor_digitos'], name='casos_valpesq_digitos_idx')],
+                'unique_together': {('caso', 'campo')},
+            },
+        ),
+        migrations.RunPython(preencher_projecao, migrations.RunPython.noop),
+        migrations.RunPython(criar_indices_trigram, remover_indices_trigram),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0007_squashed_0008_campo_pesquisavel_valorpesquisavelcaso'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='instanciaacao',
+            index=models.Index(fields=['prazo_final', 'id'], name='casos_acao_prazo_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0009_instanciaacao_casos_acao_prazo_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caso',
+            name='valores_json',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Valores dos Campos Customizados'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0010_caso_valores_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='regracampo',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0011_regracampo_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Feriado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=150, verbose_name='Descrição')),
+                ('tipo', models.CharField(choices=[('nacional', 'Feriado Nacional'), ('estadual', 'Feriado Estadual'), ('municipal', 'Feriado Municipal'), ('recesso', 'Recesso Forense')], default='nacional', max_length=10)),
+                ('data', models.DateField(verbose_name='Data (ou início do período)')),
+                ('data_fim', models.DateField(blank=True, help_text='Só para períodos (ex: recesso de 20/12 a 20/01). Deixe em branco para um dia só.', null=True, verbose_name='Fim do Período')),
+                ('uf', models.CharField(blank=True, help_text='Para feriados estaduais/municipais. Só entram no cálculo os da UF do escritório (CALENDARIO_UF).', max_length=2, verbose_name='UF')),
+            ],
+            options={
+                'verbose_name': 'Feriado',
+                'verbose_name_plural': '5. Feriados e Recessos',
+                'ordering': ['data'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0012_feriado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoWorkflow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('caso_criado', 'Caso Criado'), ('etapa_alterada', 'Etapa Alterada'), ('decisao_tomada', 'Decisão Tomada')], max_length=20)),
+                ('dados', models.JSONField(blank=True, default=dict)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True)),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_workflow', to='casos.caso')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Evento do Workflow',
+                'verbose_name_plural': 'Eventos do Workflow',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processado_em__isnull', True)), fields=['id'], name='casos_evento_pendente_idx')],
+            },
+        ),
+    ]
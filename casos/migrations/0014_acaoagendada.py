@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0013_eventoworkflow'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcaoAgendada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('executar_em', models.DateTimeField(verbose_name='Abrir em')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('ativada_em', models.DateTimeField(blank=True, null=True)),
+                ('acao_criada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='casos.instanciaacao')),
+                ('acao_modelo', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='casos.acaoetapa', verbose_name='Ação a ser criada')),
+                ('acao_origem', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='casos.instanciaacao')),
+                ('caso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='acoes_agendadas', to='casos.caso')),
+                ('opcao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='casos.opcaodecisao')),
+                ('responsavel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ação Agendada',
+                'verbose_name_plural': 'Ações Agendadas',
+                'ordering': ['executar_em', 'id'],
+                'indexes': [models.Index(condition=models.Q(('ativada_em__isnull', True)), fields=['executar_em', 'id'], name='casos_agendada_pendente_idx')],
+                'constraints': [models.UniqueConstraint(fields=('acao_origem', 'opcao'), name='casos_agendada_origem_unica')],
+            },
+        ),
+    ]
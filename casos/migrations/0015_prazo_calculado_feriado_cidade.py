@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:00
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_prazo_calculado(apps, schema_editor):
+    # Os prazos existentes vieram do cálculo; a partir daqui, os alterados à mão deixam de ser recalculados
+    InstanciaAcao = apps.get_model('casos', 'InstanciaAcao')
+    InstanciaAcao.objects.filter(prazo_final__isnull=False).update(prazo_calculado=F('prazo_final'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0014_acaoagendada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instanciaacao',
+            name='prazo_calculado',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_prazo_calculado, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='feriado',
+            name='cidade',
+            field=models.CharField(blank=True, help_text='Para feriados municipais: só contam nos casos de clientes desta cidade.', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='feriado',
+            name='uf',
+            field=models.CharField(blank=True, help_text='Para feriados estaduais/municipais. Os estaduais só entram no cálculo se forem da UF do escritório (CALENDARIO_UF).', max_length=2, verbose_name='UF'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0015_prazo_calculado_feriado_cidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventoworkflow',
+            name='reservado_ate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def marcar_uploads_sem_conteudo(apps, schema_editor):
+    # Os não concluídos tinham a cópia num disco local, que o worker não enxerga: precisam ser reenviados
+    UploadAnexo = apps.get_model('casos', 'UploadAnexo')
+    UploadAnexo.objects.filter(status__in=['pendente', 'enviando', 'erro']).update(
+        status='erro', erro='Cópia temporária não disponível; envie o arquivo de novo.',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('casos', '0016_eventoworkflow_reservado_ate'),
+    ]
+
+    operations = [
+        migrations.RunPython(marcar_uploads_sem_conteudo, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='uploadanexo',
+            name='caminho_temporario',
+        ),
+        migrations.AddField(
+            model_name='uploadanexo',
+            name='ultima_tentativa',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='uploadanexo',
+            index=models.Index(condition=models.Q(('status__in', ['pendente', 'enviando'])), fields=['status', 'ultima_tentativa'], name='casos_upload_status_idx'),
+        ),
+        migrations.CreateModel(
+            name='BlocoUploadAnexo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveIntegerField()),
+                ('dados', models.BinaryField()),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocos', to='casos.uploadanexo')),
+            ],
+            options={
+                'verbose_name': 'Bloco de Upload',
+                'verbose_name_plural': 'Blocos de Upload',
+                'ordering': ['upload', 'ordem'],
+                'constraints': [models.UniqueConstraint(fields=('upload', 'ordem'), name='casos_bloco_upload_ordem_unica')],
+            },
+        ),
+    ]
@@ -5,7 +5,8 @@ from django.conf import settings
 from clientes.models import Cliente
 from datetime import timedelta
 from django.db.models import Sum
-from django.template import Template, Context
+from django.template import Template, Context, TemplateSyntaxError
+from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -29,6 +30,7 @@ class Campo(models.Model):
     nome_label = models.CharField(max_length=100, unique=True, verbose_name="Nome de Exibição do Campo")
     nome_tecnico = models.SlugField(max_length=100, unique=True, help_text="Nome interno do campo (automático)")
     tipo_campo = models.CharField(max_length=20, choices=TIPO_CHOICES, default='text')
+    pesquisavel = models.BooleanField(default=False, verbose_name="Pesquisável?", help_text="Os valores deste campo entram na pesquisa de casos e de ações.")
 
     class Meta:
         verbose_name = "Campo Customizado"
@@ -76,12 +78,21 @@ class RegraCampo(models.Model):
         blank=True,
         help_text="Defina o formato do título. Use {{ nome_do_campo }} para as variáveis. Ex: Aviso: {{ aviso }} - Segurado: {{ segurado }} - Tomador: {{ tomador }}"
     )
+    # Faz parte da chave do template compilado do título (casos/titulos.py)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         cliente_nome = self.cliente.nome_razao_social if self.cliente else "Cliente não definido"
         produto_nome = self.produto.nome if self.produto else "Produto não definido"
         return f"Regra de Campos para: {cliente_nome} + {produto_nome}"
 
+    def clean(self):
+        super().clean()
+        try:
+            Template(self.formato_titulo)
+        except TemplateSyntaxError as e:
+            raise ValidationError({'formato_titulo': f"Formato de título inválido: {e}"})
+
     class Meta:
         unique_together = ('cliente', 'produto')
         verbose_name = "Regra de Campos Customizados"
@@ -99,6 +110,8 @@ class Caso(models.Model):
     titulo_caso = models.CharField(max_length=512, verbose_name="Título do Caso", blank=True)
     sharepoint_folder_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="ID da Pasta no SharePoint")
     sharepoint_folder_url = models.URLField(max_length=500, blank=True, null=True, verbose_name="URL da Pasta no SharePoint")
+    # Cópia de leitura dos campos customizados ({nome_tecnico: valor}); ver casos/valores_campos.py
+    valores_json = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Valores dos Campos Customizados")
     
     class Meta:
         ordering = ['-id']
@@ -152,6 +165,46 @@ class ValorCampoCaso(models.Model):
             return f"{self.campo.nome_label}: {self.valor or ''}"
         return f"Valor de campo inválido para o Caso #{self.caso_id}"
 
+class ValorPesquisavelCaso(models.Model):
+    """
+    Projeção dos valores dos campos marcados como pesquisáveis: uma linha por
+    (caso, campo), já normalizada. Mantida pelos sinais de ValorCampoCaso e
+    Campo; é o que a pesquisa de casos e de ações consulta. Ver casos/busca.py.
+    """
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name='valores_pesquisaveis')
+    campo = models.ForeignKey(Campo, on_delete=models.CASCADE, related_name='valores_pesquisaveis')
+    valor_normalizado = models.TextField()
+    # Só os dígitos do valor, para achar "123.456/7" pesquisando "3456"
+    valor_digitos = models.CharField(max_length=255, blank=True, default='')
+
+    def __str__(self):
+        return f"{self.campo_id}: {self.valor_normalizado}"
+
+    class Meta:
+        unique_together = ('caso', 'campo')
+        verbose_name = "Valor Pesquisável do Caso"
+        verbose_name_plural = "Valores Pesquisáveis dos Casos"
+        indexes = [
+            models.Index(fields=['valor_digitos'], condition=~models.Q(valor_digitos=''), name='casos_valpesq_digitos_idx'),
+        ]
+
+class DocumentoBuscaCaso(models.Model):
+    """
+    Texto de busca desnormalizado do título de cada caso, já normalizado
+    (minúsculas, sem acentos). O índice de texto fica no banco: tsvector/GIN +
+    trigram no Postgres, FTS5 no SQLite. Ver casos/busca.py.
+    """
+    caso = models.OneToOneField(Caso, on_delete=models.CASCADE, primary_key=True, related_name='documento_busca')
+    conteudo = models.TextField(blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Documento de busca do Caso #{self.caso_id}"
+
+    class Meta:
+        verbose_name = "Documento de Busca do Caso"
+        verbose_name_plural = "Documentos de Busca dos Casos"
+
 # ==============================================================================
 # SEÇÃO 2: MODELOS DE APOIO E WORKFLOW
 # ==============================================================================
@@ -267,6 +320,93 @@ class GraphWebhookSubscription(models.Model):
             return f"Webhook for {self.user.username}"
         return f"Webhook (usuário deletado)"
 
+class UploadAnexo(models.Model):
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviando', 'Enviando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name='uploads_anexos')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    nome_arquivo = models.CharField(max_length=255, verbose_name="Nome do Arquivo")
+    pasta_destino_id = models.CharField(max_length=255, verbose_name="ID da Pasta de Destino")
+    tamanho = models.PositiveBigIntegerField(default=0, verbose_name="Tamanho (bytes)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pendente')
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    # Início do último envio; um upload 'enviando' há muito tempo ficou órfão (worker reiniciado)
+    ultima_tentativa = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Upload de '{self.nome_arquivo}' para o Caso #{self.caso_id} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = "Upload de Anexo"
+        verbose_name_plural = "Uploads de Anexos"
+        indexes = [
+            # Uploads ainda não finalizados (retomada dos órfãos)
+            models.Index(fields=['status', 'ultima_tentativa'], name='casos_upload_status_idx', condition=models.Q(status__in=['pendente', 'enviando'])),
+        ]
+
+class BlocoUploadAnexo(models.Model):
+    """
+    Conteúdo de um UploadAnexo até o envio ao SharePoint, em blocos. Fica no
+    banco porque a web e o worker do Celery não compartilham disco. Ver
+    casos/area_uploads.py.
+    """
+    upload = models.ForeignKey(UploadAnexo, on_delete=models.CASCADE, related_name='blocos')
+    ordem = models.PositiveIntegerField()
+    dados = models.BinaryField()
+
+    class Meta:
+        ordering = ['upload', 'ordem']
+        verbose_name = "Bloco de Upload"
+        verbose_name_plural = "Blocos de Upload"
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'ordem'], name='casos_bloco_upload_ordem_unica'),
+        ]
+
+class ArquivoSharePoint(models.Model):
+    """Espelho local dos itens do drive do SharePoint, mantido pela consulta delta do Graph."""
+    item_id = models.CharField(max_length=255, unique=True, verbose_name="ID do Item no Drive")
+    sharepoint_unique_id = models.CharField(max_length=255, blank=True, db_index=True, help_text="UniqueId do SharePoint (o ID salvo em Caso.sharepoint_folder_id).")
+    pai_id = models.CharField(max_length=255, blank=True, db_index=True, verbose_name="ID da Pasta Pai")
+    caso = models.ForeignKey(Caso, on_delete=models.SET_NULL, null=True, blank=True, related_name='arquivos_sharepoint')
+    nome = models.CharField(max_length=400, verbose_name="Nome")
+    pasta = models.BooleanField(default=False, verbose_name="É Pasta?")
+    tamanho = models.PositiveBigIntegerField(default=0, verbose_name="Tamanho (bytes)")
+    web_url = models.URLField(max_length=1000, blank=True)
+    data_modificacao = models.DateTimeField(null=True, blank=True)
+    data_sincronizacao = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.nome
+
+    class Meta:
+        ordering = ['-pasta', 'nome']
+        verbose_name = "Arquivo do SharePoint"
+        verbose_name_plural = "Arquivos do SharePoint"
+        indexes = [
+            models.Index(fields=['caso', 'pasta'], name='casos_arqsp_caso_pasta_idx'),
+            models.Index(fields=['nome'], name='casos_arqsp_nome_idx'),
+        ]
+
+class SincronizacaoDrive(models.Model):
+    """Guarda o deltaLink do Graph entre uma sincronização e outra."""
+    drive_id = models.CharField(max_length=255, unique=True)
+    delta_link = models.TextField(blank=True)
+    ultima_sincronizacao = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sincronização do drive {self.drive_id}"
+
+    class Meta:
+        verbose_name = "Sincronização do Drive"
+        verbose_name_plural = "Sincronizações do Drive"
+
 class FluxoTrabalho(models.Model):
     nome = models.CharField(max_length=200, unique=True)
     descricao = models.TextField(blank=True)
@@ -350,6 +490,9 @@ class InstanciaAcao(models.Model):
     data_conclusao = models.DateTimeField(null=True, blank=True)
     descricao_conclusao = models.TextField(blank=True)
     prazo_final = models.DateTimeField(null=True, blank=True, verbose_name="Prazo Final")
+    # Último prazo calculado pelo calendário; se prazo_final for diferente, foi alterado à mão
+    # e recalcular_prazos() não mexe nele (casos/calendario.py)
+    prazo_calculado = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"Ação '{self.acao_modelo.titulo}' para o Caso #{self.caso.id}"
@@ -357,6 +500,10 @@ class InstanciaAcao(models.Model):
     class Meta:
         verbose_name = "Instância de Ação"
         verbose_name_plural = "Instâncias de Ações"
+        indexes = [
+            # Ordenação da lista de ações (paginação por cursor em prazo_final, id)
+            models.Index(fields=['prazo_final', 'id'], name='casos_acao_prazo_id_idx'),
+        ]
 
 class HistoricoEtapa(models.Model):
     caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name='historico_etapas')
@@ -379,6 +526,98 @@ class HistoricoEtapa(models.Model):
         verbose_name = "Histórico de Etapa"
         verbose_name_plural = "Históricos de Etapas"
 
+class EventoWorkflow(models.Model):
+    """
+    Efeito colateral do workflow (e-mail) a executar depois da
+    transação que o gerou. Gravado junto com a transição e consumido em lotes
+    pela tarefa processar_eventos_workflow. Ver casos/eventos_workflow.py.
+    """
+    TIPO_CHOICES = [
+        ('caso_criado', 'Caso Criado'),
+        ('etapa_alterada', 'Etapa Alterada'),
+        ('decisao_tomada', 'Decisão Tomada'),
+    ]
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name='eventos_workflow')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    dados = models.JSONField(default=dict, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+    tentativas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True)
+    # Reservado por um worker até esta hora (o envio acontece fora da transação da reserva)
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - Caso #{self.caso_id}"
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Evento do Workflow"
+        verbose_name_plural = "Eventos do Workflow"
+        indexes = [
+            # Fila: só os eventos ainda não processados
+            models.Index(fields=['id'], name='casos_evento_pendente_idx', condition=models.Q(processado_em__isnull=True)),
+        ]
+
+class AcaoAgendada(models.Model):
+    """
+    Lembrete de OpcaoDecisao.aguardar_dias: a ação que será aberta no caso em
+    `executar_em`. A tarefa abrir_lembretes_vencidos cria as que venceram, em
+    lotes, lendo só as pendentes pelo índice de executar_em. Ver casos/agendador.py.
+    """
+    caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name='acoes_agendadas')
+    acao_modelo = models.ForeignKey(AcaoEtapa, on_delete=models.PROTECT, verbose_name="Ação a ser criada")
+    responsavel = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Ação concluída e opção escolhida que geraram o lembrete
+    acao_origem = models.ForeignKey(InstanciaAcao, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    opcao = models.ForeignKey(OpcaoDecisao, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    executar_em = models.DateTimeField(verbose_name="Abrir em")
+    criado_em = models.DateTimeField(auto_now_add=True)
+    ativada_em = models.DateTimeField(null=True, blank=True)
+    acao_criada = models.ForeignKey(InstanciaAcao, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f"Lembrete '{self.acao_modelo.titulo}' - Caso #{self.caso_id} em {self.executar_em:%d/%m/%Y}"
+
+    class Meta:
+        ordering = ['executar_em', 'id']
+        verbose_name = "Ação Agendada"
+        verbose_name_plural = "Ações Agendadas"
+        indexes = [
+            # Fila por vencimento: só os lembretes ainda não ativados
+            models.Index(fields=['executar_em', 'id'], condition=models.Q(ativada_em__isnull=True), name='casos_agendada_pendente_idx'),
+        ]
+        constraints = [
+            # A mesma decisão (reenviada ou repetida) não agenda dois lembretes
+            models.UniqueConstraint(fields=['acao_origem', 'opcao'], name='casos_agendada_origem_unica'),
+        ]
+
+class Feriado(models.Model):
+    """Dia (ou período, no caso de recesso) sem expediente, usado nos prazos em dias úteis."""
+    TIPO_CHOICES = [
+        ('nacional', 'Feriado Nacional'),
+        ('estadual', 'Feriado Estadual'),
+        ('municipal', 'Feriado Municipal'),
+        ('recesso', 'Recesso Forense'),
+    ]
+    nome = models.CharField(max_length=150, verbose_name="Descrição")
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='nacional')
+    data = models.DateField(verbose_name="Data (ou início do período)")
+    data_fim = models.DateField(null=True, blank=True, verbose_name="Fim do Período", help_text="Só para períodos (ex: recesso de 20/12 a 20/01). Deixe em branco para um dia só.")
+    uf = models.CharField(max_length=2, blank=True, verbose_name="UF", help_text="Para feriados estaduais/municipais. Os estaduais só entram no cálculo se forem da UF do escritório (CALENDARIO_UF).")
+    cidade = models.CharField(max_length=100, blank=True, help_text="Para feriados municipais: só contam nos casos de clientes desta cidade.")
+
+    def __str__(self):
+        if self.data_fim:
+            return f"{self.nome} ({self.data:%d/%m/%Y} a {self.data_fim:%d/%m/%Y})"
+        return f"{self.nome} ({self.data:%d/%m/%Y})"
+
+    class Meta:
+        ordering = ['data']
+        verbose_name = "Feriado"
+        verbose_name_plural = "5. Feriados e Recessos"
+
 class DespesaCaso(models.Model):
     caso = models.ForeignKey(Caso, on_delete=models.CASCADE, related_name="despesas")
     data_despesa = models.DateField(verbose_name="Data da Despesa")
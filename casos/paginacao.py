@@ -0,0 +1,181 @@
+# casos/paginacao.py
+
+"""
+Paginação por cursor (keyset) para as listagens grandes.
+
+Em vez de OFFSET + COUNT(*), cada página guarda um cursor opaco com os valores
+de ordenação do último (ou primeiro) item, e a próxima página é buscada com
+"WHERE (campos) depois do cursor". Com um índice na ordenação, qualquer página
+custa o mesmo que a primeira. O total, quando o template pede, vem do serviço
+de contagens (casos/contagens.py), em cache e estimado para resultados grandes.
+
+Links antigos com ?page=N continuam valendo: essa página é buscada por OFFSET
+(paginar_por_numero) e traz os cursores das vizinhas, de onde a navegação
+segue por cursor.
+"""
+
+import base64
+import binascii
+import json
+from functools import cached_property
+
+from django.db.models import F, Q
+from django.http import Http404
+
+from .contagens import contar
+
+# Condição que nunca é verdadeira (o Django a descarta dentro de um OR)
+NENHUM = Q(pk__in=[])
+
+
+def _codificar_cursor(valores, para_frente):
+    dados = json.dumps({'v': valores, 'f': para_frente}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+def _decodificar_cursor(cursor):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return dados['v'], bool(dados['f'])
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        return None, True
+
+def _depois_de(nome, decrescente, anulavel, valor, para_frente):
+    """Q dos itens que vêm depois (ou antes) de `valor` em um campo. Nulos ficam sempre por último."""
+    maior = decrescente != para_frente
+    if valor is None:
+        # Depois dos nulos não há nada; antes deles estão todos os preenchidos
+        return NENHUM if para_frente else Q(**{f'{nome}__isnull': False})
+    condicao = Q(**{f"{nome}__{'gt' if maior else 'lt'}": valor})
+    if anulavel and para_frente:
+        condicao |= Q(**{f'{nome}__isnull': True})
+    return condicao
+
+def _condicao_cursor(campos, valores, para_frente):
+    condicao, igualdade = NENHUM, Q()
+    for (nome, decrescente, anulavel), valor in zip(campos, valores):
+        condicao |= igualdade & _depois_de(nome, decrescente, anulavel, valor, para_frente)
+        igualdade &= Q(**{f'{nome}__isnull': True}) if valor is None else Q(**{nome: valor})
+    return condicao
+
+def _ordenacao(campos, para_frente):
+    expressoes = []
+    for nome, decrescente, anulavel in campos:
+        extra = {'nulls_last': True} if para_frente else {'nulls_first': True}
+        if not anulavel:
+            extra = {}
+        if decrescente == para_frente:
+            expressoes.append(F(nome).desc(**extra))
+        else:
+            expressoes.append(F(nome).asc(**extra))
+    return expressoes
+
+class PaginaCursor:
+    """Uma página da paginação por cursor (fica no contexto como `page_obj`)."""
+
+    def __init__(self, object_list, cursor_anterior, cursor_proximo, contador=None):
+        self._contador = contador
+        self.object_list = object_list
+        self.cursor_anterior = cursor_anterior
+        self.cursor_proximo = cursor_proximo
+        self.has_previous = cursor_anterior is not None
+        self.has_next = cursor_proximo is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @cached_property
+    def total(self):
+        """Contagem(total, aproximado), calculada só se o template usar."""
+        return self._contador() if self._contador else None
+
+
+def _campos_da_ordenacao(modelo, ordenacao):
+    campos = []
+    for item in ordenacao:
+        nome = item.lstrip('-')
+        campos.append((nome, item.startswith('-'), modelo._meta.get_field(nome).null))
+    return campos
+
+def _cursor_de(campos, obj, para_frente):
+    return _codificar_cursor([getattr(obj, nome) for nome, _, _ in campos], para_frente)
+
+def paginar_por_cursor(queryset, ordenacao, cursor, tamanho, contador=None):
+    """
+    Retorna a PaginaCursor de `queryset` ordenado por `ordenacao`.
+
+    `ordenacao` é uma lista de campos como no order_by ('-id', 'prazo_final', ...);
+    o último precisa ser único (ex: id) para o cursor não pular itens.
+    """
+    modelo = queryset.model
+    campos = _campos_da_ordenacao(modelo, ordenacao)
+
+    valores, para_frente = _decodificar_cursor(cursor) if cursor else (None, True)
+    filtrado = queryset
+    if valores is not None and len(valores) == len(campos):
+        valores = [None if v is None else modelo._meta.get_field(nome).to_python(v) for (nome, _, _), v in zip(campos, valores)]
+        filtrado = queryset.filter(_condicao_cursor(campos, valores, para_frente))
+    else:
+        valores, para_frente = None, True
+
+    itens = list(filtrado.order_by(*_ordenacao(campos, para_frente))[:tamanho + 1])
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    if not para_frente:
+        itens.reverse()
+
+    cursor_anterior = cursor_proximo = None
+    if itens:
+        if para_frente:
+            cursor_anterior = _cursor_de(campos, itens[0], False) if valores is not None else None
+            cursor_proximo = _cursor_de(campos, itens[-1], True) if ha_mais else None
+        else:
+            cursor_anterior = _cursor_de(campos, itens[0], False) if ha_mais else None
+            cursor_proximo = _cursor_de(campos, itens[-1], True)
+    return PaginaCursor(itens, cursor_anterior, cursor_proximo, contador)
+
+def paginar_por_numero(queryset, ordenacao, numero, tamanho, contador=None):
+    """
+    A página `numero` (1, 2, ...) por OFFSET, para links antigos com ?page=N.
+    Os cursores da página levam às vizinhas, já pela paginação por cursor.
+    """
+    try:
+        numero = int(numero)
+    except (TypeError, ValueError):
+        raise Http404("Página inválida.")
+    if numero < 1:
+        raise Http404("Página inválida.")
+    campos = _campos_da_ordenacao(queryset.model, ordenacao)
+    inicio = (numero - 1) * tamanho
+    itens = list(queryset.order_by(*_ordenacao(campos, True))[inicio:inicio + tamanho + 1])
+    if not itens and numero > 1:
+        raise Http404("Página inválida.")
+    ha_mais = len(itens) > tamanho
+    itens = itens[:tamanho]
+    cursor_anterior = _cursor_de(campos, itens[0], False) if itens and numero > 1 else None
+    cursor_proximo = _cursor_de(campos, itens[-1], True) if ha_mais else None
+    return PaginaCursor(itens, cursor_anterior, cursor_proximo, contador)
+
+
+class PaginacaoCursorMixin:
+    """
+    Troca a paginação por número de página do ListView pela paginação por cursor.
+    Defina `ordenacao_cursor` e `escopo_contagem` (ver casos/contagens.py) na view;
+    o template usa casos/partials/paginacao_cursor.html e `page_obj.total`.
+    ?page=N (links e favoritos antigos) ainda abre a página N.
+    """
+    ordenacao_cursor = ['-id']
+    escopo_contagem = None
+
+    def paginate_queryset(self, queryset, page_size):
+        escopo = self.escopo_contagem or queryset.model._meta.label_lower
+        contador = lambda: contar(queryset, escopo, self.request.GET)
+        cursor, numero = self.request.GET.get('cursor'), self.request.GET.get('page')
+        if numero and not cursor:
+            # Link antigo (?page=N): a página vem por OFFSET e a navegação segue por cursor
+            pagina = paginar_por_numero(queryset, self.ordenacao_cursor, numero, page_size, contador=contador)
+        else:
+            pagina = paginar_por_cursor(queryset, self.ordenacao_cursor, cursor, page_size, contador=contador)
+        return None, pagina, pagina.object_list, pagina.has_previous or pagina.has_next
@@ -0,0 +1,75 @@
+# casos/registro_versionado.py
+
+"""
+Cópia em memória (por processo) de dados que mudam pouco, validada por uma
+versão guardada no cache compartilhado. Usada pelo esquema dos campos
+customizados, pelo grafo do workflow e pelo calendário de dias úteis.
+
+Cada leitura compara a versão local com a do cache; invalidar() grava uma versão
+nova e todos os processos remontam a sua cópia na leitura seguinte. As versões
+são aleatórias: se a chave sumir do cache (expirou, Redis reiniciado, cache
+limpo) a versão criada no lugar nunca coincide com a de uma cópia antiga. Com
+o cache fora do ar, a cópia local só vale por IDADE_MAXIMA_SEM_CACHE segundos.
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+IDADE_MAXIMA_SEM_CACHE = 30  # segundos
+
+
+class RegistroVersionado:
+    def __init__(self, chave_versao, construir):
+        """`construir(anterior)` monta o objeto; `anterior` é a cópia atual da mesma versão, ou None."""
+        self.chave_versao = chave_versao
+        self.construir = construir
+        self._atual = None  # (versão, objeto, montado_em)
+        self._lock = threading.Lock()
+
+    def _versao(self):
+        try:
+            return cache.get_or_set(self.chave_versao, uuid.uuid4().hex, timeout=None)
+        except Exception as e:
+            print(f"Aviso: cache indisponível ao ler a versão de '{self.chave_versao}': {e}")
+            return None
+
+    def _vale(self, atual, versao, valido):
+        if atual is None:
+            return False
+        versao_atual, objeto, montado_em = atual
+        if versao is None:
+            # Sem cache não há como saber se outro processo mudou os dados
+            if time.monotonic() - montado_em > IDADE_MAXIMA_SEM_CACHE:
+                return False
+        elif versao_atual != versao:
+            return False
+        return valido is None or valido(objeto)
+
+    def obter(self, valido=None, construir=None):
+        """
+        Objeto atual, remontado se a versão mudou ou se `valido(objeto)` for falso
+        (`construir`, se informado, substitui o construtor nesse caso).
+        """
+        versao = self._versao()
+        atual = self._atual
+        if self._vale(atual, versao, valido):
+            return atual[1]
+        with self._lock:
+            atual = self._atual
+            if self._vale(atual, versao, valido):
+                return atual[1]
+            anterior = atual[1] if atual is not None and versao is not None and atual[0] == versao else None
+            objeto = (construir or self.construir)(anterior)
+            self._atual = (versao, objeto, time.monotonic())
+            return objeto
+
+    def invalidar(self):
+        """Descarta a cópia local e troca a versão para todos os processos."""
+        self._atual = None
+        try:
+            cache.set(self.chave_versao, uuid.uuid4().hex, timeout=None)
+        except Exception as e:
+            print(f"Aviso: cache indisponível ao invalidar '{self.chave_versao}': {e}")
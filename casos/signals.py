@@ -1,14 +1,24 @@
 # casos/signals.py (COM A FUNÇÃO MUDAR_DE_FASE CORRIGIDA)
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
 # Importa TODOS os modelos necessários para TODAS as funções
 from .models import (
     Caso, Timesheet, AndamentoCaso, AcordoCaso, ParcelaAcordo,
-    HistoricoEtapa, InstanciaAcao, EtapaFluxo
+    InstanciaAcao, Produto, EstruturaPasta, ValorCampoCaso, Campo,
+    RegraCampo, OpcaoCampo, FluxoTrabalho, EtapaFluxo, AcaoEtapa, OpcaoDecisao, Feriado
 )
+from .busca import atualizar_documentos_busca, gravar_valores_pesquisaveis, remover_valor_pesquisavel
+from .calendario import invalidar_calendario
+from .contagens import invalidar_contagens
+from .esquema_campos import invalidar_esquema
+from .estrutura_pastas import invalidar_modelos_de_pastas
+from .grafo_workflow import invalidar_grafo_workflow
+from .tasks import recalcular_prazos_acoes, recalcular_titulos_regra, reindexar_campo_pesquisavel, reconstruir_valores_json_campo
+from .valores_campos import atualizar_valores_json
 
 # A biblioteca python-dateutil é necessária. Lembre-se de adicioná-la ao requirements.txt
 try:
@@ -49,64 +59,143 @@ def criar_ou_atualizar_parcelas(sender, instance, created, **kwargs):
             ParcelaAcordo.objects.bulk_create(parcelas_a_criar)
 
 
-# ==============================================================================
-# FUNÇÃO CENTRAL DO WORKFLOW: MUDAR DE ETAPA (VERSÃO CORRIGIDA)
-# ==============================================================================
-def mudar_de_etapa(caso: Caso, nova_etapa: EtapaFluxo, usuario_acao=None):
-    """
-    Função central que executa todas as ações ao mudar de etapa do workflow.
-    
-    :param caso: A instância do Caso que está mudando de etapa.
-    :param nova_etapa: A nova EtapaFluxo para a qual o caso será movido. Pode ser None se o fluxo terminou.
-    :param usuario_acao: O usuário que executou a ação que disparou a mudança (opcional).
-    """
-    etapa_antiga = caso.etapa_atual
-    
-    # 1. Atualiza o histórico da etapa antiga (marca a data de saída)
-    if etapa_antiga:
-        HistoricoEtapa.objects.filter(
-            caso=caso, 
-            etapa=etapa_antiga, 
-            data_saida__isnull=True
-        ).update(data_saida=timezone.now())
-
-    # 2. Atualiza o caso com a nova etapa e data
-    caso.etapa_atual = nova_etapa
-    caso.data_entrada_fase = timezone.now() if nova_etapa else None
-    
-    # (Opcional) Se sua EtapaFluxo tivesse um campo para atualizar o status, a lógica entraria aqui.
-    # Ex: if nova_etapa and nova_etapa.atualiza_status_para:
-    #         caso.status = nova_etapa.atualiza_status_para
-    
-    caso.save(update_fields=['etapa_atual', 'data_entrada_fase'])
-
-    if nova_etapa:
-        # 3. Cria o novo registro de histórico para a nova etapa
-        HistoricoEtapa.objects.create(caso=caso, etapa=nova_etapa)
-
-        # 4. Cria as novas instâncias de ação (tarefas) para a nova etapa
-        for acao_modelo in nova_etapa.acoes.all():
-            responsavel = None
-            if acao_modelo.tipo_responsavel == 'CRIADOR_ACAO' and usuario_acao:
-                responsavel = usuario_acao
-            elif acao_modelo.tipo_responsavel == 'RESPONSAVEL_CASO':
-                responsavel = caso.advogado_responsavel.user if caso.advogado_responsavel else None
-            elif acao_modelo.tipo_responsavel == 'USUARIO_FIXO':
-                responsavel = acao_modelo.responsavel_fixo
-            
-            InstanciaAcao.objects.create(
-                caso=caso,
-                acao_modelo=acao_modelo,
-                responsavel=responsavel
-            )
-        
-        # 5. (Pendente) Dispara a notificação de avanço de etapa
-        # Aqui entraria a chamada para a função enviar_notificacao, que precisa ser definida
-        # contexto = { 'caso': caso, 'etapa_antiga': etapa_antiga, 'nova_etapa': nova_etapa }
-        # enviar_notificacao(slug_evento='avanco-etapa-workflow', contexto=contexto)
-        print(f"Caso #{caso.id} movido para a etapa: {nova_etapa.nome}")
-        
-    else:
-        # O workflow terminou
-        print(f"Workflow do Caso #{caso.id} foi concluído.")
-        # (Pendente) Disparar um evento de "workflow concluído"
\ No newline at end of file
+# A mudança de etapa do workflow fica em casos/workflow.py (mudar_etapa)
+
+
+# Grafo compilado do workflow (casos/grafo_workflow.py): mudanças no admin trocam a versão depois do commit
+@receiver(post_save, sender=FluxoTrabalho, dispatch_uid="invalidar_grafo_workflow_fluxo_save")
+@receiver(post_delete, sender=FluxoTrabalho, dispatch_uid="invalidar_grafo_workflow_fluxo_delete")
+@receiver(post_save, sender=EtapaFluxo, dispatch_uid="invalidar_grafo_workflow_etapa_save")
+@receiver(post_delete, sender=EtapaFluxo, dispatch_uid="invalidar_grafo_workflow_etapa_delete")
+@receiver(post_save, sender=AcaoEtapa, dispatch_uid="invalidar_grafo_workflow_acao_save")
+@receiver(post_delete, sender=AcaoEtapa, dispatch_uid="invalidar_grafo_workflow_acao_delete")
+@receiver(post_save, sender=OpcaoDecisao, dispatch_uid="invalidar_grafo_workflow_opcao_save")
+@receiver(post_delete, sender=OpcaoDecisao, dispatch_uid="invalidar_grafo_workflow_opcao_delete")
+def invalidar_grafo_workflow_signal(sender, **kwargs):
+    transaction.on_commit(invalidar_grafo_workflow)
+
+
+# Calendário de dias úteis (casos/calendario.py): feriados novos mudam os prazos das ações pendentes
+@receiver(post_save, sender=Feriado, dispatch_uid="atualizar_calendario_feriado_save")
+@receiver(post_delete, sender=Feriado, dispatch_uid="atualizar_calendario_feriado_delete")
+def atualizar_calendario_feriado(sender, **kwargs):
+    def ao_confirmar():
+        invalidar_calendario()
+        recalcular_prazos_acoes.delay()
+    transaction.on_commit(ao_confirmar)
+
+
+# Modelos de subpastas por produto (casos/estrutura_pastas.py): qualquer mudança descarta o cache,
+# depois do commit, para uma leitura concorrente não guardar a estrutura antiga de novo
+@receiver(m2m_changed, sender=Produto.estrutura_pastas.through, dispatch_uid="invalidar_estrutura_pastas_m2m")
+def invalidar_estrutura_pastas_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidar_modelos_de_pastas)
+
+
+@receiver(post_save, sender=EstruturaPasta, dispatch_uid="invalidar_estrutura_pastas_save")
+@receiver(post_delete, sender=EstruturaPasta, dispatch_uid="invalidar_estrutura_pastas_delete")
+@receiver(post_delete, sender=Produto, dispatch_uid="invalidar_estrutura_pastas_produto")
+def invalidar_estrutura_pastas(sender, **kwargs):
+    transaction.on_commit(invalidar_modelos_de_pastas)
+
+
+# Esquema dos campos customizados (casos/esquema_campos.py): qualquer mudança troca a versão,
+# depois do commit, para os outros processos não remontarem com dados ainda não gravados
+@receiver(m2m_changed, sender=RegraCampo.campos.through, dispatch_uid="invalidar_esquema_campos_m2m")
+def invalidar_esquema_campos_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidar_esquema)
+
+
+@receiver(pre_save, sender=RegraCampo, dispatch_uid="guardar_formato_titulo_anterior")
+def guardar_formato_titulo_anterior(sender, instance, raw=False, **kwargs):
+    instance._formato_titulo_anterior = None
+    if not raw and instance.pk:
+        instance._formato_titulo_anterior = RegraCampo.objects.filter(pk=instance.pk).values_list('formato_titulo', flat=True).first()
+
+
+@receiver(post_save, sender=RegraCampo, dispatch_uid="recalcular_titulos_regra")
+def recalcular_titulos_regra_signal(sender, instance, raw=False, **kwargs):
+    # Novo formato de título: os casos da regra são renomeados em segundo plano (casos/titulos.py)
+    if raw or (instance._formato_titulo_anterior or '') == instance.formato_titulo:
+        return
+    transaction.on_commit(lambda: recalcular_titulos_regra.delay(instance.cliente_id, instance.produto_id))
+
+
+@receiver(post_save, sender=RegraCampo, dispatch_uid="invalidar_esquema_campos_regra_save")
+@receiver(post_delete, sender=RegraCampo, dispatch_uid="invalidar_esquema_campos_regra_delete")
+@receiver(post_save, sender=Campo, dispatch_uid="invalidar_esquema_campos_campo_save")
+@receiver(post_delete, sender=Campo, dispatch_uid="invalidar_esquema_campos_campo_delete")
+@receiver(post_save, sender=OpcaoCampo, dispatch_uid="invalidar_esquema_campos_opcao_save")
+@receiver(post_delete, sender=OpcaoCampo, dispatch_uid="invalidar_esquema_campos_opcao_delete")
+def invalidar_esquema_campos(sender, **kwargs):
+    transaction.on_commit(invalidar_esquema)
+
+
+# Pesquisa de casos e ações (casos/busca.py): documento do título e projeção dos valores pesquisáveis
+@receiver(post_save, sender=Caso, dispatch_uid="atualizar_busca_caso")
+def atualizar_busca_caso(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'titulo_caso' not in update_fields):
+        return
+    atualizar_documentos_busca([instance.pk])
+
+
+@receiver(post_save, sender=ValorCampoCaso, dispatch_uid="atualizar_valor_pesquisavel")
+def atualizar_valor_pesquisavel(sender, instance, raw=False, **kwargs):
+    if not raw and instance.campo.pesquisavel:
+        gravar_valores_pesquisaveis([(instance.caso_id, instance.campo_id, instance.valor)])
+
+
+@receiver(post_delete, sender=ValorCampoCaso, dispatch_uid="remover_valor_pesquisavel")
+def remover_valor_pesquisavel_signal(sender, instance, **kwargs):
+    remover_valor_pesquisavel(instance.caso_id, instance.campo_id)
+
+
+@receiver(pre_save, sender=Campo, dispatch_uid="guardar_pesquisavel_anterior")
+def guardar_pesquisavel_anterior(sender, instance, raw=False, **kwargs):
+    instance._pesquisavel_anterior = instance._nome_tecnico_anterior = None
+    if not raw and instance.pk:
+        instance._pesquisavel_anterior, instance._nome_tecnico_anterior = (
+            Campo.objects.filter(pk=instance.pk).values_list('pesquisavel', 'nome_tecnico').first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Campo, dispatch_uid="reindexar_campo_pesquisavel")
+def reindexar_campo_pesquisavel_signal(sender, instance, created, raw=False, **kwargs):
+    # Marcar/desmarcar um campo refaz a projeção dele em segundo plano (pode envolver muitos casos)
+    if raw or created or instance._pesquisavel_anterior == instance.pesquisavel:
+        return
+    transaction.on_commit(lambda: reindexar_campo_pesquisavel.delay(instance.pk))
+
+
+# Cópia dos campos customizados em Caso.valores_json (casos/valores_campos.py)
+@receiver(post_save, sender=ValorCampoCaso, dispatch_uid="atualizar_valores_json_save")
+@receiver(post_delete, sender=ValorCampoCaso, dispatch_uid="atualizar_valores_json_delete")
+def atualizar_valores_json_signal(sender, instance, raw=False, **kwargs):
+    if not raw:
+        atualizar_valores_json([instance.caso_id])
+
+
+@receiver(post_save, sender=Campo, dispatch_uid="renomear_campo_valores_json")
+def renomear_campo_valores_json(sender, instance, created, raw=False, **kwargs):
+    # O JSON usa o nome técnico como chave; renomear o campo refaz o dos casos que o usam
+    if raw or created or instance._nome_tecnico_anterior == instance.nome_tecnico:
+        return
+    transaction.on_commit(lambda: reconstruir_valores_json_campo.delay(instance.pk))
+
+
+# Totais das listagens em cache (casos/contagens.py): gravações descartam os do escopo
+@receiver(post_save, sender=Caso, dispatch_uid="invalidar_contagens_caso_save")
+@receiver(post_delete, sender=Caso, dispatch_uid="invalidar_contagens_caso_delete")
+@receiver(post_save, sender=ValorCampoCaso, dispatch_uid="invalidar_contagens_valor_save")
+@receiver(post_delete, sender=ValorCampoCaso, dispatch_uid="invalidar_contagens_valor_delete")
+def invalidar_contagens_caso(sender, **kwargs):
+    # As ações também são filtradas por dados do caso (cliente, título, campos)
+    invalidar_contagens('casos', 'acoes')
+
+
+@receiver(post_save, sender=InstanciaAcao, dispatch_uid="invalidar_contagens_acao_save")
+@receiver(post_delete, sender=InstanciaAcao, dispatch_uid="invalidar_contagens_acao_delete")
+def invalidar_contagens_acao(sender, **kwargs):
+    invalidar_contagens('acoes')
@@ -1,16 +1,35 @@
 # casos/tasks.py (CORRIGIDO)
 
 import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
-import requests
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
 
 # Importa os modelos necessários
-from .models import GraphWebhookSubscription, EmailCaso, Caso
+from .models import GraphWebhookSubscription, EmailCaso, Caso, Campo, UploadAnexo
+from . import area_uploads
+from .agendador import ativar_acoes_agendadas
+from .busca import reindexar_campo
+from .calendario import recalcular_prazos
+from .estrutura_pastas import modelos_de_pastas
+from .eventos_workflow import processar_eventos
+from .indice_arquivos import sincronizar_drive
+from .titulos import recalcular_titulos
+from .valores_campos import atualizar_valores_json_do_campo
 
 # --- A CORREÇÃO PRINCIPAL ESTÁ AQUI ---
 # Importa a função correta para obter o token da APLICAÇÃO
-from .microsoft_graph_service import get_app_graph_token, criar_pasta_caso, criar_subpastas
+from .microsoft_graph_service import (
+    GRAPH_BATCH_UPLOAD_MAX, get_app_graph_token, graph_request,
+    provisionar_pastas_casos, upload_arquivo, upload_arquivos_lote
+)
 
 User = get_user_model()
 
@@ -32,10 +51,9 @@ def processar_email_webhook(subscription_id, resource_id):
             print("CELERY TASK: Falha ao obter token de aplicativo.")
             return
 
-        url = f"https://graph.microsoft.com/v1.0/users/{user.email}/messages/{resource_id}"
-        headers = {'Authorization': f'Bearer {token}'}
+        url = f"/users/{user.email}/messages/{resource_id}"
         
-        response = requests.get(url, headers=headers)
+        response = graph_request('GET', url, token=token)
         response.raise_for_status()
         email_data = response.json()
 
@@ -84,13 +102,12 @@ def buscar_detalhes_email_enviado(user_email, email_caso_id, para, assunto):
     try:
         primeiro_destinatario = para.split(',')[0].strip()
         url = (
-            f"https://graph.microsoft.com/v1.0/users/{user_email}/mailFolders('sentitems')/messages?"
+            f"/users/{user_email}/mailFolders('sentitems')/messages?"
             f"$filter=subject eq '{assunto}' and toRecipients/any(r: r/emailAddress/address eq '{primeiro_destinatario}')"
             "&$orderby=sentDateTime desc&$top=1"
         )
-        headers = {'Authorization': f'Bearer {token}'}
         
-        response = requests.get(url, headers=headers)
+        response = graph_request('GET', url, token=token)
         response.raise_for_status()
         
         emails = response.json().get('value', [])
@@ -107,27 +124,290 @@ def buscar_detalhes_email_enviado(user_email, email_caso_id, para, assunto):
         print(f"CELERY TASK: Erro ao buscar detalhes do e-mail enviado: {repr(e)}")
 
 
+PROVISIONAMENTO_AGENDADO_KEY = "casos:provisionamento_pastas:agendado"
+PROVISIONAMENTO_LOCK = "casos:provisionamento_pastas:lock"
+# Um caso cuja pasta falhou fica fora dos lotes por um tempo, para não fazer o
+# lote dos outros cair sempre no modo um a um
+PROVISIONAMENTO_ESPERA_FALHA = 60 * 60  # segundos
+
+def _chave_falha_provisionamento(caso_id):
+    return f"casos:provisionamento_pastas:falha:{caso_id}"
+
+def agendar_provisionamento_pastas():
+    """
+    Agenda o provisionamento das pastas pendentes. Vários casos criados em
+    sequência (ex: importação) resultam em uma única tarefa.
+    """
+    if cache.add(PROVISIONAMENTO_AGENDADO_KEY, 1, timeout=60):
+        provisionar_pastas_sharepoint.apply_async(countdown=5)
+
+@shared_task
+def provisionar_pastas_sharepoint(caso_ids=None):
+    """
+    Cria no SharePoint as pastas (e subpastas do produto) dos casos que ainda não
+    têm pasta. Os casos vão em lotes de SHAREPOINT_PROVISIONAMENTO_LOTE, cada
+    lote em uma única chamada ao SharePoint, com o mesmo contexto autenticado.
+    O resultado é gravado caso a caso: os que falharam ficam de fora por
+    PROVISIONAMENTO_ESPERA_FALHA segundos (a não ser que sejam pedidos em caso_ids).
+    """
+    # Casos criados a partir daqui precisam de uma nova execução
+    cache.delete(PROVISIONAMENTO_AGENDADO_KEY)
+    if not cache.add(PROVISIONAMENTO_LOCK, 1, timeout=30 * 60):
+        print("CELERY TASK: Provisionamento de pastas já em andamento; reagendando.")
+        provisionar_pastas_sharepoint.apply_async(args=[caso_ids], countdown=30)
+        return
+    try:
+        tamanho_lote = getattr(settings, 'SHAREPOINT_PROVISIONAMENTO_LOTE', 50)
+        pendentes = Caso.objects.filter(produto__isnull=False, sharepoint_folder_id__isnull=True)
+        if caso_ids is not None:
+            pendentes = pendentes.filter(id__in=caso_ids)
+        falhas = set()
+        while True:
+            lote = list(
+                pendentes.exclude(id__in=falhas)
+                .only('id', 'produto_id', 'sharepoint_folder_id', 'sharepoint_folder_url').order_by('id')[:tamanho_lote]
+            )
+            if not lote:
+                break
+            if caso_ids is None:
+                recentes = cache.get_many([_chave_falha_provisionamento(caso.id) for caso in lote])
+                adiados = {caso.id for caso in lote if _chave_falha_provisionamento(caso.id) in recentes}
+                if adiados:
+                    falhas |= adiados
+                    lote = [caso for caso in lote if caso.id not in adiados]
+                    if not lote:
+                        continue
+            # As subpastas de cada produto já vêm prontas do cache (casos/estrutura_pastas.py)
+            modelos = modelos_de_pastas()
+            estruturas = [(str(caso.id), modelos.get(caso.produto_id, [])) for caso in lote]
+            criados, falhas_lote = [], []
+            for caso, pasta in zip(lote, provisionar_pastas_casos(estruturas)):
+                if pasta:
+                    caso.sharepoint_folder_id, caso.sharepoint_folder_url = pasta['id'], pasta['webUrl']
+                    criados.append(caso)
+                else:
+                    falhas_lote.append(caso.id)
+            Caso.objects.bulk_update(criados, ['sharepoint_folder_id', 'sharepoint_folder_url'])
+            if falhas_lote:
+                falhas.update(falhas_lote)
+                cache.set_many({_chave_falha_provisionamento(caso_id): 1 for caso_id in falhas_lote}, timeout=PROVISIONAMENTO_ESPERA_FALHA)
+            print(f"CELERY TASK: Pastas do SharePoint criadas para {len(criados)} caso(s).")
+        if falhas:
+            print(f"CELERY TASK: Pastas dos casos {sorted(falhas)} não criadas agora; serão tentadas de novo mais tarde.")
+    finally:
+        cache.delete(PROVISIONAMENTO_LOCK)
+
+
 @shared_task
 def criar_estrutura_sharepoint_async(caso_id):
+    # Mantida para mensagens já enfileiradas; o provisionamento agora é em lote
+    provisionar_pastas_sharepoint(caso_ids=[caso_id])
+
+
+# Um upload 'enviando' há mais tempo que isso ficou órfão (worker reiniciado no meio) e pode ser retomado
+UPLOAD_ANEXOS_TEMPO_LIMITE = getattr(settings, 'UPLOAD_ANEXOS_TEMPO_LIMITE', 2 * 60 * 60)
+# Uploads não concluídos depois disso são abandonados e o conteúdo guardado é apagado
+UPLOAD_ANEXOS_RETENCAO = 24 * 60 * 60
+# Pendentes há mais que isso sem ninguém pegar (a tarefa do on_commit se perdeu) são reenfileirados
+UPLOAD_ANEXOS_ESPERA_FILA = 5 * 60
+
+
+def _finalizar_upload(upload, enviado, erro=''):
+    if enviado:
+        upload.status, upload.erro, upload.data_conclusao = 'concluido', '', timezone.now()
+        area_uploads.descartar([upload.pk])
+    else:
+        upload.status, upload.erro = 'erro', erro or 'Falha no envio para o SharePoint.'
+    upload.save(update_fields=['status', 'erro', 'data_conclusao'])
+
+
+def _enviar_upload_anexo(upload):
+    """Envia um arquivo grande (em blocos). Roda em uma thread do pool da tarefa."""
     try:
-        caso = Caso.objects.get(id=caso_id)
-        if not caso.produto: return
-
-        nome_pasta_sanitizado = str(caso.id)
-        pasta_criada_json = criar_pasta_caso(nome_pasta_sanitizado)
-
-        if pasta_criada_json:
-            caso.sharepoint_folder_id = pasta_criada_json['id']
-            caso.sharepoint_folder_url = pasta_criada_json['webUrl']
-            caso.save(update_fields=['sharepoint_folder_id', 'sharepoint_folder_url'])
-            
-            id_pasta_pai = pasta_criada_json['id']
-            subpastas = [p.nome_pasta for p in caso.produto.estrutura_pastas.all()]
-            if subpastas:
-                subpastas_sanitizadas = ["".join(c if c not in r'<>:"/\|?*' else '-' for c in nome_sub) for nome_sub in subpastas]
-                criar_subpastas(id_pasta_pai, subpastas_sanitizadas)
-            print(f"Estrutura do SharePoint criada para o Caso #{caso_id}")
+        arquivo = area_uploads.ArquivoDoUpload(upload)
+        enviado = upload_arquivo(upload.pasta_destino_id, upload.nome_arquivo, arquivo, identificador=f"anexo-{upload.pk}")
+        _finalizar_upload(upload, enviado)
+    except Exception as e:
+        _finalizar_upload(upload, False, repr(e))
+    finally:
+        # Cada thread abre a sua própria conexão com o banco; fecha ao terminar
+        connection.close()
+
+
+def _reservar_uploads(upload_ids):
+    """
+    Marca como 'enviando' os uploads que ninguém está enviando: pendentes, com
+    erro, ou 'enviando' há mais de UPLOAD_ANEXOS_TEMPO_LIMITE. Retorna os reservados.
+    """
+    agora = timezone.now()
+    parado_desde = agora - timedelta(seconds=UPLOAD_ANEXOS_TEMPO_LIMITE)
+    disponiveis = (
+        Q(status__in=['pendente', 'erro'])
+        | Q(status='enviando', ultima_tentativa__lt=parado_desde)
+        | Q(status='enviando', ultima_tentativa__isnull=True)
+    )
+    UploadAnexo.objects.filter(disponiveis, id__in=upload_ids).update(status='enviando', ultima_tentativa=agora)
+    return list(UploadAnexo.objects.filter(id__in=upload_ids, status='enviando', ultima_tentativa=agora))
+
+
+@shared_task(bind=True, max_retries=3)
+def processar_uploads_anexos(self, upload_ids):
+    """
+    Envia ao SharePoint os arquivos que a view guardou no banco (casos/area_uploads.py).
+
+    Arquivos pequenos de uma mesma pasta vão juntos em lotes do Graph ($batch);
+    os grandes são enviados em paralelo, com no máximo UPLOAD_ANEXOS_CONCORRENCIA
+    ao mesmo tempo. Os que falharem são reenviados em novas tentativas (os
+    uploads em blocos retomam de onde pararam).
+    """
+    uploads = _reservar_uploads(upload_ids)
+    if not uploads:
+        return
+
+    pequenos_por_pasta, grandes = defaultdict(list), []
+    for upload in uploads:
+        if upload.tamanho <= GRAPH_BATCH_UPLOAD_MAX:
+            pequenos_por_pasta[upload.pasta_destino_id].append(upload)
         else:
-            print(f"Falha ao criar pasta principal no SharePoint para o Caso #{caso_id}")
+            grandes.append(upload)
+
+    for pasta_id, pequenos in pequenos_por_pasta.items():
+        lote, conteudos = [], []
+        for upload in pequenos:
+            try:
+                conteudos.append((upload.nome_arquivo, area_uploads.ler(upload)))
+                lote.append(upload)
+            except Exception as e:
+                _finalizar_upload(upload, False, repr(e))
+        if not lote:
+            continue
+        try:
+            resultados = upload_arquivos_lote(pasta_id, conteudos)
+        except Exception as e:
+            print(f"CELERY TASK: Erro ao enviar lote de anexos para a pasta {pasta_id}: {repr(e)}")
+            resultados = [False] * len(lote)
+        for upload, enviado in zip(lote, resultados):
+            _finalizar_upload(upload, enviado)
+
+    if grandes:
+        concorrencia = getattr(settings, 'UPLOAD_ANEXOS_CONCORRENCIA', 3)
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            list(executor.map(_enviar_upload_anexo, grandes))
+
+    if any(u.status == 'concluido' for u in uploads):
+        # Traz os arquivos novos para o índice local sem esperar a próxima rodada periódica
+        sincronizar_arquivos_sharepoint.delay()
+
+    falhas = [u.id for u in uploads if u.status == 'erro']
+    if falhas:
+        if self.request.retries < self.max_retries:
+            print(f"CELERY TASK: {len(falhas)} anexo(s) falharam; nova tentativa agendada.")
+            raise self.retry(args=[falhas], countdown=60 * (self.request.retries + 1))
+        # Esgotou as tentativas: descarta o conteúdo guardado
+        area_uploads.descartar(falhas)
+
+
+@shared_task
+def retomar_uploads_anexos():
+    """
+    Roda no beat. Reenfileira os uploads órfãos (worker reiniciado no meio do
+    envio, ou tarefa que nunca chegou à fila), abandona os que passaram de
+    UPLOAD_ANEXOS_RETENCAO sem concluir e apaga o conteúdo guardado que sobrou.
+    """
+    agora = timezone.now()
+    limite_retencao = agora - timedelta(seconds=UPLOAD_ANEXOS_RETENCAO)
+
+    abandonados = list(
+        UploadAnexo.objects.filter(status__in=['pendente', 'enviando'], data_criacao__lt=limite_retencao).values_list('id', flat=True)
+    )
+    if abandonados:
+        UploadAnexo.objects.filter(id__in=abandonados).update(
+            status='erro', erro='Envio não concluído a tempo; envie o arquivo de novo.', ultima_tentativa=agora,
+        )
+        area_uploads.descartar(abandonados)
+        print(f"CELERY TASK: {len(abandonados)} upload(s) de anexo abandonado(s).")
+
+    parado_desde = agora - timedelta(seconds=UPLOAD_ANEXOS_TEMPO_LIMITE)
+    orfaos = list(
+        UploadAnexo.objects.filter(
+            Q(status='pendente', data_criacao__lt=agora - timedelta(seconds=UPLOAD_ANEXOS_ESPERA_FILA))
+            | Q(status='enviando', ultima_tentativa__lt=parado_desde)
+            | Q(status='enviando', ultima_tentativa__isnull=True),
+        ).values_list('id', flat=True)
+    )
+    if orfaos:
+        processar_uploads_anexos.delay(orfaos)
+        print(f"CELERY TASK: {len(orfaos)} upload(s) de anexo parado(s) reenfileirado(s).")
+
+    descartados = area_uploads.descartar_orfaos(limite_retencao)
+    if descartados:
+        print(f"CELERY TASK: Conteúdo guardado de {descartados} upload(s) finalizado(s) apagado(s).")
+
+
+SINCRONIZACAO_DRIVE_LOCK = "casos:sincronizacao_drive:lock"
+
+@shared_task
+def sincronizar_arquivos_sharepoint():
+    """
+    Atualiza a tabela ArquivoSharePoint com as mudanças do drive (consulta delta).
+    Roda periodicamente pelo Celery beat e também sob demanda (webhook do drive,
+    uploads concluídos). Só uma execução por vez.
+    """
+    if not cache.add(SINCRONIZACAO_DRIVE_LOCK, 1, timeout=15 * 60):
+        print("CELERY TASK: Sincronização do drive já em andamento; ignorando.")
+        return
+    try:
+        total = sincronizar_drive()
+        print(f"CELERY TASK: Sincronização do drive concluída ({total} item(ns) recebido(s)).")
     except Exception as e:
-        print(f"Erro na tarefa de criação de pasta do SharePoint: {e}")
\ No newline at end of file
+        print(f"CELERY TASK: Erro na sincronização do drive: {repr(e)}")
+    finally:
+        cache.delete(SINCRONIZACAO_DRIVE_LOCK)
+
+
+@shared_task
+def reindexar_campo_pesquisavel(campo_id):
+    """Refaz a projeção de pesquisa (ValorPesquisavelCaso) de um campo que mudou de pesquisável."""
+    try:
+        campo = Campo.objects.get(id=campo_id)
+    except Campo.DoesNotExist:
+        return
+    reindexar_campo(campo)
+    print(f"CELERY TASK: Projeção de pesquisa do campo '{campo.nome_tecnico}' refeita.")
+
+
+@shared_task
+def reconstruir_valores_json_campo(campo_id):
+    """Refaz Caso.valores_json dos casos que têm valor para um campo renomeado."""
+    atualizar_valores_json_do_campo(campo_id)
+    print(f"CELERY TASK: Valores dos campos refeitos para os casos do campo #{campo_id}.")
+
+
+@shared_task
+def recalcular_titulos_regra(cliente_id, produto_id):
+    """Refaz o título dos casos de uma regra cujo formato de título mudou."""
+    alterados = recalcular_titulos(cliente_id=cliente_id, produto_id=produto_id)
+    print(f"CELERY TASK: {alterados} título(s) de caso atualizado(s) (cliente #{cliente_id}, produto #{produto_id}).")
+
+
+@shared_task
+def recalcular_prazos_acoes():
+    """Refaz o prazo das ações pendentes em dias úteis depois de uma mudança nos feriados."""
+    alterados = recalcular_prazos()
+    print(f"CELERY TASK: {alterados} prazo(s) de ação recalculado(s).")
+
+
+@shared_task
+def processar_eventos_workflow():
+    """Consome a fila de efeitos do workflow (e-mails). Ver casos/eventos_workflow.py."""
+    total = processar_eventos()
+    if total:
+        print(f"CELERY TASK: {total} evento(s) do workflow processado(s).")
+
+
+@shared_task
+def abrir_lembretes_vencidos():
+    """Abre as ações dos lembretes (aguardar dias) que venceram. Ver casos/agendador.py."""
+    total = ativar_acoes_agendadas()
+    if total:
+        print(f"CELERY TASK: {total} lembrete(s) do workflow aberto(s).")
@@ -0,0 +1,989 @@
+import io
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from clientes.models import Cliente
+
+from . import agendador, area_uploads, eventos_workflow, indice_arquivos, registro_versionado, tasks, views
+from .calendario import invalidar_calendario, prazo_da_acao, recalcular_prazos, somar_dias_uteis
+from . import microsoft_graph_service as graph
+from .esquema_campos import invalidar_esquema
+from .estrutura_pastas import modelos_de_pastas
+from .forms import CasoUpdateForm
+from .grafo_workflow import grafo_workflow, invalidar_grafo_workflow
+from .paginacao import paginar_por_cursor, paginar_por_numero
+from .models import (AcaoAgendada, AcaoEtapa, ArquivoSharePoint, BlocoUploadAnexo, Campo, Caso, EstruturaPasta, EtapaFluxo, EventoWorkflow, Feriado,
+                     FluxoInterno, FluxoTrabalho, InstanciaAcao, OpcaoDecisao, Produto, RegraCampo,
+                     SincronizacaoDrive, Status, UploadAnexo, ValorCampoCaso)
+from .registro_versionado import RegistroVersionado
+from .titulos import _compilar, recalcular_titulos
+from .valores_campos import salvar_valores_do_caso
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'casos-tests'}}
+
+
+def _criar_caso(**campos):
+    campos.setdefault('cliente', Cliente.objects.get_or_create(nome_razao_social='Cliente Teste')[0])
+    campos.setdefault('produto', Produto.objects.get_or_create(nome='Produto Teste')[0])
+    campos.setdefault('status', Status.objects.get_or_create(nome='Ativo')[0])
+    campos.setdefault('data_entrada_rca', timezone.localdate())
+    return Caso.objects.create(**campos)
+
+
+# ==============================================================================
+# TOKEN DA APLICAÇÃO (user-001)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class TokenAplicacaoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        graph._msal_app = None
+        graph._token_local.update(access_token=None, expira_em=0)
+        self.app = mock.Mock()
+        self.app.acquire_token_for_client.return_value = {'access_token': 'token-1', 'expires_in': 3600}
+        patcher = mock.patch.object(graph.msal, 'ConfidentialClientApplication', return_value=self.app)
+        self.construtor = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, graph, '_msal_app', None)
+
+    def _em_thread(self, funcao):
+        # Um deadlock no lock do token travaria o teste: roda com limite de tempo
+        resultado = {}
+        thread = threading.Thread(target=lambda: resultado.setdefault('token', funcao()), daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "get_app_graph_token travou")
+        return resultado['token']
+
+    def test_primeira_chamada_nao_trava(self):
+        self.assertEqual(self._em_thread(graph.get_app_graph_token), 'token-1')
+        self.construtor.assert_called_once()
+
+    def test_reaproveita_token_em_memoria(self):
+        graph.get_app_graph_token()
+        graph.get_app_graph_token()
+        self.app.acquire_token_for_client.assert_called_once()
+
+    def test_reaproveita_token_do_cache_compartilhado(self):
+        graph.get_app_graph_token()
+        # Outro processo: memória vazia, cache compartilhado preenchido
+        graph._token_local.update(access_token=None, expira_em=0)
+        self.assertEqual(graph.get_app_graph_token(), 'token-1')
+        self.app.acquire_token_for_client.assert_called_once()
+
+    def test_renova_perto_do_vencimento(self):
+        graph.get_app_graph_token()
+        graph._token_local['expira_em'] = time.time() + graph.GRAPH_TOKEN_MARGEM_RENOVACAO - 1
+        cache.clear()
+        self.app.acquire_token_for_client.return_value = {'access_token': 'token-2', 'expires_in': 3600}
+        self.assertEqual(graph.get_app_graph_token(), 'token-2')
+
+    def test_invalidar_forca_nova_chamada(self):
+        graph.get_app_graph_token()
+        graph.invalidar_app_graph_token()
+        graph.get_app_graph_token()
+        self.assertEqual(self.app.acquire_token_for_client.call_count, 2)
+
+    def test_falha_do_azure_gera_erro(self):
+        self.app.acquire_token_for_client.return_value = {'error_description': 'credencial inválida'}
+        with self.assertRaises(Exception):
+            graph.get_app_graph_token()
+
+
+# ==============================================================================
+# UPLOAD EM PARTES (user-004)
+# ==============================================================================
+
+def _resposta(status, json=None):
+    resposta = mock.Mock(status_code=status, text='')
+    resposta.json.return_value = json or {}
+    return resposta
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class UploadEmPartesTests(SimpleTestCase):
+    CONTEUDO = b'0123456789abcdef'
+
+    def setUp(self):
+        cache.clear()
+        for alvo, valor in [('GRAPH_UPLOAD_BLOCO', 4), ('invalidar_listagem', mock.Mock())]:
+            patcher = mock.patch.object(graph, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(graph, 'graph_request', side_effect=self._graph_request)
+        self.graph_request = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.faixas = []
+
+    def _graph_request(self, metodo, url, **kwargs):
+        if metodo == 'POST':
+            return _resposta(200, {'uploadUrl': f'https://upload/{len(self.faixas)}'})
+        if metodo == 'GET':
+            return _resposta(200, {'nextExpectedRanges': ['8-']})
+        faixa = kwargs['headers']['Content-Range']
+        self.faixas.append(faixa)
+        return _resposta(201 if faixa.startswith('bytes 12-') else 202)
+
+    def _enviar(self, conteudo=CONTEUDO, identificador='anexo-1'):
+        return graph.upload_arquivo_em_partes('pasta', 'doc.pdf', io.BytesIO(conteudo), len(conteudo), identificador=identificador)
+
+    def test_envia_em_blocos(self):
+        self.assertTrue(self._enviar())
+        self.assertEqual(self.faixas, ['bytes 0-3/16', 'bytes 4-7/16', 'bytes 8-11/16', 'bytes 12-15/16'])
+
+    def test_retoma_sessao_do_mesmo_envio(self):
+        chave = graph._chave_sessao_upload('pasta', 'doc.pdf', 16, 'anexo-1')
+        cache.set(chave, 'https://upload/antiga')
+        self.assertTrue(self._enviar())
+        # Continua do byte confirmado pelo Graph, sem criar outra sessão
+        self.assertEqual(self.faixas, ['bytes 8-11/16', 'bytes 12-15/16'])
+        self.assertNotIn('POST', [c.args[0] for c in self.graph_request.call_args_list])
+        self.assertIsNone(cache.get(chave))
+
+    def test_outro_envio_com_mesmo_nome_e_tamanho_nao_retoma(self):
+        cache.set(graph._chave_sessao_upload('pasta', 'doc.pdf', 16, 'anexo-1'), 'https://upload/antiga')
+        self.assertTrue(self._enviar(identificador='anexo-2'))
+        self.assertEqual(self.faixas[0], 'bytes 0-3/16')
+
+    def test_sem_identificador_usa_hash_do_conteudo(self):
+        outro = b'fedcba9876543210'
+        cache.set(graph._chave_sessao_upload('pasta', 'doc.pdf', 16, graph._hash_conteudo(io.BytesIO(outro))), 'https://upload/antiga')
+        self.assertTrue(self._enviar(identificador=None))
+        self.assertEqual(self.faixas[0], 'bytes 0-3/16')
+
+    def test_cache_fora_do_ar_nao_impede_o_upload(self):
+        with mock.patch.object(graph.cache, 'get', side_effect=ConnectionError), \
+             mock.patch.object(graph.cache, 'set', side_effect=ConnectionError), \
+             mock.patch.object(graph.cache, 'delete', side_effect=ConnectionError):
+            self.assertTrue(self._enviar())
+
+
+# ==============================================================================
+# ANEXOS GUARDADOS ATÉ O ENVIO (user-005)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class AreaUploadsTests(TestCase):
+    CONTEUDO = b'0123456789abcdef!'
+
+    def setUp(self):
+        patcher = mock.patch.object(area_uploads, 'TAMANHO_BLOCO', 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.caso = _criar_caso()
+
+    def _upload(self, conteudo=CONTEUDO, **campos):
+        upload = UploadAnexo.objects.create(caso=self.caso, nome_arquivo='doc.pdf', pasta_destino_id='pasta', tamanho=len(conteudo), **campos)
+        area_uploads.guardar(upload, SimpleUploadedFile('doc.pdf', conteudo))
+        return upload
+
+    def test_guarda_em_blocos_e_le_de_volta(self):
+        upload = self._upload()
+        self.assertEqual(upload.blocos.count(), 5)
+        self.assertEqual(area_uploads.ler(upload), self.CONTEUDO)
+
+    def test_arquivo_vazio(self):
+        self.assertEqual(area_uploads.ler(self._upload(b'')), b'')
+
+    def test_leitura_com_seek_atravessa_blocos(self):
+        arquivo = area_uploads.ArquivoDoUpload(self._upload())
+        arquivo.seek(6)
+        self.assertEqual(arquivo.read(5), b'6789a')
+        self.assertEqual(arquivo.tell(), 11)
+        self.assertEqual(arquivo.read(), b'bcdef!')
+        self.assertEqual(arquivo.read(), b'')
+
+    def test_bloco_faltando_e_erro_e_nao_arquivo_truncado(self):
+        upload = self._upload()
+        upload.blocos.filter(ordem=2).delete()
+        with self.assertRaises(area_uploads.AreaUploadsIncompleta):
+            area_uploads.ler(upload)
+        with self.assertRaises(area_uploads.AreaUploadsIncompleta):
+            area_uploads.ArquivoDoUpload(upload).read()
+
+    def test_envio_apaga_o_conteudo_guardado(self):
+        upload = self._upload()
+        with mock.patch.object(tasks, 'upload_arquivos_lote', return_value=[True]) as lote, \
+             mock.patch.object(tasks.sincronizar_arquivos_sharepoint, 'delay'):
+            tasks.processar_uploads_anexos([upload.pk])
+        lote.assert_called_once_with('pasta', [('doc.pdf', self.CONTEUDO)])
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, 'concluido')
+        self.assertFalse(upload.blocos.exists())
+
+    def test_retoma_so_o_enviando_parado(self):
+        agora = timezone.now()
+        parado = self._upload(status='enviando', ultima_tentativa=agora - timedelta(seconds=tasks.UPLOAD_ANEXOS_TEMPO_LIMITE + 60))
+        em_andamento = self._upload(status='enviando', ultima_tentativa=agora - timedelta(minutes=1))
+        self.assertEqual([u.pk for u in tasks._reservar_uploads([parado.pk, em_andamento.pk])], [parado.pk])
+
+    def test_tarefa_periodica_reenfileira_abandona_e_limpa(self):
+        agora = timezone.now()
+        parado = self._upload(status='enviando', ultima_tentativa=agora - timedelta(seconds=tasks.UPLOAD_ANEXOS_TEMPO_LIMITE + 60))
+        velho = self._upload(status='pendente')
+        UploadAnexo.objects.filter(pk=velho.pk).update(data_criacao=agora - timedelta(days=2))
+        concluido = self._upload(status='concluido')
+        falhou_ha_pouco = self._upload(status='erro', ultima_tentativa=agora)
+        with mock.patch.object(tasks.processar_uploads_anexos, 'delay') as delay:
+            tasks.retomar_uploads_anexos()
+        delay.assert_called_once_with([parado.pk])
+        velho.refresh_from_db()
+        self.assertEqual(velho.status, 'erro')
+        self.assertEqual(
+            set(BlocoUploadAnexo.objects.values_list('upload_id', flat=True).distinct()),
+            {parado.pk, falhou_ha_pouco.pk},
+        )
+        self.assertFalse(concluido.blocos.exists())
+
+
+# ==============================================================================
+# LISTAGEM ASSÍNCRONA DO SHAREPOINT (user-007)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ListagemAsyncTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.cliente = mock.Mock()
+        self.cliente.get = mock.AsyncMock()
+        for alvo, valor in [
+            ('_get_cliente_async', mock.Mock(return_value=self.cliente)),
+            ('get_app_graph_token', mock.Mock(return_value='token')),
+            ('invalidar_app_graph_token', mock.Mock()),
+        ]:
+            patcher = mock.patch.object(graph, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_lista_e_guarda_no_cache(self):
+        self.cliente.get.return_value = _resposta(200, {'value': [{'id': 'a', 'name': 'a.pdf'}]})
+        self.assertEqual(await graph.listar_arquivos_e_pastas_async('pasta'), [{'id': 'a', 'name': 'a.pdf'}])
+        # Segunda leitura vem do cache, sem ir ao Graph
+        self.assertEqual(await graph.listar_arquivos_e_pastas_async('pasta'), [{'id': 'a', 'name': 'a.pdf'}])
+        self.cliente.get.assert_awaited_once()
+
+    async def test_401_renova_o_token_e_repete(self):
+        self.cliente.get.side_effect = [_resposta(401), _resposta(200, {'value': []})]
+        self.assertEqual(await graph.listar_arquivos_e_pastas_async('pasta'), [])
+        graph.invalidar_app_graph_token.assert_called_once()
+        self.assertEqual(self.cliente.get.await_count, 2)
+
+    async def test_erro_do_graph_devolve_lista_vazia(self):
+        self.cliente.get.return_value = _resposta(503)
+        self.assertEqual(await graph.listar_arquivos_e_pastas_async('pasta'), [])
+
+
+# ==============================================================================
+# ÍNDICE LOCAL DO DRIVE (user-008)
+# ==============================================================================
+
+def _item(item_id, pai_id, pasta=False, unique_id=''):
+    item = {'id': item_id, 'name': item_id, 'parentReference': {'id': pai_id}, 'sharepointIds': {'listItemUniqueId': unique_id}}
+    item['folder' if pasta else 'file'] = {}
+    return item
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class IndiceArquivosTests(TestCase):
+    def setUp(self):
+        self.paginas = []
+        patcher = mock.patch.object(indice_arquivos, 'graph_request', side_effect=self._graph_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for alvo, valor in [('invalidar_todas_listagens', mock.Mock()), ('DRIVE_ID', 'drive-teste')]:
+            patcher = mock.patch.object(graph, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _graph_request(self, metodo, url):
+        itens = self.paginas.pop(0)
+        dados = {'value': itens}
+        dados['@odata.nextLink' if self.paginas else '@odata.deltaLink'] = 'https://delta/proxima'
+        return _resposta(200, dados)
+
+    def _sincronizar(self, *paginas):
+        self.paginas = list(paginas)
+        indice_arquivos.sincronizar_drive()
+
+    def _caso_de(self, item_id):
+        return ArquivoSharePoint.objects.get(item_id=item_id).caso_id
+
+    def test_liga_pastas_e_arquivos_ao_caso(self):
+        caso = _criar_caso(sharepoint_folder_id='UNIQUE-CASO')
+        # A subpasta chega numa página anterior à pasta do caso
+        self._sincronizar(
+            [_item('sub', 'pasta-caso', pasta=True), _item('arquivo', 'sub')],
+            [_item('pasta-caso', 'raiz', pasta=True, unique_id='UNIQUE-CASO'), _item('solto', 'raiz')],
+        )
+        self.assertEqual(self._caso_de('pasta-caso'), caso.pk)
+        self.assertEqual(self._caso_de('sub'), caso.pk)
+        self.assertEqual(self._caso_de('arquivo'), caso.pk)
+        self.assertIsNone(self._caso_de('solto'))
+
+    def test_delta_incremental_resolve_so_o_que_mudou(self):
+        caso = _criar_caso(sharepoint_folder_id='pasta-caso')
+        self._sincronizar([_item('pasta-caso', 'raiz', pasta=True), _item('sub', 'pasta-caso', pasta=True)])
+        with mock.patch.object(indice_arquivos, '_casos_das_pastas', wraps=indice_arquivos._casos_das_pastas) as casos_das_pastas:
+            self._sincronizar([_item('novo', 'sub')])
+        self.assertEqual(self._caso_de('novo'), caso.pk)
+        # Só um arquivo mudou: nenhuma pasta precisou ser resolvida
+        self.assertTrue(all(not chamada.args[0] for chamada in casos_das_pastas.call_args_list))
+
+    def test_pasta_movida_leva_subpastas_e_arquivos(self):
+        caso_a = _criar_caso(sharepoint_folder_id='pasta-a')
+        caso_b = _criar_caso(sharepoint_folder_id='pasta-b')
+        self._sincronizar([
+            _item('pasta-a', 'raiz', pasta=True), _item('pasta-b', 'raiz', pasta=True),
+            _item('movida', 'pasta-a', pasta=True), _item('neta', 'movida', pasta=True), _item('arquivo', 'neta'),
+        ])
+        self.assertEqual(self._caso_de('arquivo'), caso_a.pk)
+        self._sincronizar([_item('movida', 'pasta-b', pasta=True)])
+        self.assertEqual(self._caso_de('movida'), caso_b.pk)
+        self.assertEqual(self._caso_de('neta'), caso_b.pk)
+        self.assertEqual(self._caso_de('arquivo'), caso_b.pk)
+
+    def test_caso_que_recebe_a_pasta_depois(self):
+        self._sincronizar([_item('pasta', 'raiz', pasta=True), _item('arquivo', 'pasta')])
+        caso = _criar_caso(sharepoint_folder_id='pasta')
+        self._sincronizar([])
+        self.assertEqual(self._caso_de('pasta'), caso.pk)
+        self.assertEqual(self._caso_de('arquivo'), caso.pk)
+
+    def test_sem_drive_configurado_nao_sincroniza(self):
+        with mock.patch.object(graph, 'DRIVE_ID', ''):
+            self.assertEqual(indice_arquivos.sincronizar_drive(), 0)
+        self.assertFalse(SincronizacaoDrive.objects.exists())
+
+
+# ==============================================================================
+# PROVISIONAMENTO DE PASTAS EM LOTE (user-009)
+# ==============================================================================
+
+class ProvisionarPastasLoteTests(SimpleTestCase):
+    def _lote(self, estruturas, tentativas=2):
+        if len(estruturas) > 1 or estruturas[0][0] == 'ruim':
+            return None
+        return [{'id': f"id-{estruturas[0][0]}", 'webUrl': ''}]
+
+    def test_lote_que_falha_e_refeito_caso_a_caso(self):
+        with mock.patch.object(graph, '_provisionar_em_lote', side_effect=self._lote):
+            resultado = graph.provisionar_pastas_casos([('1', []), ('ruim', []), ('3', ['Docs'])])
+        self.assertEqual([p and p['id'] for p in resultado], ['id-1', None, 'id-3'])
+
+    def test_lote_inteiro_com_sucesso_em_uma_chamada(self):
+        pastas = [{'id': 'a', 'webUrl': ''}, {'id': 'b', 'webUrl': ''}]
+        with mock.patch.object(graph, '_provisionar_em_lote', return_value=pastas) as lote:
+            self.assertEqual(graph.provisionar_pastas_casos([('1', []), ('2', [])]), pastas)
+        lote.assert_called_once()
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ProvisionarPastasTarefaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ruim = _criar_caso()
+        self.bons = [_criar_caso(), _criar_caso()]
+
+    def _provisionar(self, estruturas):
+        return [None if nome == str(self.ruim.pk) else {'id': f"pasta-{nome}", 'webUrl': ''} for nome, _ in estruturas]
+
+    def test_grava_os_que_deram_certo_e_adia_so_o_que_falhou(self):
+        with mock.patch.object(tasks, 'provisionar_pastas_casos', side_effect=self._provisionar) as provisionar:
+            tasks.provisionar_pastas_sharepoint()
+            for caso in self.bons:
+                caso.refresh_from_db()
+                self.assertEqual(caso.sharepoint_folder_id, f"pasta-{caso.pk}")
+            self.ruim.refresh_from_db()
+            self.assertIsNone(self.ruim.sharepoint_folder_id)
+
+            # Na próxima execução o caso que falhou fica de fora dos lotes
+            provisionar.reset_mock()
+            novo = _criar_caso()
+            tasks.provisionar_pastas_sharepoint()
+            self.assertEqual(provisionar.call_args.args[0], [(str(novo.pk), [])])
+
+    def test_caso_pedido_explicitamente_e_tentado_de_novo(self):
+        with mock.patch.object(tasks, 'provisionar_pastas_casos', side_effect=self._provisionar) as provisionar:
+            tasks.provisionar_pastas_sharepoint()
+            provisionar.reset_mock()
+            tasks.provisionar_pastas_sharepoint(caso_ids=[self.ruim.pk])
+        provisionar.assert_called_once_with([(str(self.ruim.pk), [])])
+
+
+# ==============================================================================
+# MODELOS DE SUBPASTAS POR PRODUTO (user-010)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EstruturaPastasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.produto = Produto.objects.create(nome='Seguro')
+
+    def test_nomes_sanitizados_por_produto(self):
+        self.produto.estrutura_pastas.add(EstruturaPasta.objects.create(nome_pasta='Docs/Anexos'))
+        self.assertEqual(modelos_de_pastas()[self.produto.pk], ['Docs-Anexos'])
+
+    def test_mudanca_so_descarta_o_cache_depois_do_commit(self):
+        modelos_de_pastas()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.produto.estrutura_pastas.add(EstruturaPasta.objects.create(nome_pasta='Laudos'))
+            # Antes do commit, o cache antigo continua valendo
+            self.assertNotIn(self.produto.pk, modelos_de_pastas())
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(modelos_de_pastas()[self.produto.pk], ['Laudos'])
+
+
+# ==============================================================================
+# CAMPOS CUSTOMIZADOS DO CASO (user-016, user-018)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ValoresCamposTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.caso = _criar_caso()
+        self.regra = RegraCampo.objects.create(cliente=self.caso.cliente, produto=self.caso.produto)
+        self.regra.campos.add(
+            Campo.objects.create(nome_label='Aviso', nome_tecnico='aviso'),
+            Campo.objects.create(nome_label='Vencimento', nome_tecnico='vencimento', tipo_campo='date'),
+        )
+        # Os sinais só trocam a versão do esquema no commit, que não acontece dentro do TestCase
+        invalidar_esquema()
+
+    def _dados_formulario(self, **dinamicos):
+        dados = {
+            'cliente': self.caso.cliente_id, 'produto': self.caso.produto_id, 'status': self.caso.status_id,
+            'data_entrada_rca': self.caso.data_entrada_rca.isoformat(), 'titulo_caso': '',
+        }
+        dados.update({f"dynamic_{nome}": valor for nome, valor in dinamicos.items()})
+        return dados
+
+    def test_upsert_atualiza_valor_e_json(self):
+        salvar_valores_do_caso(self.caso, {'aviso': 'A-1', 'desconhecido': 'x'})
+        salvar_valores_do_caso(self.caso, {'aviso': 'A-2'})
+        self.assertEqual(list(ValorCampoCaso.objects.filter(caso=self.caso).values_list('valor', flat=True)), ['A-2'])
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.valores_json, {'aviso': 'A-2'})
+
+    def test_formulario_valida_os_campos_dinamicos(self):
+        form = CasoUpdateForm(data=self._dados_formulario(aviso='A-1', vencimento='31/02/2025'), instance=self.caso)
+        self.assertFalse(form.is_valid())
+        self.assertIn('dynamic_vencimento', form.errors)
+
+    def test_formulario_entrega_valores_normalizados(self):
+        form = CasoUpdateForm(data=self._dados_formulario(aviso='A-1', vencimento='2025-03-01'), instance=self.caso)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.valores_dinamicos(), {'aviso': 'A-1', 'vencimento': '2025-03-01'})
+
+
+# ==============================================================================
+# TÍTULO GERADO DOS CASOS (user-019)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class TitulosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.caso = _criar_caso()
+        self.regra = RegraCampo.objects.create(cliente=self.caso.cliente, produto=self.caso.produto, formato_titulo='Aviso: {{ aviso }}')
+        self.regra.campos.add(Campo.objects.create(nome_label='Aviso', nome_tecnico='aviso'))
+        invalidar_esquema()
+
+    def test_salvar_valores_refaz_o_titulo(self):
+        salvar_valores_do_caso(self.caso, {'aviso': '123'})
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.titulo_caso, 'Aviso: 123')
+
+    def test_gravar_um_valor_pelo_orm_tambem_refaz(self):
+        ValorCampoCaso.objects.create(caso=self.caso, campo=Campo.objects.get(nome_tecnico='aviso'), valor='456')
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.titulo_caso, 'Aviso: 456')
+
+    def test_recalcular_depois_de_mudar_o_formato(self):
+        salvar_valores_do_caso(self.caso, {'aviso': '123'})
+        RegraCampo.objects.filter(pk=self.regra.pk).update(formato_titulo='{{ aviso }} (novo)')
+        self.assertEqual(recalcular_titulos(self.caso.cliente_id, self.caso.produto_id), 1)
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.titulo_caso, '123 (novo)')
+
+    def test_template_compilado_uma_vez(self):
+        _compilar.cache_clear()
+        for valor in ('1', '2', '3'):
+            salvar_valores_do_caso(self.caso, {'aviso': valor})
+        self.assertEqual(_compilar.cache_info().misses, 1)
+
+    def test_formato_invalido_mantem_o_titulo(self):
+        salvar_valores_do_caso(self.caso, {'aviso': '123'})
+        RegraCampo.objects.filter(pk=self.regra.pk).update(formato_titulo='Aviso: {% if aviso %}')
+        invalidar_esquema()
+        salvar_valores_do_caso(self.caso, {'aviso': '456'})
+        self.assertEqual(recalcular_titulos(self.caso.cliente_id, self.caso.produto_id), 0)
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.titulo_caso, 'Aviso: 123')
+
+    def test_clean_recusa_formato_invalido(self):
+        self.regra.formato_titulo = 'Aviso: {{ aviso|filtro_inexistente }}'
+        with self.assertRaises(ValidationError) as contexto:
+            self.regra.clean()
+        self.assertIn('formato_titulo', contexto.exception.message_dict)
+
+
+# ==============================================================================
+# REGISTROS EM MEMÓRIA VERSIONADOS (user-020, user-022)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class RegistroVersionadoTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.montagens = 0
+        self.registro = RegistroVersionado('testes:registro:versao', self._construir)
+
+    def _construir(self, anterior):
+        self.montagens += 1
+        return {'montagem': self.montagens}
+
+    def test_reaproveita_enquanto_a_versao_nao_muda(self):
+        self.assertIs(self.registro.obter(), self.registro.obter())
+        self.assertEqual(self.montagens, 1)
+
+    def test_invalidar_de_outro_processo_remonta(self):
+        self.registro.obter()
+        RegistroVersionado('testes:registro:versao', self._construir).invalidar()
+        self.assertEqual(self.registro.obter(), {'montagem': 2})
+
+    def test_versao_perdida_no_cache_remonta(self):
+        self.registro.obter()
+        cache.clear()
+        self.assertEqual(self.registro.obter(), {'montagem': 2})
+
+    def test_cache_fora_do_ar_nao_guarda_a_copia_para_sempre(self):
+        self.registro.obter()
+        with mock.patch.object(registro_versionado.cache, 'get_or_set', side_effect=ConnectionError):
+            self.registro.obter()
+            self.assertEqual(self.montagens, 1)
+            with mock.patch.object(registro_versionado.time, 'monotonic', return_value=time.monotonic() + registro_versionado.IDADE_MAXIMA_SEM_CACHE + 1):
+                self.registro.obter()
+        self.assertEqual(self.montagens, 2)
+
+    def test_valido_falso_remonta_com_o_construtor_informado(self):
+        self.registro.obter()
+        objeto = self.registro.obter(valido=lambda atual: False, construir=lambda anterior: {'anterior': anterior})
+        self.assertEqual(objeto, {'anterior': {'montagem': 1}})
+
+
+# ==============================================================================
+# PAGINAÇÃO POR CURSOR (user-014)
+# ==============================================================================
+
+class PaginacaoCursorTests(TestCase):
+    def setUp(self):
+        caso = _criar_caso()
+        fluxo = FluxoTrabalho.objects.create(nome='Fluxo', cliente=caso.cliente, produto=caso.produto)
+        etapa = EtapaFluxo.objects.create(fluxo_trabalho=fluxo, nome='Análise')
+        acao_modelo = AcaoEtapa.objects.create(etapa_fluxo=etapa, titulo='Revisar')
+        base = timezone.make_aware(datetime(2026, 5, 4, 12, 0))
+        # Prazos repetidos e nulos: o desempate é pelo id
+        for dias in (3, 1, None, 1, 2, None, 3, 1):
+            InstanciaAcao.objects.create(
+                caso=caso, acao_modelo=acao_modelo, prazo_final=None if dias is None else base + timedelta(days=dias),
+            )
+        self.acoes = list(InstanciaAcao.objects.all())
+
+    def _percorrer(self, ordenacao, tamanho):
+        """Páginas (listas de ids) indo até o fim pelo cursor_proximo e voltando pelo cursor_anterior."""
+        ida, cursor = [], None
+        while True:
+            pagina = paginar_por_cursor(InstanciaAcao.objects.all(), ordenacao, cursor, tamanho)
+            ida.append([acao.pk for acao in pagina])
+            if not pagina.has_next:
+                break
+            cursor = pagina.cursor_proximo
+        volta = []
+        while pagina.has_previous:
+            pagina = paginar_por_cursor(InstanciaAcao.objects.all(), ordenacao, pagina.cursor_anterior, tamanho)
+            volta.append([acao.pk for acao in pagina])
+        return ida, volta[::-1]
+
+    def _esperado(self, decrescente):
+        preenchidas = sorted(
+            (acao for acao in self.acoes if acao.prazo_final),
+            key=lambda acao: (-acao.prazo_final.timestamp() if decrescente else acao.prazo_final.timestamp(), acao.pk),
+        )
+        # Nulos sempre por último
+        return [acao.pk for acao in preenchidas] + sorted(acao.pk for acao in self.acoes if not acao.prazo_final)
+
+    def test_ida_e_volta_com_prazos_repetidos_e_nulos(self):
+        for tamanho in (1, 2, 3):
+            with self.subTest(tamanho=tamanho):
+                ida, volta = self._percorrer(['prazo_final', 'id'], tamanho)
+                self.assertEqual(sum(ida, []), self._esperado(decrescente=False))
+                self.assertTrue(all(len(pagina) == tamanho for pagina in ida[:-1]))
+                self.assertEqual(volta, ida[:-1])
+
+    def test_ordem_decrescente(self):
+        ida, volta = self._percorrer(['-prazo_final', 'id'], 3)
+        self.assertEqual(sum(ida, []), self._esperado(decrescente=True))
+        self.assertEqual(volta, ida[:-1])
+
+    def test_page_n_dos_links_antigos_continua_pelo_cursor(self):
+        ordenacao = ['prazo_final', 'id']
+        ida, _ = self._percorrer(ordenacao, 3)
+        for numero, esperada in enumerate(ida, start=1):
+            with self.subTest(numero=numero):
+                pagina = paginar_por_numero(InstanciaAcao.objects.all(), ordenacao, str(numero), 3)
+                self.assertEqual([acao.pk for acao in pagina], esperada)
+                if pagina.has_next:
+                    proxima = paginar_por_cursor(InstanciaAcao.objects.all(), ordenacao, pagina.cursor_proximo, 3)
+                    self.assertEqual([acao.pk for acao in proxima], ida[numero])
+                if pagina.has_previous:
+                    anterior = paginar_por_cursor(InstanciaAcao.objects.all(), ordenacao, pagina.cursor_anterior, 3)
+                    self.assertEqual([acao.pk for acao in anterior], ida[numero - 2])
+                self.assertEqual(pagina.has_previous, numero > 1)
+
+    def test_page_invalida_e_404(self):
+        for numero in ('0', 'abc', '99'):
+            with self.subTest(numero=numero), self.assertRaises(Http404):
+                paginar_por_numero(InstanciaAcao.objects.all(), ['-id'], numero, 3)
+
+    def test_cursor_invalido_volta_para_a_primeira_pagina(self):
+        primeira = paginar_por_cursor(InstanciaAcao.objects.all(), ['-id'], None, 3)
+        for cursor in ('lixo', 'e30', primeira.cursor_proximo[:-4]):
+            with self.subTest(cursor=cursor):
+                pagina = paginar_por_cursor(InstanciaAcao.objects.all(), ['-id'], cursor, 3)
+                self.assertEqual([acao.pk for acao in pagina], [acao.pk for acao in primeira])
+                self.assertFalse(pagina.has_previous)
+
+
+# ==============================================================================
+# DIAS ÚTEIS (user-023)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL, CALENDARIO_UF='SP')
+class CalendarioTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Feriado.objects.create(nome='Tiradentes', tipo='nacional', data=date(2026, 4, 21))
+        Feriado.objects.create(nome='Recesso', tipo='recesso', data=date(2026, 12, 20), data_fim=date(2027, 1, 20))
+        Feriado.objects.create(nome='Revolução Constitucionalista', tipo='estadual', uf='SP', data=date(2026, 7, 9))
+        Feriado.objects.create(nome='São Jorge', tipo='estadual', uf='RJ', data=date(2026, 4, 23))
+        Feriado.objects.create(nome='Aniversário de Campinas', tipo='municipal', uf='SP', cidade='Campinas', data=date(2026, 12, 8))
+        # Os sinais só invalidam depois do commit, que não acontece dentro do TestCase
+        invalidar_calendario()
+
+    def _caso_em(self, cidade, uf='SP'):
+        cliente = Cliente.objects.create(nome_razao_social=f'Cliente {cidade}', cidade=cidade, uf=uf)
+        return _criar_caso(cliente=cliente)
+
+    def _acao_modelo(self, caso, prazo_dias=1, tipo_prazo='uteis'):
+        fluxo = FluxoTrabalho.objects.create(nome=f'Fluxo {caso.pk}', cliente=caso.cliente, produto=caso.produto)
+        etapa = EtapaFluxo.objects.create(fluxo_trabalho=fluxo, nome='Análise')
+        return AcaoEtapa.objects.create(etapa_fluxo=etapa, titulo='Revisar', prazo_dias=prazo_dias, tipo_prazo=tipo_prazo)
+
+    def test_pula_fim_de_semana_e_feriado_nacional(self):
+        self.assertEqual(somar_dias_uteis(date(2026, 4, 17), 2), date(2026, 4, 22))
+        self.assertEqual(somar_dias_uteis(date(2026, 4, 20), 1), date(2026, 4, 22))
+
+    def test_pula_recesso_inteiro_na_virada_do_ano(self):
+        self.assertEqual(somar_dias_uteis(date(2026, 12, 18), 1), date(2027, 1, 21))
+
+    def test_feriado_estadual_so_da_uf_do_escritorio(self):
+        self.assertEqual(somar_dias_uteis(date(2026, 7, 8), 1), date(2026, 7, 10))
+        self.assertEqual(somar_dias_uteis(date(2026, 4, 22), 1), date(2026, 4, 23))
+
+    def test_feriado_municipal_so_na_cidade_do_caso(self):
+        self.assertEqual(somar_dias_uteis(date(2026, 12, 7), 1, 'SP', 'campinas'), date(2026, 12, 9))
+        self.assertEqual(somar_dias_uteis(date(2026, 12, 7), 1, 'SP', 'Santos'), date(2026, 12, 8))
+        self.assertEqual(somar_dias_uteis(date(2026, 12, 7), 1, 'MG', 'Campinas'), date(2026, 12, 8))
+        self.assertEqual(somar_dias_uteis(date(2026, 12, 7), 1), date(2026, 12, 8))
+
+    def test_datetime_mantem_o_horario(self):
+        inicio = timezone.make_aware(datetime(2026, 4, 20, 15, 30))
+        prazo = somar_dias_uteis(inicio, 1)
+        self.assertEqual((prazo.date(), prazo.hour, prazo.minute), (date(2026, 4, 22), 15, 30))
+
+    def test_feriado_novo_vale_depois_de_invalidar(self):
+        self.assertEqual(somar_dias_uteis(date(2026, 3, 2), 1), date(2026, 3, 3))
+        Feriado.objects.create(nome='Ponto facultativo', tipo='nacional', data=date(2026, 3, 3))
+        invalidar_calendario()
+        self.assertEqual(somar_dias_uteis(date(2026, 3, 2), 1), date(2026, 3, 4))
+
+    def test_prazo_da_acao_usa_a_cidade_do_caso(self):
+        caso = self._caso_em('Campinas')
+        inicio = timezone.make_aware(datetime(2026, 12, 7, 9, 0))
+        self.assertEqual(timezone.localtime(prazo_da_acao(self._acao_modelo(caso), inicio, caso)).date(), date(2026, 12, 9))
+        corridos = self._acao_modelo(self._caso_em('Santos'), prazo_dias=1, tipo_prazo='corridos')
+        self.assertEqual(prazo_da_acao(corridos, inicio, caso).date(), date(2026, 12, 8))
+
+    def test_recalcular_nao_mexe_em_prazo_alterado_a_mao(self):
+        caso = self._caso_em('Campinas')
+        acao_modelo = self._acao_modelo(caso)
+        criada_em = timezone.make_aware(datetime(2026, 3, 2, 10, 0))
+        calculado = timezone.make_aware(datetime(2026, 3, 3, 10, 0))
+        manual = timezone.make_aware(datetime(2026, 3, 10, 10, 0))
+        automatica = InstanciaAcao.objects.create(caso=caso, acao_modelo=acao_modelo, prazo_final=calculado, prazo_calculado=calculado)
+        editada = InstanciaAcao.objects.create(caso=caso, acao_modelo=acao_modelo, prazo_final=manual, prazo_calculado=calculado)
+        InstanciaAcao.objects.update(data_criacao=criada_em)
+        Feriado.objects.create(nome='Feriado local', tipo='municipal', uf='SP', cidade='Campinas', data=date(2026, 3, 3))
+        invalidar_calendario()
+
+        self.assertEqual(recalcular_prazos(), 1)
+        automatica.refresh_from_db()
+        editada.refresh_from_db()
+        self.assertEqual(timezone.localtime(automatica.prazo_final).date(), date(2026, 3, 4))
+        self.assertEqual(automatica.prazo_calculado, automatica.prazo_final)
+        self.assertEqual(editada.prazo_final, manual)
+        # Nada mudou desde o último cálculo: a segunda chamada não grava nada
+        self.assertEqual(recalcular_prazos(), 0)
+
+
+# ==============================================================================
+# FILA DE EVENTOS DO WORKFLOW E DECISÕES (user-024)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class EventosWorkflowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = get_user_model().objects.create_user('advogado', 'advogado@exemplo.com', 'senha')
+        self.caso = _criar_caso()
+        self.falhas = set()
+        # Estado de cada evento no banco no momento do envio
+        self.enviados = []
+        email = {'destinatarios': ['cliente@exemplo.com'], 'assunto': 'Novo caso', 'corpo': '<p>ok</p>'}
+        for patcher in (
+            mock.patch.object(eventos_workflow, 'preparar_notificacao', return_value=(True, email)),
+            mock.patch.object(eventos_workflow, 'enviar_email_graph', return_value=(True, 'enviado')),
+            mock.patch.dict(eventos_workflow.EFEITOS, {'caso_criado': self._efeito}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _efeito(self, evento):
+        self.enviados.append(EventoWorkflow.objects.get(pk=evento.pk))
+        if evento.pk in self.falhas:
+            raise eventos_workflow.FalhaEvento('Graph indisponível')
+        eventos_workflow._caso_criado(evento)
+
+    def _evento(self, **campos):
+        return EventoWorkflow.objects.create(tipo='caso_criado', caso=self.caso, usuario=self.usuario, **campos)
+
+    def test_envia_e_marca_processado(self):
+        evento = self._evento()
+        self.assertEqual(eventos_workflow.processar_eventos(), 1)
+        evento.refresh_from_db()
+        self.assertIsNotNone(evento.processado_em)
+        self.assertIsNone(evento.reservado_ate)
+        self.assertTrue(FluxoInterno.objects.filter(caso=self.caso, descricao__contains='cliente@exemplo.com').exists())
+
+    def test_reserva_e_gravada_antes_do_envio(self):
+        evento = self._evento()
+        eventos_workflow.processar_eventos()
+        # O envio viu o evento já reservado no banco: a transação da reserva terminou antes dele
+        self.assertEqual([e.pk for e in self.enviados], [evento.pk])
+        self.assertIsNotNone(self.enviados[0].reservado_ate)
+        self.assertIsNone(self.enviados[0].processado_em)
+
+    def test_falha_fica_para_a_proxima_execucao(self):
+        evento = self._evento()
+        self.falhas.add(evento.pk)
+        eventos_workflow.processar_eventos()
+        evento.refresh_from_db()
+        self.assertEqual((evento.tentativas, evento.processado_em, evento.reservado_ate), (1, None, None))
+        self.assertIn('Graph indisponível', evento.erro)
+
+        self.falhas.clear()
+        eventos_workflow.processar_eventos()
+        evento.refresh_from_db()
+        self.assertIsNotNone(evento.processado_em)
+        self.assertEqual((evento.tentativas, evento.erro), (1, ''))
+
+    def test_desiste_depois_do_maximo_de_tentativas(self):
+        evento = self._evento(tentativas=eventos_workflow.MAXIMO_TENTATIVAS - 1)
+        self.falhas.add(evento.pk)
+        eventos_workflow.processar_eventos()
+        self.assertEqual(eventos_workflow.processar_eventos(), 0)
+        evento.refresh_from_db()
+        self.assertEqual(evento.tentativas, eventos_workflow.MAXIMO_TENTATIVAS)
+        self.assertEqual(len(self.enviados), 1)
+
+    def test_falha_de_um_evento_nao_afeta_os_outros(self):
+        ruim, bom = self._evento(), self._evento()
+        self.falhas.add(ruim.pk)
+        eventos_workflow.processar_eventos()
+        self.assertIsNone(EventoWorkflow.objects.get(pk=ruim.pk).processado_em)
+        self.assertIsNotNone(EventoWorkflow.objects.get(pk=bom.pk).processado_em)
+
+    def test_pula_evento_reservado_por_outro_worker(self):
+        agora = timezone.now()
+        reservado = self._evento(reservado_ate=agora + eventos_workflow.RESERVA_LOTE)
+        expirado = self._evento(reservado_ate=agora - eventos_workflow.RESERVA_LOTE)
+        self.assertEqual(eventos_workflow.processar_eventos(), 1)
+        self.assertIsNone(EventoWorkflow.objects.get(pk=reservado.pk).processado_em)
+        self.assertIsNotNone(EventoWorkflow.objects.get(pk=expirado.pk).processado_em)
+
+    def test_processa_em_varios_lotes(self):
+        eventos = [self._evento() for _ in range(5)]
+        with mock.patch.object(eventos_workflow, 'TAMANHO_LOTE', 2):
+            self.assertEqual(eventos_workflow.processar_eventos(), 5)
+        self.assertEqual([e.pk for e in self.enviados], [e.pk for e in eventos])
+        self.assertFalse(EventoWorkflow.objects.filter(processado_em__isnull=True).exists())
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ExecutarAcaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = get_user_model().objects.create_user('advogado', 'advogado@exemplo.com', 'senha')
+        self.client.force_login(self.usuario)
+        self.caso = _criar_caso()
+        fluxo = FluxoTrabalho.objects.create(nome='Fluxo', cliente=self.caso.cliente, produto=self.caso.produto)
+        self.etapa = etapa = EtapaFluxo.objects.create(fluxo_trabalho=fluxo, nome='Análise')
+        self.acao_modelo = acao_modelo = AcaoEtapa.objects.create(etapa_fluxo=etapa, titulo='Revisar')
+        self.seguinte = AcaoEtapa.objects.create(etapa_fluxo=etapa, titulo='Responder', prazo_dias=3, tipo_prazo='corridos')
+        self.opcao = OpcaoDecisao.objects.create(
+            acao_etapa=acao_modelo, label_do_botao='Responder', criar_nova_acao=self.seguinte, enviar_email=True,
+        )
+        self.acao = InstanciaAcao.objects.create(caso=self.caso, acao_modelo=acao_modelo)
+        # Os sinais só invalidam depois do commit, que não acontece dentro do TestCase
+        invalidar_grafo_workflow()
+        self.url = reverse('casos:executar_acao_decisao', kwargs={'acao_pk': self.acao.pk, 'opcao_pk': self.opcao.pk})
+
+    def test_nova_acao_da_decisao_recebe_prazo(self):
+        self.client.post(self.url, {'descricao_conclusao': 'ok'})
+        nova = InstanciaAcao.objects.get(caso=self.caso, acao_modelo=self.seguinte)
+        self.assertIsNotNone(nova.prazo_final)
+        self.assertEqual(nova.prazo_final, nova.prazo_calculado)
+        self.assertTrue(EventoWorkflow.objects.filter(caso=self.caso, tipo='decisao_tomada').exists())
+
+    def test_falha_no_meio_desfaz_a_decisao_inteira(self):
+        registros = FluxoInterno.objects.filter(caso=self.caso).count()
+        with mock.patch.object(views, 'registrar_evento', side_effect=RuntimeError('banco fora')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, {'descricao_conclusao': 'ok'})
+        self.acao.refresh_from_db()
+        self.assertEqual(self.acao.status, 'P')
+        self.assertFalse(InstanciaAcao.objects.filter(acao_modelo=self.seguinte).exists())
+        self.assertEqual(FluxoInterno.objects.filter(caso=self.caso).count(), registros)
+
+    def test_mudanca_de_etapa_nao_gera_notificacao(self):
+        segunda = EtapaFluxo.objects.create(fluxo_trabalho=self.etapa.fluxo_trabalho, nome='Resposta', ordem=1)
+        Caso.objects.filter(pk=self.caso.pk).update(etapa_atual=self.etapa)
+        avancar = OpcaoDecisao.objects.create(acao_etapa=self.acao_modelo, label_do_botao='Avançar', avancar_proxima_etapa=True)
+        invalidar_grafo_workflow()
+        self.client.post(reverse('casos:executar_acao_decisao', kwargs={'acao_pk': self.acao.pk, 'opcao_pk': avancar.pk}))
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.etapa_atual, segunda)
+        self.assertFalse(EventoWorkflow.objects.filter(caso=self.caso).exists())
+
+    def test_avanca_a_partir_da_etapa_relida_com_o_caso_travado(self):
+        segunda = EtapaFluxo.objects.create(fluxo_trabalho=self.etapa.fluxo_trabalho, nome='Resposta', ordem=1)
+        terceira = EtapaFluxo.objects.create(fluxo_trabalho=self.etapa.fluxo_trabalho, nome='Encerramento', ordem=2)
+        Caso.objects.filter(pk=self.caso.pk).update(etapa_atual=self.etapa)
+        avancar = OpcaoDecisao.objects.create(acao_etapa=self.acao_modelo, label_do_botao='Avançar', avancar_proxima_etapa=True)
+        invalidar_grafo_workflow()
+
+        def outra_transicao_no_meio():
+            # Outra requisição move o caso depois que a view já o leu
+            Caso.objects.filter(pk=self.caso.pk).update(etapa_atual=segunda)
+            return grafo_workflow()
+
+        url = reverse('casos:executar_acao_decisao', kwargs={'acao_pk': self.acao.pk, 'opcao_pk': avancar.pk})
+        with mock.patch.object(views, 'grafo_workflow', side_effect=outra_transicao_no_meio):
+            self.client.post(url, {'descricao_conclusao': 'ok'})
+        self.caso.refresh_from_db()
+        self.assertEqual(self.caso.etapa_atual, terceira)
+
+    def test_mover_no_kanban_recusa_ids_invalidos(self):
+        url = reverse('casos:update_caso_fase_ajax')
+        for dados in ({'caso_id': self.caso.pk}, {'caso_id': self.caso.pk, 'nova_etapa_id': 'abc'}, {'nova_etapa_id': self.etapa.pk}):
+            resposta = self.client.post(url, dados)
+            self.assertEqual(resposta.status_code, 400)
+            self.assertEqual(resposta.json()['status'], 'error')
+
+
+# ==============================================================================
+# LEMBRETES AGENDADOS (user-025)
+# ==============================================================================
+
+@override_settings(CACHES=CACHE_LOCAL)
+class AgendadorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = get_user_model().objects.create_user('advogado', 'advogado@exemplo.com', 'senha')
+        self.caso = _criar_caso()
+        fluxo = FluxoTrabalho.objects.create(nome='Fluxo', cliente=self.caso.cliente, produto=self.caso.produto)
+        etapa = EtapaFluxo.objects.create(fluxo_trabalho=fluxo, nome='Cobrança')
+        self.acao_modelo = AcaoEtapa.objects.create(etapa_fluxo=etapa, titulo='Cobrar retorno', prazo_dias=2, tipo_prazo='corridos')
+        self.opcao = OpcaoDecisao.objects.create(acao_etapa=self.acao_modelo, label_do_botao='Aguardar', aguardar_dias=5)
+        invalidar_grafo_workflow()
+
+    def _agendar(self, executar_em):
+        origem = InstanciaAcao.objects.create(caso=self.caso, acao_modelo=self.acao_modelo, status='C')
+        agendada = agendador.agendar_lembrete(self.caso, self.opcao, origem, self.usuario)
+        AcaoAgendada.objects.filter(pk=agendada.pk).update(executar_em=executar_em)
+        return agendada
+
+    def _abertas(self):
+        return InstanciaAcao.objects.filter(caso=self.caso, status='P')
+
+    def test_mesma_decisao_nao_agenda_dois_lembretes(self):
+        origem = InstanciaAcao.objects.create(caso=self.caso, acao_modelo=self.acao_modelo, status='C')
+        primeira = agendador.agendar_lembrete(self.caso, self.opcao, origem, self.usuario)
+        segunda = agendador.agendar_lembrete(self.caso, self.opcao, origem, self.usuario)
+        self.assertEqual(primeira.pk, segunda.pk)
+        self.assertEqual(AcaoAgendada.objects.count(), 1)
+        self.assertAlmostEqual(primeira.executar_em, timezone.now() + timedelta(days=5), delta=timedelta(minutes=1))
+
+    def test_abre_so_os_vencidos(self):
+        agora = timezone.now()
+        vencido = self._agendar(agora - timedelta(minutes=1))
+        futuro = self._agendar(agora + timedelta(days=1))
+        self.assertEqual(agendador.ativar_acoes_agendadas(), 1)
+        vencido.refresh_from_db()
+        futuro.refresh_from_db()
+        self.assertIsNotNone(vencido.ativada_em)
+        self.assertIsNone(futuro.ativada_em)
+        acao = vencido.acao_criada
+        self.assertEqual((acao.acao_modelo_id, acao.responsavel_id, acao.status), (self.acao_modelo.pk, self.usuario.pk, 'P'))
+        self.assertIsNotNone(acao.prazo_final)
+        self.assertEqual(acao.prazo_final, acao.prazo_calculado)
+        self.assertTrue(FluxoInterno.objects.filter(caso=self.caso, descricao__contains='Lembrete').exists())
+
+    def test_rodar_de_novo_nao_abre_a_acao_duas_vezes(self):
+        self._agendar(timezone.now() - timedelta(minutes=1))
+        self.assertEqual(agendador.ativar_acoes_agendadas(), 1)
+        self.assertEqual(agendador.ativar_acoes_agendadas(), 0)
+        tasks.abrir_lembretes_vencidos()
+        self.assertEqual(self._abertas().count(), 1)
+
+    def test_abre_em_varios_lotes(self):
+        for _ in range(5):
+            self._agendar(timezone.now() - timedelta(minutes=1))
+        with mock.patch.object(agendador, 'TAMANHO_LOTE', 2):
+            self.assertEqual(agendador.ativar_acoes_agendadas(), 5)
+        self.assertEqual(self._abertas().count(), 5)
+        self.assertFalse(AcaoAgendada.objects.filter(ativada_em__isnull=True).exists())
+
+    def test_limite_de_lotes_deixa_o_resto_para_a_proxima_execucao(self):
+        for _ in range(3):
+            self._agendar(timezone.now() - timedelta(minutes=1))
+        with mock.patch.object(agendador, 'TAMANHO_LOTE', 1), mock.patch.object(agendador, 'MAXIMO_LOTES', 2):
+            self.assertEqual(agendador.ativar_acoes_agendadas(), 2)
+            self.assertEqual(agendador.ativar_acoes_agendadas(), 1)
+        self.assertEqual(self._abertas().count(), 3)
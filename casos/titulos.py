@@ -0,0 +1,114 @@
+# casos/titulos.py
+
+"""
+Título dos casos a partir de RegraCampo.formato_titulo.
+
+O formato é um template do Django ({{ aviso }} etc.) preenchido com os campos
+customizados do caso (Caso.valores_json). O template compilado fica em memória
+(LRU) por (id da regra, atualizado_em): a regra é lida uma vez e o template só
+é compilado de novo quando o formato muda. atualizar_titulos() refaz o título
+dos casos cujo JSON acabou de mudar (casos/valores_campos.py);
+recalcular_titulos() refaz o de todos os casos de um cliente/produto.
+
+RegraCampo.clean() recusa formatos que não compilam; um formato inválido que
+chegue ao banco por outro caminho não quebra a gravação do caso: o erro é
+registrado e o título atual é mantido.
+"""
+
+from functools import lru_cache
+
+from django.db import transaction
+from django.template import Context, Template, TemplateSyntaxError
+
+from .busca import atualizar_documentos_busca
+from .contagens import invalidar_contagens
+from .esquema_campos import esquema
+from .models import Caso, RegraCampo
+
+TAMANHO_LOTE = 1000
+# Limite de templates compilados guardados por processo
+LIMITE_TEMPLATES = 256
+
+
+@lru_cache(maxsize=LIMITE_TEMPLATES)
+def _compilar(regra_id, atualizado_em, formato_titulo):
+    # O erro também fica no cache (None): é registrado uma vez por versão da regra
+    try:
+        return Template(formato_titulo)
+    except TemplateSyntaxError as e:
+        print(f"Aviso: formato de título inválido na regra #{regra_id}; o título atual dos casos é mantido. {e}")
+        return None
+
+def template_da_regra(regra):
+    """
+    Template compilado do formato da regra (do cache do processo quando possível),
+    ou None se o formato for inválido. Aceita um RegraCampo ou a Regra do esquema (casos/esquema_campos.py).
+    """
+    return _compilar(regra.pk, regra.atualizado_em, regra.formato_titulo)
+
+def montar_titulo(regra, valores):
+    """
+    Título gerado pelo formato da regra com os valores {nome_tecnico: valor}, ou
+    None (manter o título atual) se a regra não tiver formato ou ele for inválido.
+    """
+    if not regra.formato_titulo:
+        return None
+    template = template_da_regra(regra)
+    if template is None:
+        return None
+    titulo = template.render(Context(valores or {}, autoescape=False))
+    return ' '.join(titulo.split())[:Caso._meta.get_field('titulo_caso').max_length]
+
+def atualizar_titulos(valores_por_caso):
+    """
+    Refaz titulo_caso a partir de {caso_id: valores_json} (o JSON recém-montado).
+    Só os títulos que mudaram são gravados. Retorna quantos.
+    """
+    regras = esquema()
+    casos = []
+    for caso in Caso.objects.filter(pk__in=list(valores_por_caso)).only('id', 'cliente_id', 'produto_id', 'titulo_caso'):
+        regra = regras.regra(caso.cliente_id, caso.produto_id)
+        titulo = montar_titulo(regra, valores_por_caso[caso.pk]) if regra else None
+        if titulo is not None and titulo != caso.titulo_caso:
+            caso.titulo_caso = titulo
+            casos.append(caso)
+    return _gravar_titulos(casos) if casos else 0
+
+def recalcular_titulos(cliente_id=None, produto_id=None):
+    """
+    Refaz titulo_caso dos casos das regras do cliente/produto informados (ou de
+    todas as regras). Só os títulos que mudaram são gravados. Retorna quantos.
+    """
+    regras = RegraCampo.objects.exclude(formato_titulo='')
+    if cliente_id:
+        regras = regras.filter(cliente_id=cliente_id)
+    if produto_id:
+        regras = regras.filter(produto_id=produto_id)
+
+    alterados = 0
+    for regra in regras:
+        casos = (
+            Caso.objects.filter(cliente_id=regra.cliente_id, produto_id=regra.produto_id)
+            .order_by('id').only('id', 'titulo_caso', 'valores_json')
+        )
+        lote = []
+        for caso in casos.iterator(chunk_size=TAMANHO_LOTE):
+            titulo = montar_titulo(regra, caso.valores_json)
+            if titulo is not None and titulo != caso.titulo_caso:
+                caso.titulo_caso = titulo
+                lote.append(caso)
+            if len(lote) >= TAMANHO_LOTE:
+                alterados += _gravar_titulos(lote)
+                lote = []
+        if lote:
+            alterados += _gravar_titulos(lote)
+    if alterados:
+        invalidar_contagens('casos', 'acoes')
+    return alterados
+
+def _gravar_titulos(casos):
+    # bulk_update não dispara sinais: o documento de busca é refeito aqui
+    with transaction.atomic():
+        Caso.objects.bulk_update(casos, ['titulo_caso'])
+        atualizar_documentos_busca([caso.pk for caso in casos])
+    return len(casos)
@@ -33,14 +33,23 @@ urlpatterns = [
   
     path('<int:caso_pk>/anexos/nova-pasta/', views.criar_pasta_anexo_view, name='criar_pasta_anexo'),
     path('<int:caso_pk>/anexos/upload/', views.upload_arquivo_anexo_view, name='upload_arquivo_anexo'),
+    path('<int:caso_pk>/anexos/painel/', views.painel_anexos_sharepoint, name='painel_anexos_sharepoint'),
+    path('<int:caso_pk>/anexos/uploads/status/', views.status_uploads_caso_ajax, name='status_uploads_caso_ajax'),
     path('<int:caso_pk>/anexos/deletar/<str:item_id>/', views.deletar_item_view, name='deletar_item_anexo'),
+    path('<int:caso_pk>/anexos/deletar-selecionados/', views.deletar_itens_view, name='deletar_itens_anexo'),
+    path('anexos/listar/', views.listar_pastas_lote_ajax, name='listar_pastas_lote_ajax'),
     path('anexos/listar/<str:folder_id>/', views.listar_subpasta_ajax, name='listar_subpasta_ajax'),
     path('anexos/preview/<str:item_id>/', views.preview_arquivo_view, name='preview_arquivo'),
+    path('anexos/download/<str:item_id>/', views.download_arquivo_view, name='download_arquivo'),
+    path('anexos/buscar/', views.buscar_arquivos_ajax, name='buscar_arquivos_ajax'),
     path('despesas/<int:pk>/deletar/', views.DespesaDeleteView.as_view(), name='despesa_delete'),
     path('caso/<int:caso_pk>/despesas/exportar/excel/', views.exportar_despesas_excel, name='exportar_despesas_excel'),
     path('caso/<int:caso_pk>/despesas/exportar/pdf/', views.exportar_despesas_pdf, name='exportar_despesas_pdf'),
 
+    path('webhook/microsoft-graph/', views.microsoft_graph_webhook, name='microsoft_graph_webhook'),
+
     path('ajax/get-campos-produto/', views.get_campos_for_produto_ajax, name='get_campos_for_produto_ajax'),
+    path('ajax/campos-produtos/', views.get_campos_produtos_ajax, name='get_campos_produtos_ajax'),
     path('ajax/update-fase/', views.update_caso_fase_ajax, name='update_caso_fase_ajax'),
     path('ajax/add-status/', views.add_status_ajax, name='add_status_ajax'),
     path('ajax/add-analista/', views.add_analista_ajax, name='add_analista_ajax'),
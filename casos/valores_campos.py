@@ -0,0 +1,109 @@
+# casos/valores_campos.py
+
+"""
+Cópia dos campos customizados de cada caso em Caso.valores_json.
+
+A fonte continua sendo ValorCampoCaso; o JSON ({nome_tecnico: valor}) é só uma
+cópia para leitura, para as telas e exportações mostrarem todos os campos de
+um caso sem consultar ValorCampoCaso/Campo caso a caso. Os sinais em
+casos/signals.py refazem o JSON (e o título do caso) a cada gravação; o comando
+`reconstruir_valores_json` refaz o de todos os casos.
+
+Para gravar muitos valores de uma vez (formulário, importações) use
+gravar_valores_campos(), que faz um upsert por lote.
+"""
+
+from django.db import transaction
+
+from .busca import gravar_valores_pesquisaveis
+from .contagens import invalidar_contagens
+from .esquema_campos import esquema
+from .models import Caso, ValorCampoCaso
+from .titulos import atualizar_titulos
+
+TAMANHO_LOTE = 1000
+
+
+def montar_valores_json(caso_ids):
+    """Retorna {caso_id: {nome_tecnico: valor}} lendo ValorCampoCaso."""
+    valores = {caso_id: {} for caso_id in caso_ids}
+    for caso_id, nome_tecnico, valor in (
+        ValorCampoCaso.objects.filter(caso_id__in=caso_ids)
+        .order_by().values_list('caso_id', 'campo__nome_tecnico', 'valor')
+    ):
+        valores[caso_id][nome_tecnico] = valor or ''
+    return valores
+
+def atualizar_valores_json(caso_ids):
+    """Refaz Caso.valores_json dos casos informados, em lotes, e o título gerado a partir dele."""
+    caso_ids = list(dict.fromkeys(caso_ids))
+    for i in range(0, len(caso_ids), TAMANHO_LOTE):
+        lote = montar_valores_json(caso_ids[i:i + TAMANHO_LOTE])
+        Caso.objects.bulk_update(
+            [Caso(pk=caso_id, valores_json=valores) for caso_id, valores in lote.items()],
+            ['valores_json'],
+            batch_size=TAMANHO_LOTE,
+        )
+        atualizar_titulos(lote)
+
+def atualizar_valores_json_do_campo(campo_id):
+    """Refaz o JSON de todos os casos que têm valor para o campo (ex: depois de renomeá-lo)."""
+    atualizar_valores_json(
+        ValorCampoCaso.objects.filter(campo_id=campo_id).order_by().values_list('caso_id', flat=True).distinct()
+    )
+
+def campos_dos_casos(casos):
+    """
+    Campos (na ordem de exibição) que aparecem no JSON dos casos informados,
+    como definições do esquema (casos/esquema_campos.py).
+    """
+    nomes = set()
+    for caso in casos:
+        nomes.update(caso.valores_json or {})
+    return esquema().campos_por_nomes(nomes) if nomes else []
+
+def valores_para_exibicao(caso, campos=None):
+    """Lista de (rótulo, valor) dos campos preenchidos do caso, para os templates."""
+    campos = campos if campos is not None else campos_dos_casos([caso])
+    valores = caso.valores_json or {}
+    return [(campo['nome_label'], valores[campo['nome_tecnico']]) for campo in campos if campo['nome_tecnico'] in valores]
+
+
+# --- GRAVAÇÃO EM LOTE ---
+
+def gravar_valores_campos(valores):
+    """
+    Grava (insere ou atualiza) valores de campos customizados a partir de tuplas
+    (caso_id, campo_id, valor), um INSERT ... ON CONFLICT por lote. Serve tanto
+    para o formulário de um caso quanto para importações de milhares de casos.
+
+    bulk_create não dispara sinais, então a projeção de pesquisa, o valores_json
+    e os totais das listagens são atualizados aqui, uma vez por lote.
+    Retorna o número de valores gravados.
+    """
+    # O último valor informado para um mesmo (caso, campo) é o que vale
+    valores = list({(caso_id, campo_id): valor for caso_id, campo_id, valor in valores}.items())
+    if not valores:
+        return 0
+    campos = esquema().campos
+    pesquisaveis = {campo_id for (_, campo_id), _ in valores if campo_id in campos and campos[campo_id]['pesquisavel']}
+    for i in range(0, len(valores), TAMANHO_LOTE):
+        lote = valores[i:i + TAMANHO_LOTE]
+        with transaction.atomic():
+            ValorCampoCaso.objects.bulk_create(
+                [ValorCampoCaso(caso_id=caso_id, campo_id=campo_id, valor=valor) for (caso_id, campo_id), valor in lote],
+                update_conflicts=True,
+                unique_fields=['caso', 'campo'],
+                update_fields=['valor'],
+            )
+            gravar_valores_pesquisaveis([(caso_id, campo_id, valor) for (caso_id, campo_id), valor in lote if campo_id in pesquisaveis])
+            atualizar_valores_json({caso_id for (caso_id, _), _ in lote})
+    invalidar_contagens('casos', 'acoes')
+    return len(valores)
+
+def salvar_valores_do_caso(caso, valores_por_nome):
+    """Grava os valores de um caso a partir de {nome_tecnico: valor}; nomes desconhecidos são ignorados."""
+    campos = esquema().por_nome
+    return gravar_valores_campos(
+        (caso.pk, campos[nome]['id'], valor) for nome, valor in valores_por_nome.items() if nome in campos
+    )
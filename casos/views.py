@@ -4,10 +4,11 @@ import json
 from collections import defaultdict
 from datetime import date, timedelta
 from io import BytesIO
-from .tasks import criar_estrutura_sharepoint_async
+from .tasks import agendar_provisionamento_pastas
 
 # --- Bibliotecas de Terceiros ---
 import openpyxl
+from asgiref.sync import sync_to_async
 from openpyxl.styles import Alignment, Font, PatternFill
 from weasyprint import HTML
 
@@ -17,9 +18,11 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
 from django.db.models import Count, Q, Sum
 from django.db.models.functions import TruncMonth
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
@@ -30,204 +33,97 @@ from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
 
 # --- Importações de Outros Apps do Projeto ---
 from configuracoes.models import LogoConfig
-from notificacoes.servicos import preparar_notificacao
 
 # --- Importações Locais do App 'casos' ---
+from . import area_uploads
 from . import forms
+from . import indice_arquivos
+from .agendador import agendar_lembrete
+from .busca import filtro_busca_casos
+from .calendario import campos_do_prazo
+from .esquema_campos import campos_dos_produtos
+from .paginacao import PaginacaoCursorMixin
+from .valores_campos import campos_dos_casos, salvar_valores_do_caso, valores_para_exibicao
+from .eventos_workflow import registrar_evento
+from .grafo_workflow import grafo_workflow
+from .workflow import mudar_etapa
 from . import microsoft_graph_service
 from .forms import (AcordoCasoForm, AndamentoCasoForm, CasoCreateForm,
                     CasoUpdateForm, DespesaCasoForm, EnviarEmailForm,
                     FluxoInternoForm, LancamentoHorasForm)
 from .microsoft_graph_service import (criar_nova_pasta, criar_pasta_caso,
                                       criar_subpastas, deletar_item,
-                                      enviar_email_graph,
+                                      deletar_itens,
                                       listar_arquivos_e_pastas,
-                                      obter_url_preview, upload_arquivo)
+                                      listar_varias_pastas, obter_url_download,
+                                      obter_url_preview, sanitizar_nome_pasta)
 from .models import (AcaoEtapa, AcordoCaso, Advogado, AndamentoCaso, Campo,
                      Caso, Cliente, DespesaCaso, EmailCaso, EmailTemplate,
                      EstruturaPasta, EtapaFluxo, FluxoInterno as FluxoInternoModel,
                      FluxoTrabalho, GraphWebhookSubscription, HistoricoEtapa,
                      InstanciaAcao, OpcaoDecisao, ParcelaAcordo, Produto,
-                     RegraCampo, Status, Timesheet, UserSignature,
+                     RegraCampo, Status, Timesheet, UploadAnexo, UserSignature,
                      ValorCampoCaso)
-from .tasks import buscar_detalhes_email_enviado, processar_email_webhook
+from .tasks import (buscar_detalhes_email_enviado, processar_email_webhook,
+                    processar_uploads_anexos, sincronizar_arquivos_sharepoint)
 
 # --- Definições Globais ---
 Usuario = get_user_model()
 
 def _mudar_etapa_fluxo(request, caso, nova_etapa):
-    # 'messages' já deve estar importado no topo do arquivo, mas por segurança:
-    from django.contrib import messages
-    
-    etapa_antiga = caso.etapa_atual
-    
-    if etapa_antiga:
-        historico = HistoricoEtapa.objects.filter(caso=caso, etapa=etapa_antiga, data_saida__isnull=True).first()
-        if historico:
-            historico.data_saida = timezone.now()
-            historico.save()
-            tempo_gasto = (historico.data_saida - historico.data_entrada).days
-            
-            # CORREÇÃO: Usando 'FluxoInternoModel' como foi importado
-            FluxoInternoModel.objects.create(
-                caso=caso, 
-                data_fluxo=timezone.now().date(), 
-                descricao=f"[WORKFLOW] Etapa '{etapa_antiga.nome}' finalizada. Tempo: {tempo_gasto} dias.", 
-                usuario_criacao=request.user
-            )
-    
-    caso.etapa_atual = nova_etapa
-    caso.data_entrada_fase = timezone.now() if nova_etapa else None # Atualiza também a data de entrada
-    caso.save(update_fields=['etapa_atual', 'data_entrada_fase'])
-
-    if nova_etapa:
-        HistoricoEtapa.objects.create(caso=caso, etapa=nova_etapa)
-        
-        # CORREÇÃO: Usando 'FluxoInternoModel'
-        FluxoInternoModel.objects.create(
-            caso=caso, 
-            data_fluxo=timezone.now().date(), 
-            descricao=f"[WORKFLOW] Caso entrou na etapa: '{nova_etapa.nome}'.", 
-            usuario_criacao=request.user
-        )
-        
-        count_acoes = 0
-        for acao_modelo in nova_etapa.acoes.all():
-            responsavel_final = None
-            if acao_modelo.tipo_responsavel == 'CRIADOR_ACAO':
-                responsavel_final = request.user
-            elif acao_modelo.tipo_responsavel == 'RESPONSAVEL_CASO':
-                if caso.advogado_responsavel:
-                    responsavel_final = caso.advogado_responsavel.user
-            elif acao_modelo.tipo_responsavel == 'USUARIO_FIXO':
-                responsavel_final = acao_modelo.responsavel_fixo
-
-            if not responsavel_final:
-                # Fallback seguro se nenhuma regra se aplicar
-                responsavel_final = caso.advogado_responsavel.user if caso.advogado_responsavel else request.user
-            
-            prazo_final = None
-            if acao_modelo.prazo_dias > 0:
-                start_date = timezone.now()
-                dias_a_adicionar = acao_modelo.prazo_dias
-                # OBS: Lógica de dias úteis simplificada, pode ser aprimorada
-                if acao_modelo.tipo_prazo == 'uteis':
-                    dias_extras = (dias_a_adicionar // 5) * 2 
-                    prazo_final = start_date + timedelta(days=dias_a_adicionar + dias_extras)
-                else: 
-                    prazo_final = start_date + timedelta(days=dias_a_adicionar)
-            
-            InstanciaAcao.objects.create(
-                caso=caso, 
-                acao_modelo=acao_modelo, 
-                responsavel=responsavel_final, 
-                prazo_final=prazo_final
-            )
-            count_acoes += 1
-        
-        if count_acoes > 0:
-            messages.info(request, f"{count_acoes} nova(s) ação(ões) criada(s) para a etapa '{nova_etapa.nome}'.")
-
-    from django.contrib import messages
-    etapa_antiga = caso.etapa_atual
-    
-    if etapa_antiga:
-        # CORRIGIDO: Removido o 'models.'
-        historico = HistoricoEtapa.objects.filter(caso=caso, etapa=etapa_antiga, data_saida__isnull=True).first()
-        if historico:
-            historico.data_saida = timezone.now()
-            historico.save()
-            tempo_gasto = (historico.data_saida - historico.data_entrada).days
-            
-            # CORRIGIDO: Usando 'FluxoInternoModel' que foi importado com 'as'
-            FluxoInternoModel.objects.create(
-                caso=caso, 
-                data_fluxo=timezone.now().date(), 
-                descricao=f"[WORKFLOW] Etapa '{etapa_antiga.nome}' finalizada. Tempo: {tempo_gasto} dias.", 
-                usuario_criacao=request.user
-            )
-    
-    caso.etapa_atual = nova_etapa
-    caso.save(update_fields=['etapa_atual'])
-
-    if nova_etapa:
-        # CORRIGIDO: Removido o 'models.'
-        HistoricoEtapa.objects.create(caso=caso, etapa=nova_etapa)
-        
-        # CORRIGIDO: Usando 'FluxoInternoModel'
-        FluxoInternoModel.objects.create(
-            caso=caso, 
-            data_fluxo=timezone.now().date(), 
-            descricao=f"[WORKFLOW] Caso entrou na etapa: '{nova_etapa.nome}'.", 
-            usuario_criacao=request.user
-        )
-        
-        count_acoes = 0
-        for acao_modelo in nova_etapa.acoes.all():
-            responsavel_final = None
-            if acao_modelo.tipo_responsavel == 'CRIADOR_ACAO':
-                responsavel_final = request.user
-            elif acao_modelo.tipo_responsavel == 'RESPONSAVEL_CASO':
-                if caso.advogado_responsavel:
-                    responsavel_final = caso.advogado_responsavel.user
-            elif acao_modelo.tipo_responsavel == 'USUARIO_FIXO':
-                responsavel_final = acao_modelo.responsavel_fixo
-
-            if not responsavel_final:
-                responsavel_final = request.user
-            
-            prazo_final = None
-            if acao_modelo.prazo_dias > 0:
-                start_date = timezone.now()
-                dias_a_adicionar = acao_modelo.prazo_dias
-                # OBS: Lógica de dias úteis simplificada, pode ser aprimorada depois
-                if acao_modelo.tipo_prazo == 'uteis':
-                    dias_extras = (dias_a_adicionar // 5) * 2
-                    prazo_final = start_date + timedelta(days=dias_a_adicionar + dias_extras)
-                else: 
-                    prazo_final = start_date + timedelta(days=dias_a_adicionar)
-            
-            # CORRIGIDO: Removido o 'models.'
-            InstanciaAcao.objects.create(
-                caso=caso, 
-                acao_modelo=acao_modelo, 
-                responsavel=responsavel_final, 
-                prazo_final=prazo_final
-            )
-            count_acoes += 1
-        
-        if count_acoes > 0:
-            messages.info(request, f"{count_acoes} nova(s) ação(ões) criada(s) para a etapa '{nova_etapa.nome}'.")
-
+    """Executa a transição pelo motor do workflow (casos/workflow.py) e avisa o usuário."""
+    transicao = mudar_etapa(caso, nova_etapa, usuario=request.user)
+    if transicao.acoes_criadas > 0:
+        messages.info(request, f"{transicao.acoes_criadas} nova(s) ação(ões) criada(s) para a etapa '{nova_etapa.nome}'.")
+    return transicao
+
+
+
+def _campos_com_valores(produto_ids, caso_id=None):
+    """Definições dos campos de cada produto (do cache) com os valores já salvos do caso."""
+    # Os valores já salvos vêm da cópia em Caso.valores_json, numa consulta só
+    valores = {}
+    if caso_id:
+        valores = Caso.objects.filter(pk=caso_id).values_list('valores_json', flat=True).first() or {}
+    return {
+        produto_id: [dict(campo, valor=valores.get(campo['nome_tecnico'], '')) for campo in campos]
+        for produto_id, campos in campos_dos_produtos(produto_ids).items()
+    }
 
+def _ids_da_requisicao(request, parametro):
+    ids = []
+    for valor in request.GET.getlist(parametro):
+        ids.extend(int(v) for v in valor.split(',') if v.strip().isdigit())
+    return ids
 
 def get_campos_for_produto_ajax(request):
     produto_id, caso_id = request.GET.get('produto_id'), request.GET.get('caso_id')
-    if not produto_id: return JsonResponse([], safe=False)
-    campos_data = []
-    campos = Campo.objects.filter(produtos__id=produto_id).order_by('nome_label')
-    for campo in campos:
-        valor_existente = ''
-        if caso_id:
-            try:
-                valor_obj = ValorCampoCaso.objects.get(caso_id=caso_id, campo=campo)
-                valor_existente = valor_obj.valor
-            except ValorCampoCaso.DoesNotExist: pass
-        campos_data.append({'nome_label': campo.nome_label, 'nome_tecnico': campo.nome_tecnico, 'tipo_campo': campo.tipo_campo, 'valor': valor_existente})
-    return JsonResponse(campos_data, safe=False)
-
-class CasoListView(LoginRequiredMixin, ListView):
+    if not produto_id or not produto_id.isdigit(): return JsonResponse([], safe=False)
+    campos_data = _campos_com_valores([int(produto_id)], caso_id if caso_id and caso_id.isdigit() else None)
+    return JsonResponse(campos_data[int(produto_id)], safe=False)
+
+@login_required
+def get_campos_produtos_ajax(request):
+    """Campos de vários produtos de uma vez: ?produto_id=1,2&caso_id=3 -> {produto_id: [campos]}."""
+    produto_ids = _ids_da_requisicao(request, 'produto_id')
+    caso_id = request.GET.get('caso_id')
+    if not produto_ids: return JsonResponse({})
+    return JsonResponse(_campos_com_valores(produto_ids, caso_id if caso_id and caso_id.isdigit() else None))
+
+class CasoListView(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
     model = Caso
     template_name = 'casos/caso_list.html'
     context_object_name = 'casos'
     paginate_by = 15
+    escopo_contagem = 'casos'
     def get_queryset(self): return get_casos_filtrados(self.request)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         query_params = self.request.GET.copy()
-        if 'page' in query_params: del query_params['page']
+        for param in ('page', 'cursor'): query_params.pop(param, None)
         context['querystring'] = query_params.urlencode()
         context['clientes_list'], context['produtos_list'], context['status_list'] = Cliente.objects.all().order_by('nome_razao_social'), Produto.objects.all().order_by('nome'), Status.objects.all().order_by('nome')
+        context['arquivos_por_caso'] = indice_arquivos.contar_arquivos_por_caso([caso.pk for caso in context['casos']])
         return context
 
 class CasoCreateView(LoginRequiredMixin, CreateView):
@@ -240,60 +136,39 @@ class CasoCreateView(LoginRequiredMixin, CreateView):
         self.object = form.save(commit=False)
         
         # Lógica para iniciar o workflow
-        try:
-            fluxo = FluxoTrabalho.objects.get(cliente=self.object.cliente, produto=self.object.produto)
-            primeira_etapa = fluxo.etapas.order_by('ordem').first()
-            if primeira_etapa:
-                self.object.etapa_atual = primeira_etapa
-            else:
-                messages.warning(self.request, "Fluxo de trabalho aplicável não possui etapas.")
-        except FluxoTrabalho.DoesNotExist:
+        # O fluxo e a primeira etapa vêm do grafo do workflow em memória
+        grafo = grafo_workflow()
+        primeira_etapa = None
+        fluxo_id = grafo.fluxo(self.object.cliente_id, self.object.produto_id)
+        if fluxo_id is None:
             messages.warning(self.request, "Nenhuma regra de fluxo de trabalho encontrada para este cliente e produto.")
+        else:
+            primeira_etapa = grafo.primeira_etapa(fluxo_id)
+            if not primeira_etapa:
+                messages.warning(self.request, "Fluxo de trabalho aplicável não possui etapas.")
         
-        # Agora salva o objeto no banco para obter um ID
-        self.object.save()
-        
-        # Inicia o fluxo se uma etapa foi definida
-        if self.object.etapa_atual:
-            _mudar_etapa_fluxo(self.request, self.object, self.object.etapa_atual)
-            messages.info(self.request, f"Caso iniciado no fluxo '{self.object.etapa_atual.fluxo_trabalho.nome}'.")
-
-        # --- LÓGICA DO SHAREPOINT MOVIDA PARA SEGUNDO PLANO ---
-        # Dispara a tarefa do Celery para criar as pastas, passando o ID do caso
-        # O '.delay()' executa a tarefa de forma assíncrona
-        criar_estrutura_sharepoint_async.delay(self.object.id)
+        # Caso, etapa inicial (com suas ações) e evento de criação: tudo ou nada
+        with transaction.atomic():
+            # Agora salva o objeto no banco para obter um ID
+            self.object.save()
+            # Os campos customizados são preenchidos depois, na tela de edição
+
+            # Inicia o fluxo se uma etapa foi definida
+            if primeira_etapa:
+                _mudar_etapa_fluxo(self.request, self.object, primeira_etapa)
+                messages.info(self.request, f"Caso iniciado no fluxo '{self.object.etapa_atual.fluxo_trabalho.nome}'.")
+
+            # E-mail de novo caso: enviado em segundo plano pela fila de eventos do workflow
+            registrar_evento('caso_criado', self.object, self.request.user)
+
+            # --- LÓGICA DO SHAREPOINT MOVIDA PARA SEGUNDO PLANO ---
+            # Dispara, depois do commit, a tarefa do Celery que cria as pastas dos casos pendentes
+            # Casos criados em sequência são provisionados juntos, em lote
+            transaction.on_commit(agendar_provisionamento_pastas)
         # Informa ao usuário que o processo começou
         messages.info(self.request, "A criação da pasta no SharePoint foi iniciada e será concluída em segundo plano.")
         # --- FIM DA MUDANÇA ---
-
-        # Lógica de envio de e-mail (continua como estava)
-        try:
-            contexto_notificacao = {'caso': self.object, 'usuario_acao': self.request.user}
-            sucesso_preparacao, dados_email = preparar_notificacao(slug_evento='novo-caso-criado', contexto=contexto_notificacao)
-
-            if sucesso_preparacao:
-                sucesso_envio, mensagem_envio = enviar_email_graph(
-                    usuario_remetente=self.request.user,
-                    destinatarios=dados_email['destinatarios'],
-                    assunto=dados_email['assunto'],
-                    corpo_html=dados_email['corpo']
-                )
-
-                if sucesso_envio:
-                    messages.info(self.request, "Notificação de novo caso enviada com sucesso pela sua conta Microsoft.")
-                    FluxoInternoModel.objects.create(
-                        caso=self.object,
-                        data_fluxo=timezone.now().date(),
-                        descricao=f"[SISTEMA] E-mail de 'Novo Caso Criado' enviado para: {', '.join(dados_email['destinatarios'])}.",
-                        usuario_criacao=self.request.user
-                    )
-                else:
-                    messages.error(self.request, f"Falha ao enviar notificação via Microsoft: {mensagem_envio}")
-            else:
-                messages.warning(self.request, f"Não foi possível preparar as notificações: {dados_email}")
-
-        except Exception as e:
-            messages.error(self.request, f"Ocorreu um erro inesperado ao tentar enviar as notificações: {e}")
+        messages.info(self.request, "A notificação de novo caso será enviada em segundo plano pela sua conta Microsoft.")
             
         return redirect(self.get_success_url())
 
@@ -305,6 +180,11 @@ class CasoUpdateView(LoginRequiredMixin, UpdateView):
     model = Caso
     form_class = CasoUpdateForm
     template_name = 'casos/caso_form_update.html'
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        # Campos customizados (já validados pelo formulário) em um upsert só
+        salvar_valores_do_caso(self.object, form.valores_dinamicos())
+        return response
     def get_success_url(self): return reverse_lazy('casos:caso_detail', kwargs={'pk': self.object.pk})
 
 class CasoDetailView(LoginRequiredMixin, DetailView):
@@ -329,9 +209,7 @@ class CasoDetailView(LoginRequiredMixin, DetailView):
         # -------------------------------------------
 
         # --- Mantém toda a sua lógica existente ---
-        context['arquivos_sharepoint'] = []
-        if caso.sharepoint_folder_id:
-            context['arquivos_sharepoint'] = microsoft_graph_service.listar_arquivos_e_pastas(caso.sharepoint_folder_id)
+        # Os arquivos do SharePoint são carregados à parte pela view painel_anexos_sharepoint.
         
         email_form = forms.EnviarEmailForm()
         templates = EmailTemplate.objects.all()
@@ -352,6 +230,7 @@ class CasoDetailView(LoginRequiredMixin, DetailView):
         context['acoes_pendentes'] = InstanciaAcao.objects.filter(caso=caso, status='P').order_by('data_criacao')
         context['acoes_concluidas'] = InstanciaAcao.objects.filter(caso=caso, status='C').order_by('-data_conclusao')
         context['historico_etapas'] = HistoricoEtapa.objects.filter(caso=caso).order_by('data_entrada')
+        context['valores_campos'] = valores_para_exibicao(caso)
         
         return context
 
@@ -364,14 +243,8 @@ def get_acoes_filtradas(request):
     # Filtro por Texto
     texto = request.GET.get('texto', '')
     if texto:
-        query_texto = (
-            Q(acao_modelo__titulo__icontains=texto) |
-            Q(caso__titulo_caso__icontains=texto) |
-            Q(caso__valores_dinamicos__valor__icontains=texto)
-        )
-        if texto.isdigit():
-            query_texto |= Q(caso__id=texto)
-        queryset = queryset.filter(query_texto).distinct()
+        # Título da ação, ou título/campos pesquisáveis/número do caso (casos/busca.py)
+        queryset = queryset.filter(Q(acao_modelo__titulo__icontains=texto) | filtro_busca_casos(texto, prefixo='caso__'))
 
     # Outros Filtros
     if responsavel_id := request.GET.get('responsavel', ''):
@@ -391,11 +264,13 @@ def get_acoes_filtradas(request):
         
     return queryset
 
-class AcaoListView(LoginRequiredMixin, ListView):
+class AcaoListView(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
     model = InstanciaAcao
     template_name = 'casos/acao_list.html'
     context_object_name = 'acoes'
     paginate_by = 20
+    ordenacao_cursor = ['prazo_final', 'id']
+    escopo_contagem = 'acoes'
 
     def get_queryset(self):
         return get_acoes_filtradas(self.request)
@@ -411,8 +286,8 @@ class AcaoListView(LoginRequiredMixin, ListView):
         
         # Para manter os filtros na paginação
         query_params = self.request.GET.copy()
-        if 'page' in query_params:
-            del query_params['page']
+        for param in ('page', 'cursor'):
+            query_params.pop(param, None)
         context['querystring'] = query_params.urlencode()
         
         return context
@@ -458,23 +333,25 @@ def add_andamento_caso(request, caso_pk):
 def get_casos_filtrados(request):
     queryset = Caso.objects.select_related('cliente', 'produto', 'status', 'etapa_atual').order_by('-id')
     titulo = request.GET.get('titulo', '')
-    if titulo:
-        query_texto = (Q(titulo_caso__icontains=titulo) | Q(valores_dinamicos__valor__icontains=titulo, valores_dinamicos__campo__nome_tecnico='aviso') | Q(valores_dinamicos__valor__icontains=titulo, valores_dinamicos__campo__nome_tecnico='segurado'))
-        query_final = query_texto | Q(id=titulo) if titulo.isdigit() else query_texto
-        queryset = queryset.filter(query_final).distinct()
+    # Título e campos pesquisáveis pelos índices de pesquisa (casos/busca.py), sem join nem distinct
+    if titulo: queryset = queryset.filter(filtro_busca_casos(titulo))
     if cliente_id := request.GET.get('cliente', ''): queryset = queryset.filter(cliente_id=cliente_id)
     if produto_id := request.GET.get('produto', ''): queryset = queryset.filter(produto_id=produto_id)
     if status_id := request.GET.get('status', ''): queryset = queryset.filter(status_id=status_id)
     return queryset
 
-class CasoPesquisaView(LoginRequiredMixin, ListView):
+class CasoPesquisaView(LoginRequiredMixin, PaginacaoCursorMixin, ListView):
     model = Caso
     template_name = 'casos/caso_pesquisa.html'
     context_object_name = 'casos'
     paginate_by = 25
+    escopo_contagem = 'casos'
     def get_queryset(self): return get_casos_filtrados(self.request)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        query_params = self.request.GET.copy()
+        for param in ('page', 'cursor'): query_params.pop(param, None)
+        context['querystring'] = query_params.urlencode()
         context['titulo'], context['clientes'], context['advogados'], context['status_list'] = "Pesquisa Avançada", Cliente.objects.all(), Advogado.objects.all(), Status.objects.all()
         return context
 
@@ -512,11 +389,15 @@ def exportar_casos_excel(request):
     workbook = openpyxl.Workbook()
     sheet = workbook.active
     sheet.title = 'Relatório de Casos'
-    headers = ['ID', 'Título', 'Cliente', 'Produto', 'Status', 'Etapa Atual']
+    casos_filtrados = list(casos_filtrados)
+    # Uma coluna por campo customizado presente nos casos exportados (lidos de valores_json)
+    campos = campos_dos_casos(casos_filtrados)
+    headers = ['ID', 'Título', 'Cliente', 'Produto', 'Status', 'Etapa Atual'] + [campo['nome_label'] for campo in campos]
     sheet.append(headers)
     for cell in sheet[1]: cell.font = Font(bold=True)
     for caso in casos_filtrados:
-        sheet.append([caso.id, caso.titulo_caso, str(caso.cliente), str(caso.produto), str(caso.status), caso.etapa_atual.nome if caso.etapa_atual else "-"])
+        valores = caso.valores_json or {}
+        sheet.append([caso.id, caso.titulo_caso, str(caso.cliente), str(caso.produto), str(caso.status), caso.etapa_atual.nome if caso.etapa_atual else "-"] + [valores.get(campo['nome_tecnico'], '') for campo in campos])
     workbook.save(response)
     return response
 
@@ -639,8 +520,10 @@ def criar_pasta_anexo_view(request, caso_pk):
     if request.method == 'POST':
         caso, nome_nova_pasta = get_object_or_404(Caso, pk=caso_pk), request.POST.get('nome_pasta')
         if nome_nova_pasta and caso.sharepoint_folder_id:
-            nome_pasta_sanitizado = "".join(c if c not in r'<>:"/\|?*' else '-' for c in nome_nova_pasta)
-            if criar_nova_pasta(caso.sharepoint_folder_id, nome_pasta_sanitizado): messages.success(request, f"Pasta '{nome_pasta_sanitizado}' criada.")
+            nome_pasta_sanitizado = sanitizar_nome_pasta(nome_nova_pasta)
+            if criar_nova_pasta(caso.sharepoint_folder_id, nome_pasta_sanitizado):
+                messages.success(request, f"Pasta '{nome_pasta_sanitizado}' criada.")
+                sincronizar_arquivos_sharepoint.delay()
             else: messages.error(request, "Falha ao criar a pasta.")
     return redirect(reverse('casos:caso_detail', kwargs={'pk': caso_pk}) + '#anexos-sharepoint-tab-pane')
 
@@ -650,21 +533,95 @@ def upload_arquivo_anexo_view(request, caso_pk):
         caso, arquivos_upload, id_pasta_pai = get_object_or_404(Caso, pk=caso_pk), request.FILES.getlist('arquivo'), request.POST.get('parent_folder_id', caso.sharepoint_folder_id)
         if not arquivos_upload: messages.warning(request, "Nenhum arquivo selecionado.")
         if arquivos_upload and id_pasta_pai:
-            sucessos, falhas = 0, 0
-            for arquivo in arquivos_upload:
-                if upload_arquivo(id_pasta_pai, arquivo.name, arquivo.read()): sucessos += 1
-                else:
-                    falhas += 1
-                    messages.error(request, f"Falha ao enviar: {arquivo.name}")
-            if sucessos > 0: messages.success(request, f"{sucessos} arquivo(s) enviado(s).")
-            if falhas == 0 and sucessos == 0: messages.error(request, "Falha no envio dos arquivos.")
+            # O envio ao SharePoint acontece no Celery; aqui só guardamos os arquivos e enfileiramos
+            # O conteúdo fica no banco (casos/area_uploads.py): a web e o worker não compartilham disco
+            upload_ids = []
+            with transaction.atomic():
+                for arquivo in arquivos_upload:
+                    upload = UploadAnexo.objects.create(
+                        caso=caso, usuario=request.user, nome_arquivo=arquivo.name, pasta_destino_id=id_pasta_pai, tamanho=arquivo.size
+                    )
+                    area_uploads.guardar(upload, arquivo)
+                    upload_ids.append(upload.id)
+                transaction.on_commit(lambda: processar_uploads_anexos.delay(upload_ids))
+            messages.info(request, f"{len(upload_ids)} arquivo(s) na fila de envio para o SharePoint.")
     return redirect(reverse('casos:caso_detail', kwargs={'pk': caso_pk}) + '#anexos-sharepoint-tab-pane')
 
+@login_required
+async def painel_anexos_sharepoint(request, caso_pk):
+    """Lista da pasta do caso no SharePoint, carregada pela aba de anexos sem travar a página."""
+    try:
+        caso = await Caso.objects.only('id', 'sharepoint_folder_id', 'sharepoint_folder_url').aget(pk=caso_pk)
+    except Caso.DoesNotExist:
+        raise Http404("Caso não encontrado.")
+
+    arquivos = []
+    if caso.sharepoint_folder_id:
+        # Primeiro o índice local; o Graph só é consultado se a pasta ainda não foi sincronizada
+        arquivos = await sync_to_async(indice_arquivos.listar_pasta)(caso.sharepoint_folder_id)
+        if arquivos is None:
+            arquivos = await microsoft_graph_service.listar_arquivos_e_pastas_async(caso.sharepoint_folder_id)
+
+    # Renderiza sem o request para não rodar context processors síncronos dentro do event loop.
+    html = render_to_string('casos/partials/anexos_sharepoint_lista.html', {
+        'caso': caso,
+        'arquivos_sharepoint': arquivos,
+        'csrf_token': get_token(request),
+    })
+    return HttpResponse(html)
+
+@login_required
+def status_uploads_caso_ajax(request, caso_pk):
+    """Situação dos envios de anexos recentes do caso (usado pelo polling da aba Anexos)."""
+    limite = timezone.now() - timedelta(hours=24)
+    uploads = UploadAnexo.objects.filter(caso_id=caso_pk).filter(Q(data_criacao__gte=limite) | Q(status__in=['pendente', 'enviando']))
+    itens = [
+        {'id': u.id, 'nome': u.nome_arquivo, 'status': u.status, 'status_display': u.get_status_display(), 'erro': u.erro}
+        for u in uploads[:50]
+    ]
+    em_andamento = sum(1 for item in itens if item['status'] in ('pendente', 'enviando'))
+    return JsonResponse({'uploads': itens, 'em_andamento': em_andamento})
+
 @login_required
 def listar_subpasta_ajax(request, folder_id):
-    if request.method == 'GET': return JsonResponse(listar_arquivos_e_pastas(folder_id), safe=False)
+    if request.method == 'GET':
+        itens = indice_arquivos.listar_pasta(folder_id)
+        return JsonResponse(itens if itens is not None else listar_arquivos_e_pastas(folder_id), safe=False)
     return JsonResponse([], safe=False)
 
+@login_required
+def listar_pastas_lote_ajax(request):
+    """Lista o conteúdo de várias pastas (?ids=a,b,c) em uma única chamada ao Graph."""
+    folder_ids = [f for f in request.GET.get('ids', '').split(',') if f]
+    if request.method != 'GET' or not folder_ids: return JsonResponse({})
+    resultado = indice_arquivos.listar_pastas(folder_ids)
+    faltantes = [f for f in folder_ids if f not in resultado]
+    if faltantes: resultado.update(listar_varias_pastas(faltantes))
+    return JsonResponse(resultado)
+
+@login_required
+def buscar_arquivos_ajax(request):
+    """Busca arquivos pelo nome (?q=) em todos os casos, ou só em um (?caso=<pk>)."""
+    termo = request.GET.get('q', '').strip()
+    if len(termo) < 2: return JsonResponse({'arquivos': []})
+    caso = get_object_or_404(Caso, pk=request.GET['caso']) if request.GET.get('caso') else None
+    arquivos = [
+        {
+            'id': a.item_id, 'nome': a.nome, 'tamanho': a.tamanho, 'web_url': a.web_url,
+            'caso_id': a.caso_id, 'caso': a.caso.titulo_caso if a.caso else None,
+            'download_url': reverse('casos:download_arquivo', args=[a.item_id]),
+        }
+        for a in indice_arquivos.buscar_arquivos(termo, caso=caso)
+    ]
+    return JsonResponse({'arquivos': arquivos})
+
+@login_required
+def download_arquivo_view(request, item_id):
+    download_url = obter_url_download(item_id)
+    if download_url: return redirect(download_url)
+    messages.error(request, "Não foi possível gerar o link de download.")
+    return redirect(request.META.get('HTTP_REFERER', '/'))
+
 @login_required
 def preview_arquivo_view(request, item_id):
     preview_url = obter_url_preview(item_id)
@@ -675,10 +632,26 @@ def preview_arquivo_view(request, item_id):
 @login_required
 def deletar_item_view(request, caso_pk, item_id):
     if request.method == 'POST':
-        if deletar_item(item_id): messages.success(request, "Item deletado.")
+        if deletar_item(item_id):
+            messages.success(request, "Item deletado.")
+            sincronizar_arquivos_sharepoint.delay()
         else: messages.error(request, "Falha ao deletar o item.")
     return redirect(reverse('casos:caso_detail', kwargs={'pk': caso_pk}) + '#anexos-sharepoint-tab-pane')
 
+@login_required
+def deletar_itens_view(request, caso_pk):
+    if request.method == 'POST':
+        item_ids = request.POST.getlist('item_ids')
+        if not item_ids: messages.warning(request, "Nenhum item selecionado.")
+        else:
+            resultados = deletar_itens(item_ids)
+            deletados = sum(1 for ok in resultados.values() if ok)
+            if deletados:
+                messages.success(request, f"{deletados} item(ns) deletado(s).")
+                sincronizar_arquivos_sharepoint.delay()
+            if deletados < len(resultados): messages.error(request, f"Falha ao deletar {len(resultados) - deletados} item(ns).")
+    return redirect(reverse('casos:caso_detail', kwargs={'pk': caso_pk}) + '#anexos-sharepoint-tab-pane')
+
 @login_required
 def enviar_email_view(request, caso_pk):
     caso = get_object_or_404(Caso, pk=caso_pk)
@@ -703,6 +676,12 @@ def microsoft_graph_webhook(request):
         try:
             notification_data = json.loads(request.body)
             for notification in notification_data.get('value', []):
+                if notification.get('clientState') == microsoft_graph_service.DRIVE_WEBHOOK_CLIENT_STATE:
+                    # Algo mudou no drive do SharePoint: as listagens em cache deixam de valer
+                    # e o índice local busca as mudanças pela consulta delta
+                    microsoft_graph_service.invalidar_todas_listagens()
+                    sincronizar_arquivos_sharepoint.delay()
+                    continue
                 processar_email_webhook.delay(notification['subscriptionId'], notification['resourceData']['id'])
             return HttpResponse(status=202)
         except Exception as e:
@@ -753,11 +732,14 @@ class KanbanView(LoginRequiredMixin, TemplateView):
 def update_caso_fase_ajax(request):
     # Esta view precisa ser reescrita para usar 'EtapaFluxo' em vez de 'FaseWorkflow'
     if request.method == 'POST':
+        caso_id = request.POST.get('caso_id')
+        nova_etapa_id = request.POST.get('nova_etapa_id')
+        if not str(caso_id or '').isdecimal() or not str(nova_etapa_id or '').isdecimal():
+            return JsonResponse({'status': 'error', 'message': 'caso_id e nova_etapa_id devem ser números.'}, status=400)
         try:
-            caso_id = request.POST.get('caso_id')
-            nova_etapa_id = request.POST.get('nova_etapa_id')
             caso = get_object_or_404(Caso, pk=caso_id)
-            nova_etapa = get_object_or_404(EtapaFluxo, pk=nova_etapa_id)
+            nova_etapa = grafo_workflow().etapa(int(nova_etapa_id))
+            if nova_etapa is None: raise Http404("Etapa não encontrada.")
             
             # Usando a nova função auxiliar para consistência
             _mudar_etapa_fluxo(request, caso, nova_etapa)
@@ -934,43 +916,64 @@ def add_produto_ajax(request):
 
 @login_required
 def executar_acao(request, acao_pk, opcao_pk=None):
-    instancia_acao = get_object_or_404(InstanciaAcao, pk=acao_pk)
+    instancia_acao = get_object_or_404(InstanciaAcao.objects.select_related('caso', 'acao_modelo'), pk=acao_pk)
     caso = instancia_acao.caso
+    # Opções, próxima etapa e ações a criar vêm do grafo do workflow em memória
+    grafo = grafo_workflow()
     opcao_decisao = None
     label_decisao = "Concluída"
 
     if opcao_pk:
-        opcao_decisao = get_object_or_404(OpcaoDecisao, pk=opcao_pk)
+        opcao_decisao = grafo.opcao(opcao_pk)
+        if opcao_decisao is None: raise Http404("Opção de decisão não encontrada.")
         label_decisao = opcao_decisao.label_do_botao
 
     if request.method == 'POST':
-        descricao_conclusao = request.POST.get('descricao_conclusao', '')
+        # Conclusão, transição, nova ação, lembrete e evento: tudo ou nada
+        with transaction.atomic():
+            # Trava o caso e relê a etapa: outra transição pode ter movido o caso
+            # depois que ele foi lido acima
+            caso.etapa_atual_id = (
+                Caso.objects.select_for_update().filter(pk=caso.pk)
+                .values_list('etapa_atual_id', flat=True).get()
+            )
+            descricao_conclusao = request.POST.get('descricao_conclusao', '')
         
-        instancia_acao.status = 'C'
-        instancia_acao.data_conclusao = timezone.now()
-        instancia_acao.descricao_conclusao = descricao_conclusao
-        instancia_acao.save()
+            instancia_acao.status = 'C'
+            instancia_acao.data_conclusao = timezone.now()
+            instancia_acao.descricao_conclusao = descricao_conclusao
+            instancia_acao.save()
         
-        FluxoInterno.objects.create(caso=caso, data_fluxo=timezone.now().date(), descricao=f"[AÇÃO] '{instancia_acao.acao_modelo.titulo}' concluída com decisão '{label_decisao}'.\n{descricao_conclusao}", usuario_criacao=request.user)
-
-        if opcao_decisao:
-            if opcao_decisao.avancar_proxima_etapa:
-                etapa_atual = caso.etapa_atual
-                if etapa_atual:
-                    proxima_etapa = EtapaFluxo.objects.filter(fluxo_trabalho=etapa_atual.fluxo_trabalho, ordem__gt=etapa_atual.ordem).order_by('ordem').first()
-                    _mudar_etapa_fluxo(request, caso, proxima_etapa)
-                    if not proxima_etapa: messages.success(request, "Fluxo de trabalho finalizado.")
-            elif opcao_decisao.mudar_etapa_para:
-                _mudar_etapa_fluxo(request, caso, opcao_decisao.mudar_etapa_para)
+            FluxoInternoModel.objects.create(caso=caso, data_fluxo=timezone.now().date(), descricao=f"[AÇÃO] '{instancia_acao.acao_modelo.titulo}' concluída com decisão '{label_decisao}'.\n{descricao_conclusao}", usuario_criacao=request.user)
+
+            if opcao_decisao:
+                if opcao_decisao.avancar_proxima_etapa:
+                    if caso.etapa_atual_id:
+                        proxima_etapa = grafo.proxima_etapa(caso.etapa_atual_id)
+                        _mudar_etapa_fluxo(request, caso, proxima_etapa)
+                        if not proxima_etapa: messages.success(request, "Fluxo de trabalho finalizado.")
+                elif opcao_decisao.mudar_etapa_para_id:
+                    _mudar_etapa_fluxo(request, caso, grafo.etapa(opcao_decisao.mudar_etapa_para_id))
             
-            if opcao_decisao.criar_nova_acao:
-                InstanciaAcao.objects.create(caso=caso, acao_modelo=opcao_decisao.criar_nova_acao, responsavel=request.user)
+                nova_acao = grafo.acao(opcao_decisao.criar_nova_acao_id) if opcao_decisao.criar_nova_acao_id else None
+                if nova_acao:
+                    InstanciaAcao.objects.create(
+                        caso=caso, acao_modelo=nova_acao, responsavel=request.user,
+                        **campos_do_prazo(nova_acao, timezone.now(), caso),
+                    )
             
-            if opcao_decisao.atualizar_status_caso:
-                caso.status = opcao_decisao.atualizar_status_caso
-                caso.save(update_fields=['status'])
+                if opcao_decisao.atualizar_status_caso_id:
+                    caso.status_id = opcao_decisao.atualizar_status_caso_id
+                    caso.save(update_fields=['status'])
             
-            # ... (Lógica de e-mail e aguardar dias)
+                if opcao_decisao.aguardar_dias:
+                    # O lembrete só é aberto no vencimento, pela tarefa abrir_lembretes_vencidos
+                    agendada = agendar_lembrete(caso, opcao_decisao, instancia_acao, request.user)
+                    messages.info(request, f"Lembrete agendado para {timezone.localtime(agendada.executar_em):%d/%m/%Y}.")
+
+                # O e-mail sai depois, pela fila de eventos do workflow
+                if opcao_decisao.enviar_email:
+                    registrar_evento('decisao_tomada', caso, request.user, opcao_id=opcao_decisao.pk, acao_id=instancia_acao.pk)
 
         return redirect(reverse('casos:caso_detail', kwargs={'pk': caso.pk}) + '#acoes-tab-pane')
 
@@ -0,0 +1,101 @@
+# casos/workflow.py
+
+"""
+Motor do workflow: a mudança de etapa de um caso.
+
+Toda transição (criação do caso, arrastar no Kanban, decisão de uma ação) passa
+por mudar_etapa(), que roda numa transação só, com o caso travado
+(select_for_update) para duas transições simultâneas não se misturarem. As
+ações da nova etapa são criadas com um único bulk_create, a partir do grafo
+compilado do workflow (casos/grafo_workflow.py), sem consultar a configuração.
+A mudança de etapa não notifica ninguém; as notificações da criação do caso e
+das decisões são registradas por quem as dispara (casos/eventos_workflow.py).
+"""
+
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .calendario import campos_do_prazo
+from .grafo_workflow import grafo_workflow
+from .models import Caso, FluxoInterno, HistoricoEtapa, InstanciaAcao
+
+Transicao = namedtuple('Transicao', ['etapa_antiga', 'nova_etapa', 'acoes_criadas'])
+
+
+def definir_responsavel(acao_modelo, caso, usuario):
+    """Responsável pela nova ação conforme o tipo configurado na AcaoEtapa."""
+    responsavel = None
+    if acao_modelo.tipo_responsavel == 'CRIADOR_ACAO':
+        responsavel = usuario
+    elif acao_modelo.tipo_responsavel == 'RESPONSAVEL_CASO':
+        responsavel = caso.advogado_responsavel.user if caso.advogado_responsavel else None
+    elif acao_modelo.tipo_responsavel == 'USUARIO_FIXO':
+        responsavel = acao_modelo.responsavel_fixo
+    if not responsavel:
+        # Fallback seguro se nenhuma regra se aplicar
+        responsavel = caso.advogado_responsavel.user if caso.advogado_responsavel else usuario
+    return responsavel
+
+def mudar_etapa(caso, nova_etapa, usuario=None):
+    """
+    Move o caso para `nova_etapa` (None encerra o workflow): fecha o histórico da
+    etapa atual, abre o da nova, registra no fluxo interno e cria as ações da
+    nova etapa. Atualiza também a instância `caso` recebida. Retorna uma Transicao.
+    """
+    with transaction.atomic():
+        # Só a linha do caso é travada (of=self): o advogado pode não existir (outer join)
+        travado = (
+            Caso.objects.select_for_update(of=('self',))
+            .select_related('etapa_atual', 'advogado_responsavel__user')
+            .get(pk=caso.pk)
+        )
+        etapa_antiga = travado.etapa_atual
+        agora = timezone.now()
+        registros = []
+
+        historico_aberto = (
+            HistoricoEtapa.objects.filter(caso=travado, data_saida__isnull=True)
+            .select_related('etapa').order_by('-data_entrada').first()
+        )
+        if historico_aberto and etapa_antiga == nova_etapa:
+            # O caso já está nesta etapa (ex: soltou no Kanban na mesma coluna)
+            return Transicao(etapa_antiga, nova_etapa, 0)
+        if historico_aberto:
+            HistoricoEtapa.objects.filter(caso=travado, data_saida__isnull=True).update(data_saida=agora)
+            tempo_gasto = (agora - historico_aberto.data_entrada).days
+            registros.append(FluxoInterno(
+                caso=travado, data_fluxo=agora.date(), usuario_criacao=usuario,
+                descricao=f"[WORKFLOW] Etapa '{historico_aberto.etapa.nome}' finalizada. Tempo: {tempo_gasto} dias.",
+            ))
+
+        travado.etapa_atual = nova_etapa
+        travado.data_entrada_fase = agora if nova_etapa else None
+        # O save dispara os sinais do caso (busca, totais das listagens)
+        travado.save(update_fields=['etapa_atual', 'data_entrada_fase'])
+
+        acoes = []
+        if nova_etapa:
+            HistoricoEtapa.objects.create(caso=travado, etapa=nova_etapa)
+            registros.append(FluxoInterno(
+                caso=travado, data_fluxo=agora.date(), usuario_criacao=usuario,
+                descricao=f"[WORKFLOW] Caso entrou na etapa: '{nova_etapa.nome}'.",
+            ))
+            acoes = [
+                InstanciaAcao(
+                    caso=travado,
+                    acao_modelo=acao_modelo,
+                    responsavel=definir_responsavel(acao_modelo, travado, usuario),
+                    **campos_do_prazo(acao_modelo, agora, travado),
+                )
+                for acao_modelo in grafo_workflow().acoes_da_etapa(nova_etapa.pk)
+            ]
+            InstanciaAcao.objects.bulk_create(acoes)
+            print(f"Caso #{travado.id} movido para a etapa: {nova_etapa.nome}")
+        else:
+            print(f"Workflow do Caso #{travado.id} foi concluído.")
+        FluxoInterno.objects.bulk_create(registros)
+
+    caso.etapa_atual, caso.data_entrada_fase = travado.etapa_atual, travado.data_entrada_fase
+    return Transicao(etapa_antiga, nova_etapa, len(acoes))
@@ -26,6 +26,14 @@ def preparar_notificacao(slug_evento, contexto):
         # Se houver múltiplos, pega o primeiro como fallback seguro
         template_email = TemplateEmail.objects.filter(evento__slug=slug_evento, ativo=True).first()
 
+    return preparar_email_template(template_email, contexto)
+
+
+def preparar_email_template(template_email, contexto):
+    """
+    Renderiza um TemplateEmail já escolhido (ex: o modelo de uma opção de decisão)
+    e monta os destinatários. Retorna (sucesso, dados_ou_erro) como preparar_notificacao.
+    """
     try:
         # 2. Renderiza o assunto e o corpo do e-mail usando o contexto fornecido
         template_assunto = Template(template_email.assunto)